@@ -0,0 +1,87 @@
+import math
+import numpy as np
+
+# Hằng số tốc độ ánh sáng
+c = 2.99792458e8
+
+
+def klobuchar_delay(ion_alpha, ion_beta, lat, lon, azimuth, elevation, t_gps_sow):
+    """
+    Mô hình tầng điện ly Klobuchar (ICD-GPS-200, 20.3.3.5.2.5), vector hóa theo vệ tinh.
+
+    Args:
+        ion_alpha, ion_beta: 4 hệ số alpha / beta từ header file NAV.
+        lat, lon (float): Vĩ độ, kinh độ máy thu (radian).
+        azimuth, elevation (ndarray): Góc phương vị, góc ngẩng của các vệ tinh (radian).
+        t_gps_sow (float): Thời điểm thu theo GPS (giây trong tuần).
+
+    Returns:
+        ndarray: Độ trễ tầng điện ly trên tần số L1 (mét) cho từng vệ tinh.
+    """
+    # Đổi sang đơn vị bán vòng (semi-circle) theo quy ước của ICD
+    # (vệ tinh dưới đường chân trời được kẹp về góc ngẩng 0 để tránh chia cho 0)
+    el_sc = np.maximum(elevation, 0.0) / math.pi
+    lat_sc = lat / math.pi
+    lon_sc = lon / math.pi
+
+    # Góc tâm Trái Đất giữa máy thu và điểm xuyên tầng điện ly (IPP)
+    psi = 0.0137 / (el_sc + 0.11) - 0.022
+
+    # Vĩ độ, kinh độ của IPP
+    phi_i = np.clip(lat_sc + psi * np.cos(azimuth), -0.416, 0.416)
+    lam_i = lon_sc + psi * np.sin(azimuth) / np.cos(phi_i * math.pi)
+
+    # Vĩ độ địa từ của IPP
+    phi_m = phi_i + 0.064 * np.cos((lam_i - 1.617) * math.pi)
+
+    # Giờ địa phương tại IPP
+    t = np.mod(43200.0 * lam_i + t_gps_sow, 86400.0)
+
+    # Hệ số xiên (obliquity factor)
+    slant = 1.0 + 16.0 * (0.53 - el_sc) ** 3
+
+    # Biên độ và chu kỳ của hàm cosin
+    amp = ion_alpha[0] + phi_m * (ion_alpha[1] + phi_m * (ion_alpha[2] + phi_m * ion_alpha[3]))
+    per = ion_beta[0] + phi_m * (ion_beta[1] + phi_m * (ion_beta[2] + phi_m * ion_beta[3]))
+    amp = np.maximum(amp, 0.0)
+    per = np.maximum(per, 72000.0)
+
+    x = 2.0 * math.pi * (t - 50400.0) / per
+    delay = np.where(np.abs(x) < 1.57,
+                     5e-9 + amp * (1.0 - x * x / 2.0 + x ** 4 / 24.0),
+                     5e-9)
+    return c * slant * delay
+
+
+def saastamoinen_delay(lat, height, elevation, humidity=0.7):
+    """
+    Mô hình tầng đối lưu Saastamoinen với khí quyển chuẩn, vector hóa theo vệ tinh.
+
+    Args:
+        lat (float): Vĩ độ máy thu (radian).
+        height (float): Độ cao máy thu so với elipxoid (mét).
+        elevation (ndarray): Góc ngẩng của các vệ tinh (radian).
+        humidity (float): Độ ẩm tương đối (0..1).
+
+    Returns:
+        ndarray: Độ trễ tầng đối lưu (mét) cho từng vệ tinh.
+                 Bằng 0 nếu độ cao nằm ngoài [-100 m, 10 km] hoặc vệ tinh dưới đường chân trời.
+    """
+    elevation = np.asarray(elevation, dtype=np.float64)
+    if height < -100.0 or height > 1e4:
+        return np.zeros_like(elevation)
+
+    hgt = max(height, 0.0)
+
+    # Khí quyển chuẩn: áp suất (hPa), nhiệt độ (K), áp suất hơi nước (hPa)
+    pressure = 1013.25 * (1.0 - 2.2557e-5 * hgt) ** 5.2568
+    temperature = 15.0 - 6.5e-3 * hgt + 273.16
+    e = 6.108 * humidity * math.exp((17.15 * temperature - 4684.0) / (temperature - 38.45))
+
+    # Góc thiên đỉnh (zenith angle); chỉ tính cho vệ tinh trên đường chân trời
+    visible = elevation > 0.0
+    cos_z = np.where(visible, np.sin(elevation), 1.0)
+
+    hydrostatic = 0.0022768 * pressure / (1.0 - 0.00266 * math.cos(2.0 * lat) - 0.00028 * hgt / 1e3) / cos_z
+    wet = 0.002277 * (1255.0 / temperature + 0.05) * e / cos_z
+    return np.where(visible, hydrostatic + wet, 0.0)
@@ -44,6 +44,32 @@ def calculate_satellite_position(eph, t_sv):
                        Đã bao gồm: Đa thức đồng hồ + Hiệu chỉnh tương đối.
                        (Lưu ý: TGD được xử lý ở bên ngoài hoặc tùy chọn).
     """
+    return _kepler_state(eph, t_sv, with_velocity=False)
+
+
+def calculate_satellite_state(eph, t_sv):
+    """
+    Tính vị trí, vận tốc vệ tinh (ECEF) cùng sai số và tốc độ trôi đồng hồ vệ tinh
+    trong CÙNG MỘT lần giải phương trình Kepler (vận tốc lấy bằng đạo hàm giải tích).
+
+    Args:
+        eph (dict): Dữ liệu tinh lịch (ephemeris) của vệ tinh.
+        t_sv (float): Thời điểm PHÁT tín hiệu theo giờ GPS (SOW).
+
+    Returns:
+        tuple: (X, Y, Z, dt_sat, VX, VY, VZ, ddt_sat)
+            - X, Y, Z, dt_sat: Như calculate_satellite_position.
+            - VX, VY, VZ: Vận tốc vệ tinh trong hệ ECEF (m/s).
+            - ddt_sat: Tốc độ trôi đồng hồ vệ tinh (s/s), gồm a1, a2 và đạo hàm hiệu chỉnh tương đối.
+    """
+    return _kepler_state(eph, t_sv, with_velocity=True)
+
+
+def _kepler_state(eph, t_sv, with_velocity):
+    """
+    Phần tính toán chung cho calculate_satellite_position và calculate_satellite_state.
+    Chỉ tính thêm các đạo hàm (vận tốc, tốc độ trôi đồng hồ) khi with_velocity=True.
+    """
     try:
         # ===========================================================
         # BƯỚC 0: TRÍCH XUẤT CÁC THAM SỐ TỪ TINH LỊCH (EPHEMERIS)
@@ -164,11 +190,40 @@ def calculate_satellite_position(eph, t_sv):
         # Lưu ý: Không trừ TGD ở đây, đã xử lý tường minh ở prepare_inputs
         dt_sat = dts_poly + dts_rel
 
-        return (X, Y, Z, dt_sat)
+        if not with_velocity:
+            return (X, Y, Z, dt_sat)
+
+        # ===========================================================
+        # BƯỚC 4 (TÙY CHỌN): VẬN TỐC VỆ TINH VÀ TỐC ĐỘ TRÔI ĐỒNG HỒ
+        # ===========================================================
+        # Đạo hàm theo thời gian của các đại lượng ở BƯỚC 2 (dùng lại E_k, sin2, cos2,...)
+        one_minus_ecos = 1 - e*math.cos(E_k)
+        E_dot = n / one_minus_ecos                                # Đạo hàm dị thường tâm sai
+        nu_dot = E_dot * math.sqrt(1-e*e) / one_minus_ecos        # Đạo hàm dị thường thực
+
+        u_dot = nu_dot * (1 + 2*(cus*cos2 - cuc*sin2))
+        r_dot = A*e*math.sin(E_k)*E_dot + 2*nu_dot*(crs*cos2 - crc*sin2)
+        i_dot_k = i_dot + 2*nu_dot*(cis*cos2 - cic*sin2)
+        Omega_dot_k = omega_dot - OMEGA_E_DOT
+
+        # Vận tốc trong mặt phẳng quỹ đạo
+        x_orb_dot = r_dot*math.cos(u) - r*u_dot*math.sin(u)
+        y_orb_dot = r_dot*math.sin(u) + r*u_dot*math.cos(u)
+
+        VX = (x_orb_dot*math.cos(Omega_k) - y_orb_dot*math.cos(i)*math.sin(Omega_k)
+              + y_orb*math.sin(i)*math.sin(Omega_k)*i_dot_k - Y*Omega_dot_k)
+        VY = (x_orb_dot*math.sin(Omega_k) + y_orb_dot*math.cos(i)*math.cos(Omega_k)
+              - y_orb*math.sin(i)*math.cos(Omega_k)*i_dot_k + X*Omega_dot_k)
+        VZ = y_orb_dot*math.sin(i) + y_orb*math.cos(i)*i_dot_k
+
+        # Tốc độ trôi đồng hồ = đạo hàm của (đa thức + hiệu chỉnh tương đối)
+        ddt_sat = a1 + 2*a2*dt_clk + F*e*sqrt_a*math.cos(E_k)*E_dot
+
+        return (X, Y, Z, dt_sat, VX, VY, VZ, ddt_sat)
 
     except Exception as e:
         print(f"Lỗi tính vị trí vệ tinh: {e}", file=sys.stderr)
-        return (None, None, None, None)
+        return (None,) * (8 if with_velocity else 4)
     
 
 
@@ -0,0 +1,53 @@
+import datetime
+import math
+import os
+from read_rinex_nav import read_rinex_nav
+from cal_sat_pos import calculate_satellite_position
+from coord_transform import ecef_to_lla
+from prepare_inputs import datetime_to_gps_sow, find_best_ephemeris
+
+NAV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nav.nav')
+RECEIVER = [-1626584.7059, 5730519.4572, 2271864.3916]
+START = datetime.datetime(2025, 10, 7, 1, 0, 0)
+C = 2.99792458e8
+WAVELENGTH_L1 = C / 1575.42e6
+
+
+def _elevation(sat, rec):
+    lat, lon, _ = ecef_to_lla(*rec)
+    lat, lon = math.radians(lat), math.radians(lon)
+    d = [sat[i] - rec[i] for i in range(3)]
+    up = math.cos(lat) * math.cos(lon) * d[0] + math.cos(lat) * math.sin(lon) * d[1] + math.sin(lat) * d[2]
+    return math.degrees(math.asin(up / math.sqrt(sum(x * x for x in d))))
+
+
+def write_synthetic_obs(path, n_epochs, step=30.0, receiver=RECEIVER):
+    """Sinh file OBS giả lập (C1C, L1C) cho máy thu đứng yên từ ephemeris trong nav.nav; trả về nội dung file."""
+    nav = read_rinex_nav(NAV_FILE)
+    lines = [
+        "     3.02           OBSERVATION DATA    M                   RINEX VERSION / TYPE",
+        "%14.4f%14.4f%14.4f                  APPROX POSITION XYZ" % tuple(receiver),
+        "G    2 C1C L1C                                              SYS / # / OBS TYPES",
+        "                                                            END OF HEADER",
+    ]
+    for k in range(n_epochs):
+        t = START + datetime.timedelta(seconds=k * step)
+        _, t_r = datetime_to_gps_sow(t)
+        clock = 1000.0 + 0.5 * k
+        sats = []
+        for prn in sorted(p for p in nav if p[0] == 'G'):
+            eph = find_best_ephemeris(nav[prn], t_r)
+            if not eph:
+                continue
+            x, y, z, dt_sat = calculate_satellite_position(eph, t_r - 0.075)
+            if x is None or _elevation((x, y, z), receiver) < 10.0:
+                continue
+            rho = math.dist((x, y, z), receiver) + clock - C * dt_sat + ((k * 7 + int(prn[1:]) * 13) % 10) * 0.1
+            sats.append("%s%14.3f  %14.3f  " % (prn, rho, rho / WAVELENGTH_L1 + 100 * int(prn[1:])))
+        lines.append("> %04d %02d %02d %02d %02d %11.7f  0 %2d"
+                     % (t.year, t.month, t.day, t.hour, t.minute, t.second, len(sats)))
+        lines.extend(sats)
+    with open(path, 'w') as f:
+        f.write("\n".join(lines) + "\n")
+    with open(path, 'rb') as f:
+        return f.read()
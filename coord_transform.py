@@ -47,6 +47,32 @@ def ecef_to_lla(x, y, z):
     
     return lat_deg, lon_deg, height
 
+def lla_to_ecef(lat_deg, lon_deg, height):
+    """
+    Chuyển đổi Latitude, Longitude, Height (WGS84) sang tọa độ ECEF (X, Y, Z).
+
+    Args:
+        lat_deg, lon_deg (float): Vĩ độ, kinh độ (độ).
+        height (float): Độ cao so với bề mặt elipxoid (mét).
+
+    Returns:
+        tuple: (x, y, z) đơn vị mét.
+    """
+    # --- Hằng số WGS-84 ---
+    a = 6378137.0              # Bán trục lớn (Semi-major axis)
+    f = 1 / 298.257223563      # Độ dẹt (Flattening)
+    e2 = 2*f - f**2            # Bình phương tâm sai thứ nhất
+
+    lat = math.radians(lat_deg)
+    lon = math.radians(lon_deg)
+    # Bán kính cong tại vĩ độ (Radius of curvature in the prime vertical)
+    N = a / math.sqrt(1 - e2 * math.sin(lat)**2)
+
+    x = (N + height) * math.cos(lat) * math.cos(lon)
+    y = (N + height) * math.cos(lat) * math.sin(lon)
+    z = (N * (1 - e2) + height) * math.sin(lat)
+    return x, y, z
+
 # --- Ví dụ sử dụng ---
 if __name__ == "__main__":
     # Tọa độ XYZ ví dụ (từ kết quả chạy trước của bạn hoặc file header OBS)
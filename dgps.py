@@ -0,0 +1,163 @@
+import sys
+import numpy as np
+from lazy_nav import LazyNavigation
+from read_rinex_obs import iter_rinex_obs, read_rinex_obs_header
+from epoch_batch import EpochBatchBuilder
+from prepare_inputs import _prepare_epoch
+from network import SharedSatelliteStates
+from solve_navigation_equations import solve_position
+
+
+def align_epochs(base_epochs, rover_epochs, tolerance=0.05):
+    """
+    Ghép (merge-join) hai luồng epoch OBS đã sắp xếp theo thời gian.
+
+    Mỗi bước chỉ tiến luồng có epoch sớm hơn, nên tổng chi phí là O(n_base + n_rover)
+    và chỉ giữ một epoch của mỗi luồng trong bộ nhớ. Epoch không có cặp trong phạm vi
+    tolerance bị bỏ qua. tolerance nên nhỏ hơn một nửa chu kỳ ghi dữ liệu.
+
+    Args:
+        base_epochs, rover_epochs (iterable): Các epoch OBS, ví dụ iter_rinex_obs(...).
+        tolerance (float): Chênh lệch thời gian tối đa (giây) để coi hai epoch là cùng thời điểm.
+
+    Yields:
+        tuple: (base_epoch, rover_epoch).
+    """
+    base_it, rover_it = iter(base_epochs), iter(rover_epochs)
+    base, rover = next(base_it, None), next(rover_it, None)
+
+    while base is not None and rover is not None:
+        dt = (rover["time"] - base["time"]).total_seconds()
+        if abs(dt) <= tolerance:
+            yield base, rover
+            base, rover = next(base_it, None), next(rover_it, None)
+        elif dt > 0:
+            base = next(base_it, None)   # Trạm base đi sau: bỏ epoch base
+        else:
+            rover = next(rover_it, None) # Rover đi sau: bỏ epoch rover
+
+
+def compute_corrections(base_epoch, nav, base_position, sat_states=None):
+    """
+    Tính hiệu chỉnh pseudorange (PRC) của từng vệ tinh từ một epoch của trạm base:
+
+        PRC = r_base - (rho_base + c*dt_sat)
+
+    với r_base là khoảng cách hình học từ vị trí base đã biết tới vệ tinh (đã hiệu chỉnh Sagnac)
+    và rho_base là pseudorange đã trừ TGD. PRC chứa sai số chung (quỹ đạo, tầng điện ly,
+    tầng đối lưu) và đồng hồ máy thu base; phần đồng hồ base giống nhau cho mọi vệ tinh nên
+    được hấp thụ vào ẩn số đồng hồ của rover.
+
+    Mỗi PRC chỉ cần khoảng cách của chính vệ tinh đó nên không cần đủ 4 vệ tinh ở base;
+    số vệ tinh tối thiểu được kiểm tra khi giải rover.
+
+    Returns:
+        dict: {prn: PRC (mét)}; rỗng nếu epoch base không có vệ tinh hợp lệ.
+    """
+    builder = EpochBatchBuilder()
+    _prepare_epoch(builder, base_epoch, nav, sat_states=sat_states, min_satellites=1)
+    if len(builder) == 0:
+        return {}
+
+    view = builder.build()[0]
+    ranges = np.linalg.norm(view.sat_pos_ecef - np.asarray(base_position, dtype=float), axis=1)
+    prc = ranges - (view.pseudorange + view.sat_clock_corr_meters)
+    return dict(zip(view.prn, prc.tolist()))
+
+
+def apply_corrections(epoch, corrections):
+    """
+    Trả về bản sao epoch OBS của rover chỉ gồm các vệ tinh có PRC, với C1C đã cộng PRC.
+    Các quan sát khác (L1C, D1C, ...) được giữ nguyên.
+    """
+    observations = {}
+    for prn, o in epoch["observations"].items():
+        prc = corrections.get(prn)
+        if prc is None or "C1C" not in o:
+            continue
+        corrected = dict(o)
+        corrected["C1C"] = dict(o["C1C"], value=o["C1C"]["value"] + prc)
+        observations[prn] = corrected
+    return {"time": epoch["time"], "observations": observations}
+
+
+def iter_dgps_solutions(nav_file, base_obs_file, rover_obs_file, initial_pos=None, base_position=None,
+                        tolerance=0.05, **solver_options):
+    """
+    Giải vị trí rover bằng DGPS (hiệu chỉnh pseudorange từ trạm base), đọc cả hai file OBS
+    theo luồng và ghép epoch bằng align_epochs.
+
+    Args:
+        nav_file (str): File NAV dùng chung.
+        base_obs_file, rover_obs_file (str): File OBS của trạm base và rover.
+        initial_pos (list hoặc None): Dự đoán ban đầu cho rover; mặc định là vị trí base.
+        base_position (list hoặc None): Tọa độ ECEF đã biết của base;
+                                        mặc định lấy APPROX POSITION XYZ trong header file base.
+        tolerance (float): Chênh lệch thời gian tối đa (giây) giữa hai epoch được ghép.
+        **solver_options: Chuyển cho solve_position (elevation_mask_deg, weighting, ...).
+                          Không cần mô hình tầng điện ly / đối lưu vì sai số này đã được khử.
+
+    Yields:
+        tuple: (thời gian epoch rover, nghiệm [x, y, z, c_dt]).
+    """
+    if base_position is None:
+        header = read_rinex_obs_header(base_obs_file)
+        base_position = header and header['approx_position']
+        if base_position is None:
+            print(f"Lỗi: Không có tọa độ trạm base (APPROX POSITION XYZ) trong {base_obs_file}", file=sys.stderr)
+            return
+    guess = list(initial_pos) if initial_pos is not None else list(base_position)
+
+    nav = LazyNavigation(nav_file)
+    # Base và rover có cùng (hoặc gần cùng) thời điểm: dùng chung trạng thái vệ tinh
+    sat_states = SharedSatelliteStates(nav)
+
+    for base_epoch, rover_epoch in align_epochs(iter_rinex_obs(base_obs_file),
+                                                iter_rinex_obs(rover_obs_file), tolerance):
+        corrections = compute_corrections(base_epoch, nav, base_position, sat_states)
+        if not corrections:
+            continue
+
+        builder = EpochBatchBuilder()
+        _prepare_epoch(builder, apply_corrections(rover_epoch, corrections), nav, sat_states=sat_states)
+        if len(builder) == 0:
+            continue
+
+        result = solve_position(builder.build()[0], guess, verbose=False, **solver_options)
+        if result is None:
+            continue
+        guess = result.solution[:3]
+        yield rover_epoch["time"], result.solution
+
+
+def solve_dgps(nav_file, base_obs_file, rover_obs_file, initial_pos=None, base_position=None,
+               tolerance=0.05, **solver_options):
+    """
+    Phiên bản gom kết quả của iter_dgps_solutions.
+
+    Returns:
+        dict: {"times": list datetime, "positions": ndarray (n x 4) [x, y, z, c_dt]}.
+    """
+    times, positions = [], []
+    for time_utc, solution in iter_dgps_solutions(nav_file, base_obs_file, rover_obs_file, initial_pos,
+                                                  base_position, tolerance, **solver_options):
+        times.append(time_utc)
+        positions.append(solution)
+    return {"times": times, "positions": np.array(positions).reshape(-1, 4)}
+
+
+# --- VÍ DỤ SỬ DỤNG ---
+if __name__ == "__main__":
+    from coord_transform import ecef_to_lla
+
+    NAV_FILE = '2908-nav-base.nav' # File .nav
+    BASE_OBS_FILE = '2908-base.obs' # File .obs của trạm base
+    ROVER_OBS_FILE = 'test.obs' # File .obs của rover
+
+    result = solve_dgps(NAV_FILE, BASE_OBS_FILE, ROVER_OBS_FILE, elevation_mask_deg=10.0)
+    print(f"Đã giải DGPS {len(result['times'])} epoch")
+    if len(result['times']):
+        x, y, z = result['positions'][:, :3].mean(axis=0)
+        lat, lon, h = ecef_to_lla(x, y, z)
+        print(f"Vị trí trung bình (ECEF): X={x:.3f}, Y={y:.3f}, Z={z:.3f}")
+        print(f"Vị trí trung bình (LLA): {lat:.8f}°, {lon:.8f}°, {h:.3f} m")
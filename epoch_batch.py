@@ -0,0 +1,225 @@
+import numpy as np
+
+
+class EpochView:
+    """
+    Khung nhìn (view) của một epoch bên trong EpochBatch.
+    Các thuộc tính mảng là lát cắt (slice) của mảng gốc trong batch nên không sao chép dữ liệu.
+    Dùng __slots__ để mỗi view chỉ tốn vài con trỏ, không có __dict__.
+    """
+    __slots__ = ("index", "time_utc", "time_sow", "prn", "pseudorange",
+                 "sat_pos_ecef", "sat_clock_corr_meters",
+                 "sat_vel_ecef", "sat_clock_drift_mps", "range_rate")
+
+    def __init__(self, batch, index):
+        start = batch.offsets[index]
+        end = batch.offsets[index + 1]
+        self.index = index
+        self.time_utc = batch.times_utc[index]
+        self.time_sow = float(batch.times_sow[index])
+        self.prn = batch.prn[start:end]
+        self.pseudorange = batch.pseudorange[start:end]
+        self.sat_pos_ecef = batch.sat_pos_ecef[start:end]
+        self.sat_clock_corr_meters = batch.sat_clock_corr_meters[start:end]
+        self.sat_vel_ecef = batch.sat_vel_ecef[start:end]
+        self.sat_clock_drift_mps = batch.sat_clock_drift_mps[start:end]
+        self.range_rate = batch.range_rate[start:end]
+
+    def __len__(self):
+        # Số vệ tinh trong epoch
+        return len(self.pseudorange)
+
+    def __repr__(self):
+        return f"EpochView(index={self.index}, time_utc={self.time_utc}, num_sats={len(self)})"
+
+
+class EpochBatch:
+    """
+    Tập hợp nhiều epoch dưới dạng các mảng NumPy liền kề (contiguous).
+
+    Dữ liệu của tất cả vệ tinh được xếp nối tiếp nhau; vệ tinh của epoch k nằm trong
+    khoảng [offsets[k], offsets[k+1]).
+
+    Thuộc tính:
+        times_utc (list): Thời gian thu của từng epoch (datetime).
+        times_sow (ndarray, n_epochs): Thời gian thu theo GPS SOW.
+        offsets (ndarray, n_epochs + 1): Chỉ số bắt đầu của từng epoch trong các mảng vệ tinh.
+        prn (ndarray, n_sats): Mã vệ tinh ('G05', ...).
+        pseudorange (ndarray, n_sats): Pseudorange đã trừ TGD (mét).
+        sat_pos_ecef (ndarray, n_sats x 3): Vị trí vệ tinh tại t_s (hệ ECEF tại t_r).
+        sat_clock_corr_meters (ndarray, n_sats): Sai số đồng hồ vệ tinh c*dt_s (mét).
+        sat_vel_ecef (ndarray, n_sats x 3): Vận tốc vệ tinh (hệ ECEF tại t_r, m/s).
+        sat_clock_drift_mps (ndarray, n_sats): Tốc độ trôi đồng hồ vệ tinh c*ddt_s (m/s).
+        range_rate (ndarray, n_sats): Tốc độ thay đổi khoảng cách đo từ Doppler (m/s),
+                                      NaN nếu vệ tinh không có quan sát Doppler.
+    """
+
+    def __init__(self, times_utc, times_sow, offsets, prn, pseudorange,
+                 sat_pos_ecef, sat_clock_corr_meters,
+                 sat_vel_ecef=None, sat_clock_drift_mps=None, range_rate=None):
+        self.times_utc = list(times_utc)
+        self.times_sow = np.asarray(times_sow, dtype=np.float64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.prn = np.asarray(prn, dtype='U3')
+        self.pseudorange = np.asarray(pseudorange, dtype=np.float64)
+        self.sat_pos_ecef = np.asarray(sat_pos_ecef, dtype=np.float64).reshape(-1, 3)
+        self.sat_clock_corr_meters = np.asarray(sat_clock_corr_meters, dtype=np.float64)
+
+        # Các cột tùy chọn cho bài toán vận tốc; thiếu thì điền NaN
+        n_sats = len(self.pseudorange)
+        if sat_vel_ecef is None:
+            sat_vel_ecef = np.full((n_sats, 3), np.nan)
+        if sat_clock_drift_mps is None:
+            sat_clock_drift_mps = np.full(n_sats, np.nan)
+        if range_rate is None:
+            range_rate = np.full(n_sats, np.nan)
+        self.sat_vel_ecef = np.asarray(sat_vel_ecef, dtype=np.float64).reshape(-1, 3)
+        self.sat_clock_drift_mps = np.asarray(sat_clock_drift_mps, dtype=np.float64)
+        self.range_rate = np.asarray(range_rate, dtype=np.float64)
+
+    @classmethod
+    def empty(cls):
+        """Tạo một batch rỗng (0 epoch)."""
+        return cls([], [], [0], [], [], np.zeros((0, 3)), [])
+
+    @classmethod
+    def concatenate(cls, batches):
+        """
+        Ghép nhiều batch thành một (giữ nguyên thứ tự).
+        Chỉ số offsets của các batch sau được dịch theo số vệ tinh của các batch trước.
+        """
+        batches = [b for b in batches if len(b) > 0]
+        if not batches:
+            return cls.empty()
+        if len(batches) == 1:
+            return batches[0]
+
+        offsets = [np.zeros(1, dtype=np.int64)]
+        shift = 0
+        for b in batches:
+            offsets.append(b.offsets[1:] + shift)
+            shift += b.num_satellites
+
+        return cls(
+            [t for b in batches for t in b.times_utc],
+            np.concatenate([b.times_sow for b in batches]),
+            np.concatenate(offsets),
+            np.concatenate([b.prn for b in batches]),
+            np.concatenate([b.pseudorange for b in batches]),
+            np.concatenate([b.sat_pos_ecef for b in batches]),
+            np.concatenate([b.sat_clock_corr_meters for b in batches]),
+            np.concatenate([b.sat_vel_ecef for b in batches]),
+            np.concatenate([b.sat_clock_drift_mps for b in batches]),
+            np.concatenate([b.range_rate for b in batches]),
+        )
+
+    @property
+    def num_satellites(self):
+        """Tổng số quan sát vệ tinh trong toàn bộ batch."""
+        return int(self.offsets[-1])
+
+    @property
+    def satellite_counts(self):
+        """Số vệ tinh của từng epoch (ndarray)."""
+        return np.diff(self.offsets)
+
+    def epoch(self, index):
+        """Trả về EpochView của epoch thứ `index`."""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("epoch index out of range")
+        return EpochView(self, index)
+
+    def __getitem__(self, index):
+        return self.epoch(index)
+
+    def __len__(self):
+        return len(self.times_sow)
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield EpochView(self, k)
+
+    def __repr__(self):
+        return f"EpochBatch(num_epochs={len(self)}, num_satellites={self.num_satellites})"
+
+
+class EpochBatchBuilder:
+    """
+    Bộ tích lũy dữ liệu để tạo EpochBatch.
+    Dữ liệu được thêm vào các list phẳng (không tạo dict/tuple cho từng vệ tinh),
+    sau đó chuyển sang NumPy một lần duy nhất trong build().
+    """
+
+    def __init__(self):
+        self._times_utc = []
+        self._times_sow = []
+        self._offsets = [0]
+        self._prn = []
+        self._pseudorange = []
+        self._sat_pos = []
+        self._sat_clk = []
+        self._sat_vel = []
+        self._sat_clk_drift = []
+        self._range_rate = []
+        self._epoch_start = None
+
+    def begin_epoch(self, time_utc, time_sow):
+        """Bắt đầu một epoch mới."""
+        self._epoch_start = len(self._pseudorange)
+        self._times_utc.append(time_utc)
+        self._times_sow.append(time_sow)
+
+    def add_satellite(self, prn, pseudorange, x, y, z, sat_clock_corr_meters,
+                      vx=np.nan, vy=np.nan, vz=np.nan, sat_clock_drift_mps=np.nan,
+                      range_rate=np.nan):
+        """Thêm một vệ tinh vào epoch hiện tại (các tham số vận tốc/Doppler là tùy chọn)."""
+        self._prn.append(prn)
+        self._pseudorange.append(pseudorange)
+        self._sat_pos.extend((x, y, z))
+        self._sat_clk.append(sat_clock_corr_meters)
+        self._sat_vel.extend((vx, vy, vz))
+        self._sat_clk_drift.append(sat_clock_drift_mps)
+        self._range_rate.append(range_rate)
+
+    def end_epoch(self, min_satellites=4):
+        """
+        Kết thúc epoch hiện tại.
+        Nếu số vệ tinh < min_satellites thì hủy bỏ epoch (rollback) và trả về False.
+        """
+        start = self._epoch_start
+        self._epoch_start = None
+        count = len(self._pseudorange) - start
+        if count < min_satellites:
+            del self._times_utc[-1]
+            del self._times_sow[-1]
+            del self._prn[start:]
+            del self._pseudorange[start:]
+            del self._sat_pos[3 * start:]
+            del self._sat_clk[start:]
+            del self._sat_vel[3 * start:]
+            del self._sat_clk_drift[start:]
+            del self._range_rate[start:]
+            return False
+        self._offsets.append(len(self._pseudorange))
+        return True
+
+    def __len__(self):
+        # Số epoch đã hoàn tất
+        return len(self._offsets) - 1
+
+    def build(self):
+        """Chuyển dữ liệu đã tích lũy thành EpochBatch."""
+        return EpochBatch(
+            self._times_utc,
+            self._times_sow,
+            self._offsets,
+            self._prn,
+            self._pseudorange,
+            np.array(self._sat_pos, dtype=np.float64).reshape(-1, 3),
+            self._sat_clk,
+            np.array(self._sat_vel, dtype=np.float64).reshape(-1, 3),
+            self._sat_clk_drift,
+            self._range_rate,
+        )
@@ -0,0 +1,77 @@
+import math
+import numpy as np
+from coord_transform import ecef_to_lla
+from kernels import line_of_sight
+
+# Vị trí máy thu có độ cao (so với elipxoid) thấp hơn giá trị này được coi là chưa hội tụ
+# (ví dụ: vòng lặp đầu tiên xuất phát từ tâm Trái Đất), khi đó góc ngẩng không có ý nghĩa.
+MIN_VALID_HEIGHT = -1.0e5
+
+
+class EpochGeometry:
+    """
+    Bộ đệm hình học (geometry cache) của một epoch tại một vị trí máy thu.
+
+    Được tính MỘT LẦN cho mỗi vòng lặp của bộ giải rồi dùng chung cho:
+    ma trận H, mặt nạ góc ngẩng (elevation mask), trọng số, mô hình tầng điện ly
+    và tầng đối lưu. Nhờ vậy việc thêm hiệu chỉnh không làm tăng số phép lượng giác.
+
+    Thuộc tính:
+        receiver_pos (ndarray, 3): Vị trí máy thu ECEF (mét).
+        lat, lon (float): Vĩ độ, kinh độ máy thu (radian).
+        height (float): Độ cao máy thu so với elipxoid (mét).
+        ranges (ndarray, n): Khoảng cách hình học máy thu - vệ tinh (mét).
+        los (ndarray, n x 3): Véc-tơ đơn vị hướng nhìn (line-of-sight) từ máy thu đến vệ tinh.
+        azimuth, elevation (ndarray, n): Góc phương vị và góc ngẩng (radian).
+        valid (bool): False nếu vị trí máy thu chưa gần bề mặt Trái Đất
+                      (azimuth/elevation khi đó không được tính, đặt bằng NaN).
+    """
+    __slots__ = ("receiver_pos", "lat", "lon", "height", "ranges", "los",
+                 "azimuth", "elevation", "valid")
+
+    def __init__(self, receiver_pos, sat_pos_ecef):
+        self.receiver_pos = np.asarray(receiver_pos, dtype=np.float64)[:3]
+
+        # Khoảng cách hình học và véc-tơ hướng nhìn (kernel theo backend đã chọn, xem kernels.py)
+        self.ranges, self.los = line_of_sight(self.receiver_pos, sat_pos_ecef)
+
+        # Tọa độ địa lý của máy thu (một lần cho cả epoch)
+        lat_deg, lon_deg, height = ecef_to_lla(*self.receiver_pos)
+        self.lat = math.radians(lat_deg)
+        self.lon = math.radians(lon_deg)
+        self.height = height
+        self.valid = height > MIN_VALID_HEIGHT
+
+        if not self.valid:
+            self.azimuth = np.full(len(self.ranges), np.nan)
+            self.elevation = np.full(len(self.ranges), np.nan)
+            return
+
+        # Chiếu véc-tơ hướng nhìn sang hệ tọa độ cục bộ ENU (East-North-Up)
+        sin_lat, cos_lat = math.sin(self.lat), math.cos(self.lat)
+        sin_lon, cos_lon = math.sin(self.lon), math.cos(self.lon)
+        ex, ey, ez = self.los[:, 0], self.los[:, 1], self.los[:, 2]
+        east = -sin_lon * ex + cos_lon * ey
+        north = -sin_lat * cos_lon * ex - sin_lat * sin_lon * ey + cos_lat * ez
+        up = cos_lat * cos_lon * ex + cos_lat * sin_lon * ey + sin_lat * ez
+
+        self.azimuth = np.arctan2(east, north) % (2.0 * math.pi)
+        self.elevation = np.arcsin(np.clip(up, -1.0, 1.0))
+
+    def elevation_mask(self, mask_deg):
+        """
+        Trả về mảng bool các vệ tinh có góc ngẩng >= mask_deg.
+        Nếu hình học chưa hợp lệ thì giữ lại tất cả vệ tinh.
+        """
+        if not self.valid:
+            return np.ones(len(self.ranges), dtype=bool)
+        return self.elevation >= math.radians(mask_deg)
+
+    def elevation_weights(self):
+        """
+        Trọng số theo góc ngẩng w = sin^2(E) (tương ứng sigma ~ 1/sin(E)).
+        Nếu hình học chưa hợp lệ thì dùng trọng số bằng nhau.
+        """
+        if not self.valid:
+            return np.ones(len(self.ranges))
+        return np.sin(self.elevation) ** 2
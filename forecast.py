@@ -0,0 +1,298 @@
+import argparse
+import datetime
+import math
+import sys
+import numpy as np
+from lazy_nav import LazyNavigation
+from shared_ephemeris import pack_ephemeris, COL, _prn_from_index
+from prepare_inputs import datetime_to_gps_sow
+from coord_transform import lla_to_ecef
+from kernels import eccentric_anomaly
+
+MU_GPS = 3.986005e14            # Hằng số hấp dẫn của Trái Đất (m^3/s^2)
+OMEGA_E_DOT = 7.2921151467e-5   # Tốc độ quay của Trái Đất (rad/s)
+
+# Bản tin quá 4 giờ so với Toe không được dùng (cùng tiêu chí với find_best_ephemeris)
+MAX_EPHEMERIS_AGE = 14400.0
+# Số vòng lặp Newton-Raphson tối đa của phương trình Kepler khi dự báo
+FORECAST_KEPLER_ITERATIONS = 10
+
+DOP_NAMES = ("GDOP", "PDOP", "HDOP", "VDOP", "TDOP")
+
+
+def kepler_positions(p, t_k):
+    """
+    Vị trí vệ tinh ECEF từ tham số Kepler, vector hóa trên mọi phần tử (vệ tinh x thời điểm).
+
+    Args:
+        p (dict): Tên tham số (như read_rinex_nav) -> ndarray cùng kích thước với t_k.
+        t_k (ndarray): Thời gian kể từ Toe (giây, đã xử lý week crossover).
+
+    Returns:
+        ndarray (... x 3): X, Y, Z (mét).
+    """
+    A = p['sqrt_a'] ** 2
+    n = np.sqrt(MU_GPS / A**3) + p['Delta_n']
+    M = p['M0'] + n * t_k
+    e = p['e']
+
+    # Phương trình Kepler: Newton-Raphson hội tụ riêng từng phần tử (kernel theo backend)
+    E = eccentric_anomaly(M, e, max_iterations=FORECAST_KEPLER_ITERATIONS)
+
+    nu = np.arctan2(np.sqrt(1.0 - e*e) * np.sin(E), np.cos(E) - e)
+    phi = nu + p['omega']
+    sin2, cos2 = np.sin(2.0 * phi), np.cos(2.0 * phi)
+
+    u = phi + p['Cus'] * sin2 + p['Cuc'] * cos2
+    r = A * (1.0 - e * np.cos(E)) + p['Crs'] * sin2 + p['Crc'] * cos2
+    i = p['i0'] + p['Cis'] * sin2 + p['Cic'] * cos2 + p['i_dot'] * t_k
+
+    x_orb, y_orb = r * np.cos(u), r * np.sin(u)
+    Omega = p['Omega0'] + (p['Omega_dot'] - OMEGA_E_DOT) * t_k - OMEGA_E_DOT * p['Toe']
+    cos_O, sin_O, cos_i = np.cos(Omega), np.sin(Omega), np.cos(i)
+
+    return np.stack((x_orb * cos_O - y_orb * cos_i * sin_O,
+                     x_orb * sin_O + y_orb * cos_i * cos_O,
+                     y_orb * np.sin(i)), axis=-1)
+
+
+def _enu_rotation(lat_deg, lon_deg):
+    """Ma trận xoay ECEF -> ENU (3 x 3) tại vị trí (lat, lon)."""
+    lat, lon = math.radians(lat_deg), math.radians(lon_deg)
+    sin_lat, cos_lat = math.sin(lat), math.cos(lat)
+    sin_lon, cos_lon = math.sin(lon), math.cos(lon)
+    return np.array([[-sin_lon, cos_lon, 0.0],
+                     [-sin_lat * cos_lon, -sin_lat * sin_lon, cos_lat],
+                     [cos_lat * cos_lon, cos_lat * sin_lon, sin_lat]])
+
+
+class _EphemerisSelector:
+    """
+    Các bản tin Kepler của từng vệ tinh (bảng từ pack_ephemeris), sắp theo Toe tuyệt đối
+    (giây GPS), để chọn bản tin gần nhất cho cả khối thời điểm bằng searchsorted.
+    """
+
+    def __init__(self, table, systems):
+        # Bỏ các bản tin báo vệ tinh không khỏe (SV_health != 0)
+        health = table[:, COL['SV_health']]
+        table = table[np.isnan(health) | (health == 0)]
+
+        # Toe tuyệt đối = tuần của Toc + Toe (xử lý week crossover giữa Toc và Toe)
+        toc = table[:, COL['toc_gps_seconds']]
+        shift = table[:, COL['Toe']] - toc % 604800.0
+        shift = np.where(shift > 302400, shift - 604800, np.where(shift < -302400, shift + 604800, shift))
+        toe_abs = toc + shift
+
+        self.prns, self.rows, self.toe_abs = [], [], []
+        sats = table[:, COL['sat']].astype(np.int64)
+        for k in np.unique(sats):
+            prn = _prn_from_index(k)
+            if prn[0] not in systems:
+                continue
+            idx = np.flatnonzero(sats == k)
+            idx = idx[np.argsort(toe_abs[idx], kind='stable')]
+            self.prns.append(prn)
+            self.rows.append(idx)
+            self.toe_abs.append(toe_abs[idx])
+        self.table = table
+
+    def select(self, t):
+        """
+        Chọn bản tin cho mọi (vệ tinh, thời điểm).
+
+        Returns:
+            tuple: (chỉ số hàng trong bảng: n_sat x m, t_k: n_sat x m, hợp lệ: n_sat x m).
+        """
+        rows = np.zeros((len(self.prns), len(t)), dtype=np.int64)
+        t_k = np.zeros((len(self.prns), len(t)))
+        for s, (idx, toe) in enumerate(zip(self.rows, self.toe_abs)):
+            j = np.clip(np.searchsorted(toe, t), 1, len(toe)) - 1
+            # So sánh với bản tin kế tiếp (gần hơn thì chọn); bằng nhau thì giữ bản tin đầu
+            nxt = np.minimum(j + 1, len(toe) - 1)
+            j = np.where(np.abs(toe[nxt] - t) < np.abs(toe[j] - t), nxt, j)
+            rows[s] = idx[j]
+            t_k[s] = t - toe[j]
+        return rows, t_k, np.abs(t_k) <= MAX_EPHEMERIS_AGE
+
+
+def forecast(nav_file, site_lla, start, end, step=10.0, elevation_mask_deg=10.0, systems="G",
+             chunk_size=1024):
+    """
+    Dự báo khả năng quan sát vệ tinh và DOP cho một vị trí trên lưới thời gian đều.
+
+    Vị trí vệ tinh, góc ngẩng và DOP được tính vector hóa trên (vệ tinh x thời điểm) theo từng
+    khối chunk_size thời điểm, nên bộ nhớ tạm không phụ thuộc độ dài khoảng thời gian.
+    Ma trận chuẩn G^T G của từng thời điểm được tính bằng einsum và nghịch đảo theo lô,
+    trực tiếp trong hệ ENU của vị trí.
+
+    Args:
+        nav_file (str): File NAV (chỉ dùng các bản tin Kepler khỏe: GPS, Galileo, QZSS, ...).
+        site_lla (tuple): (vĩ độ, kinh độ (độ), độ cao (mét)) của vị trí.
+        start, end (datetime): Khoảng thời gian (giờ GPS, như thời gian trong file OBS).
+        step (float): Bước thời gian (giây).
+        elevation_mask_deg (float): Góc ngẩng tối thiểu (độ).
+        systems (str): Các hệ thống vệ tinh, ví dụ "G" hoặc "GE".
+        chunk_size (int): Số thời điểm xử lý trong mỗi khối.
+
+    Returns:
+        dict: {
+            "times": list datetime của lưới thời gian,
+            "num_visible": ndarray int (số vệ tinh trên góc ngẩng tối thiểu),
+            "dop": {"GDOP", "PDOP", "HDOP", "VDOP", "TDOP": ndarray (NaN nếu < 4 vệ tinh)},
+            "windows": list {"prn", "rise", "set", "max_elevation_deg"} theo thời điểm mọc,
+        }
+        hoặc None nếu không có bản tin phù hợp.
+    """
+    try:
+        nav = LazyNavigation(nav_file)
+    except FileNotFoundError:
+        print(f"Lỗi: Không tìm thấy file tại '{nav_file}'", file=sys.stderr)
+        return None
+    table = pack_ephemeris({prn: nav[prn] for prn in nav.keys() if prn[0] in systems})
+    selector = _EphemerisSelector(table, systems)
+    if not selector.prns:
+        print(f"Lỗi: Không có bản tin Kepler cho hệ thống '{systems}' trong {nav_file}", file=sys.stderr)
+        return None
+
+    site = np.array(lla_to_ecef(*site_lla))
+    rotation = _enu_rotation(site_lla[0], site_lla[1])
+    mask = math.radians(elevation_mask_deg)
+    param_names = ['sqrt_a', 'Delta_n', 'M0', 'e', 'omega', 'Cus', 'Cuc', 'Crs', 'Crc',
+                   'Cis', 'Cic', 'i0', 'i_dot', 'Omega0', 'Omega_dot', 'Toe']
+
+    week, sow = datetime_to_gps_sow(start)
+    t0 = week * 604800.0 + sow
+    num_times = int(math.floor((end - start).total_seconds() / step)) + 1
+    n_sat = len(selector.prns)
+
+    num_visible = np.zeros(num_times, dtype=np.int64)
+    dop = {name: np.full(num_times, np.nan) for name in DOP_NAMES}
+
+    # Trạng thái cửa sổ quan sát đang mở của từng vệ tinh (nối liền giữa các khối)
+    open_start = np.full(n_sat, -1, dtype=np.int64)
+    open_max = np.full(n_sat, -np.inf)
+    windows = []
+
+    def close_window(s, end_index):
+        windows.append({
+            "prn": selector.prns[s],
+            "rise": start + datetime.timedelta(seconds=float(open_start[s]) * step),
+            "set": start + datetime.timedelta(seconds=float(end_index) * step),
+            "max_elevation_deg": math.degrees(open_max[s]),
+        })
+        open_start[s] = -1
+        open_max[s] = -np.inf
+
+    for first in range(0, num_times, chunk_size):
+        index = np.arange(first, min(first + chunk_size, num_times))
+        t = t0 + index * step
+
+        # --- Vị trí vệ tinh cho cả khối (n_sat x m) ---
+        rows, t_k, valid = selector.select(t)
+        params = {name: selector.table[rows, COL[name]] for name in param_names}
+        sat_pos = kepler_positions(params, t_k)
+
+        # --- Hướng nhìn trong hệ ENU và góc ngẩng ---
+        los = sat_pos - site
+        los /= np.linalg.norm(los, axis=-1, keepdims=True)
+        enu = los @ rotation.T
+        elevation = np.arcsin(np.clip(enu[..., 2], -1.0, 1.0))
+        visible = valid & (elevation >= mask)
+        num_visible[index] = visible.sum(axis=0)
+
+        # --- DOP: Q = (G^T G)^-1 với hàng G = [-e, -n, -u, 1] của các vệ tinh nhìn thấy ---
+        G = np.concatenate((-enu, np.ones(enu.shape[:2] + (1,))), axis=-1)
+        normal = np.einsum('sm,smi,smj->mij', visible.astype(np.float64), G, G)
+        ok = num_visible[index] >= 4
+        ok[ok] = np.abs(np.linalg.det(normal[ok])) > 1e-9
+        if ok.any():
+            Q = np.linalg.inv(normal[ok])
+            q = np.diagonal(Q, axis1=1, axis2=2)
+            ok_index = index[ok]
+            dop["GDOP"][ok_index] = np.sqrt(q.sum(axis=1))
+            dop["PDOP"][ok_index] = np.sqrt(q[:, :3].sum(axis=1))
+            dop["HDOP"][ok_index] = np.sqrt(q[:, :2].sum(axis=1))
+            dop["VDOP"][ok_index] = np.sqrt(q[:, 2])
+            dop["TDOP"][ok_index] = np.sqrt(q[:, 3])
+
+        # --- Cửa sổ quan sát: chỉ duyệt các điểm chuyển trạng thái ---
+        for s in range(n_sat):
+            vis = visible[s]
+            if open_start[s] >= 0 and not vis[0]:
+                # Cửa sổ mở từ khối trước kết thúc đúng tại ranh giới khối
+                close_window(s, index[0] - 1)
+            if not vis.any():
+                continue
+            change = np.flatnonzero(np.diff(vis.astype(np.int8))) + 1
+            bounds = np.concatenate(([0], change, [len(vis)]))
+            for a, b in zip(bounds[:-1], bounds[1:]):
+                if not vis[a]:
+                    continue
+                if open_start[s] < 0:
+                    open_start[s] = index[a]
+                open_max[s] = max(open_max[s], elevation[s, a:b].max())
+                if b < len(vis):
+                    close_window(s, index[b - 1])
+
+    # Đóng các cửa sổ còn mở ở cuối khoảng thời gian
+    for s in np.flatnonzero(open_start >= 0):
+        close_window(s, num_times - 1)
+    windows.sort(key=lambda w: (w["rise"], w["prn"]))
+
+    return {
+        "times": [start + datetime.timedelta(seconds=float(k) * step) for k in range(num_times)],
+        "num_visible": num_visible,
+        "dop": dop,
+        "windows": windows,
+    }
+
+
+def main(argv=None):
+    """Giao diện dòng lệnh của forecast (xem --help)."""
+    parser = argparse.ArgumentParser(description="Dự báo khả năng quan sát vệ tinh và DOP cho một vị trí.")
+    parser.add_argument("nav_file", help="File RINEX Navigation")
+    parser.add_argument("--site", nargs=3, type=float, required=True, metavar=("LAT", "LON", "HEIGHT"),
+                        help="Vĩ độ, kinh độ (độ) và độ cao (mét) của vị trí")
+    parser.add_argument("--start", required=True, help="Thời điểm bắt đầu (giờ GPS), ví dụ 2025-08-28T00:00:00")
+    parser.add_argument("--hours", type=float, default=24.0, help="Độ dài khoảng dự báo (giờ)")
+    parser.add_argument("--step", type=float, default=10.0, help="Bước thời gian (giây)")
+    parser.add_argument("--mask", type=float, default=10.0, help="Góc ngẩng tối thiểu (độ)")
+    parser.add_argument("--systems", default="G", help="Các hệ thống vệ tinh, ví dụ G hoặc GE")
+    parser.add_argument("--csv", help="Ghi chuỗi DOP theo thời gian ra file CSV")
+    args = parser.parse_args(argv)
+
+    try:
+        start = datetime.datetime.fromisoformat(args.start)
+    except ValueError:
+        print(f"Lỗi: Thời điểm không hợp lệ '{args.start}'", file=sys.stderr)
+        return 1
+    end = start + datetime.timedelta(hours=args.hours)
+
+    result = forecast(args.nav_file, args.site, start, end, args.step, args.mask, args.systems)
+    if result is None:
+        return 1
+
+    print(f"--- CỬA SỔ QUAN SÁT (góc ngẩng >= {args.mask} độ) ---")
+    for w in result["windows"]:
+        print(f"  {w['prn']}  {w['rise']:%Y-%m-%d %H:%M:%S} -> {w['set']:%H:%M:%S}"
+              f"  max {w['max_elevation_deg']:5.1f}°")
+
+    pdop = result["dop"]["PDOP"]
+    if np.isfinite(pdop).any():
+        k = int(np.nanargmax(pdop))
+        print(f"\nPDOP: trung bình {np.nanmean(pdop):.2f}, lớn nhất {pdop[k]:.2f} lúc {result['times'][k]}")
+    print(f"Số vệ tinh nhìn thấy: {result['num_visible'].min()} - {result['num_visible'].max()}")
+
+    if args.csv:
+        with open(args.csv, "w") as f:
+            f.write("time,num_visible," + ",".join(DOP_NAMES) + "\n")
+            for k, t in enumerate(result["times"]):
+                values = ",".join(f"{result['dop'][name][k]:.3f}" for name in DOP_NAMES)
+                f.write(f"{t.isoformat()},{result['num_visible'][k]},{values}\n")
+    return 0
+
+
+# --- VÍ DỤ SỬ DỤNG ---
+# python forecast.py 2908-nav-base.nav --site 21.0 105.85 20 --start 2025-08-28T00:00:00 --hours 24 --step 10
+if __name__ == "__main__":
+    sys.exit(main())
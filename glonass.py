@@ -0,0 +1,180 @@
+import collections
+import math
+import numpy as np
+
+# --- CÁC HẰNG SỐ HỆ PZ-90 (Theo ICD GLONASS) ---
+MU_GLO = 3.9860044e14           # Hằng số hấp dẫn của Trái Đất (m^3/s^2)
+J2_GLO = 1.0826257e-3           # Hệ số điều hòa đới bậc 2
+RE_GLO = 6378136.0              # Bán kính xích đạo (m)
+OMEGA_E_GLO = 7.292115e-5       # Tốc độ quay của Trái Đất (rad/s)
+
+# Tần số sóng mang G1 (FDMA): f = 1602 MHz + k * 0.5625 MHz, k là số kênh tần số (-7..+6)
+FREQ_G1 = 1602.0e6
+FREQ_G1_STEP = 0.5625e6
+
+# Bản tin GLONASS được cập nhật mỗi 30 phút: không dùng quá 30 phút quanh tb
+MAX_EPHEMERIS_AGE = 1800.0
+
+
+def glonass_frequency(freq_num):
+    """Tần số sóng mang G1 (Hz) của vệ tinh có số kênh tần số freq_num."""
+    return FREQ_G1 + freq_num * FREQ_G1_STEP
+
+
+def _derivatives(x, y, z, vx, vy, vz, ax, ay, az):
+    """
+    Phương trình chuyển động của vệ tinh GLONASS trong hệ PZ-90 (quay cùng Trái Đất):
+    trọng trường trung tâm + J2, lực ly tâm, Coriolis và gia tốc Mặt Trăng/Mặt Trời (ax, ay, az)
+    coi là hằng số trong khoảng thời gian tích phân.
+    """
+    r2 = x*x + y*y + z*z
+    r3 = r2 * math.sqrt(r2)
+    omg2 = OMEGA_E_GLO * OMEGA_E_GLO
+    a = 1.5 * J2_GLO * MU_GLO * RE_GLO**2 / (r2 * r3)
+    b = 5.0 * z*z / r2
+    c = -MU_GLO / r3 - a * (1.0 - b)
+    return (vx, vy, vz,
+            (c + omg2) * x + 2.0 * OMEGA_E_GLO * vy + ax,
+            (c + omg2) * y - 2.0 * OMEGA_E_GLO * vx + ay,
+            (c - 2.0 * a) * z + az)
+
+
+def _rk4_step(state, acc, h):
+    """Một bước Runge-Kutta bậc 4 cho véc-tơ trạng thái (x, y, z, vx, vy, vz)."""
+    k1 = _derivatives(*state, *acc)
+    k2 = _derivatives(*[s + 0.5*h*k for s, k in zip(state, k1)], *acc)
+    k3 = _derivatives(*[s + 0.5*h*k for s, k in zip(state, k2)], *acc)
+    k4 = _derivatives(*[s + h*k for s, k in zip(state, k3)], *acc)
+    return tuple(s + h / 6.0 * (d1 + 2.0*d2 + 2.0*d3 + d4)
+                 for s, d1, d2, d3, d4 in zip(state, k1, k2, k3, k4))
+
+
+class GlonassArc:
+    """
+    Quỹ đạo của một bản tin GLONASS đã tích phân sẵn: vị trí và vận tốc tại các mốc
+    cách đều `step` giây trong khoảng [tb - span, tb + span].
+    Giữa hai mốc dùng nội suy Hermite bậc 3 (vị trí + vận tốc ở hai đầu đoạn).
+    """
+    __slots__ = ("span", "step", "pos", "vel")
+
+    def __init__(self, eph, step, span):
+        self.step = step
+        n = int(math.ceil(span / step))
+        self.span = n * step
+
+        acc = (eph['Xacc'], eph['Yacc'], eph['Zacc'])
+        initial = (eph['X'], eph['Y'], eph['Z'], eph['Xdot'], eph['Ydot'], eph['Zdot'])
+
+        # Tích phân từ tb về hai phía
+        forward, backward = [initial], [initial]
+        for _ in range(n):
+            forward.append(_rk4_step(forward[-1], acc, step))
+            backward.append(_rk4_step(backward[-1], acc, -step))
+        nodes = np.array(backward[:0:-1] + forward)   # (2n + 1) x 6, từ tb - span tới tb + span
+        self.pos = nodes[:, :3]
+        self.vel = nodes[:, 3:]
+
+    def interpolate(self, dt):
+        """Vị trí, vận tốc tại dt giây kể từ tb; None nếu nằm ngoài cung quỹ đạo."""
+        if abs(dt) > self.span:
+            return None
+        x = (dt + self.span) / self.step
+        k = min(int(x), len(self.pos) - 2)
+        s = x - k
+        h = self.step
+
+        # Các hàm cơ sở Hermite và đạo hàm của chúng theo s
+        s2, s3 = s*s, s*s*s
+        h00, h10, h01, h11 = 2*s3 - 3*s2 + 1, s3 - 2*s2 + s, -2*s3 + 3*s2, s3 - s2
+        d00, d10, d01, d11 = 6*s2 - 6*s, 3*s2 - 4*s + 1, -6*s2 + 6*s, 3*s2 - 2*s
+
+        p0, p1 = self.pos[k], self.pos[k + 1]
+        v0, v1 = self.vel[k], self.vel[k + 1]
+        pos = h00*p0 + h10*h*v0 + h01*p1 + h11*h*v1
+        vel = (d00*p0 + d10*h*v0 + d01*p1 + d11*h*v1) / h
+        return pos, vel
+
+
+class GlonassPropagator:
+    """
+    Tính trạng thái vệ tinh GLONASS từ bản tin quảng bá.
+
+    Mỗi bản tin chỉ được tích phân RK4 MỘT lần trên toàn bộ khoảng hiệu lực (±span quanh tb)
+    với bước cố định; cung quỹ đạo (GlonassArc) được giữ trong bộ đệm LRU và các truy vấn sau
+    chỉ còn là nội suy Hermite, thay vì tích phân lại từ tb cho mỗi epoch.
+    """
+
+    def __init__(self, step=30.0, span=MAX_EPHEMERIS_AGE, cache_size=128):
+        """
+        Args:
+            step (float): Bước tích phân RK4 (giây), cũng là khoảng cách giữa các mốc nội suy.
+            span (float): Nửa độ dài cung quỹ đạo quanh tb (giây).
+            cache_size (int): Số cung quỹ đạo tối đa giữ trong bộ đệm.
+        """
+        self.step = step
+        self.span = span
+        self.cache_size = cache_size
+        self._arcs = collections.OrderedDict()
+        self.integrations = 0   # Số cung quỹ đạo đã tích phân (cache miss)
+
+    def _arc(self, eph):
+        # Khóa theo nội dung bản tin (bản tin có thể được phân tích lại thành dict mới)
+        key = (eph['Toe'], eph['X'], eph['Y'], eph['Z'])
+        arc = self._arcs.get(key)
+        if arc is not None:
+            self._arcs.move_to_end(key)
+            return arc
+
+        arc = GlonassArc(eph, self.step, self.span)
+        self.integrations += 1
+        self._arcs[key] = arc
+        if len(self._arcs) > self.cache_size:
+            self._arcs.popitem(last=False)
+        return arc
+
+    def state(self, eph, t_sv):
+        """
+        Trạng thái vệ tinh tại thời điểm phát t_sv (giây trong tuần GPS).
+
+        Returns:
+            tuple: (X, Y, Z, dt_sat, VX, VY, VZ, ddt_sat) như calculate_satellite_state;
+                   dt_sat = -TauN + GammaN * (t - tb) (đã gồm hiệu chỉnh tương đối tính).
+                   Tất cả là None nếu t_sv nằm ngoài khoảng hiệu lực của bản tin.
+        """
+        dt = t_sv - eph['Toe']
+        # Xử lý week crossover
+        if dt > 302400:
+            dt -= 604800
+        elif dt < -302400:
+            dt += 604800
+
+        result = self._arc(eph).interpolate(dt)
+        if result is None:
+            return (None,) * 8
+        pos, vel = result
+
+        dt_sat = -eph['TauN'] + eph['GammaN'] * dt
+        return (float(pos[0]), float(pos[1]), float(pos[2]), dt_sat,
+                float(vel[0]), float(vel[1]), float(vel[2]), eph['GammaN'])
+
+
+# --- VÍ DỤ SỬ DỤNG ---
+if __name__ == "__main__":
+    import time
+    from lazy_nav import LazyNavigation
+
+    nav = LazyNavigation("2908-nav-base.nav")
+    propagator = GlonassPropagator()
+    prns = [prn for prn in nav.keys() if prn.startswith('R')]
+
+    # Mỗi vệ tinh: 1 giờ dữ liệu 1 Hz quanh 02:00 ngày 28/08/2025 (GPS SOW 352818)
+    start = time.perf_counter()
+    count = 0
+    for t in np.arange(352818.0 - 1800, 352818.0 + 1800):
+        for prn in prns:
+            eph = nav.find_best(prn, t)
+            if eph and propagator.state(eph, t)[0] is not None:
+                count += 1
+    elapsed = time.perf_counter() - start
+    print(f"{count} trạng thái vệ tinh GLONASS trong {elapsed:.3f} s "
+          f"({propagator.integrations} lần tích phân RK4)")
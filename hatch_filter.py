@@ -0,0 +1,166 @@
+import numpy as np
+
+# Thứ tự các hệ thống vệ tinh trong mảng trạng thái; mỗi hệ thống có MAX_PRN_PER_SYSTEM ô
+SYSTEMS = 'GRECJIS'
+MAX_PRN_PER_SYSTEM = 64
+
+
+def sat_index(prn):
+    """
+    Chỉ số cố định của vệ tinh trong các mảng trạng thái, ví dụ 'G01' -> 0, 'R01' -> 64.
+    Trả về -1 nếu PRN không hợp lệ.
+    """
+    system = SYSTEMS.find(prn[0])
+    try:
+        number = int(prn[1:])
+    except ValueError:
+        return -1
+    if system < 0 or not 1 <= number <= MAX_PRN_PER_SYSTEM:
+        return -1
+    return system * MAX_PRN_PER_SYSTEM + number - 1
+
+
+class HatchFilter:
+    """
+    Bộ lọc Hatch làm trơn pseudorange bằng pha sóng mang (carrier smoothing), chạy theo luồng.
+
+    Trạng thái của từng vệ tinh nằm trong các mảng NumPy kích thước cố định,
+    đánh chỉ số bằng sat_index(prn); mỗi lần cập nhật là O(1) cho mỗi vệ tinh mỗi epoch:
+
+        P_s(k) = P(k)/n + (n-1)/n * (P_s(k-1) + L(k) - L(k-1)),   n = min(số epoch liên tục, window)
+
+    Bộ lọc được khởi động lại (reset) khi:
+        - không có pha sóng mang,
+        - cờ LLI báo mất khóa (bit 0),
+        - khoảng trống dữ liệu lớn hơn max_gap,
+        - pseudorange thô lệch khỏi giá trị dự báo quá slip_threshold (cycle slip không được đánh dấu).
+    """
+
+    def __init__(self, window=100, max_gap=30.0, slip_threshold=30.0):
+        """
+        Args:
+            window (int): Độ dài cửa sổ làm trơn tối đa (số epoch).
+            max_gap (float): Khoảng trống dữ liệu tối đa (giây) trước khi reset.
+            slip_threshold (float): Ngưỡng (mét) phát hiện cycle slip từ chênh lệch code - dự báo.
+        """
+        self.window = window
+        self.max_gap = max_gap
+        self.slip_threshold = slip_threshold
+
+        size = len(SYSTEMS) * MAX_PRN_PER_SYSTEM
+        self.smoothed = np.zeros(size)            # Pseudorange đã làm trơn (mét)
+        self.prev_phase = np.zeros(size)          # Pha sóng mang epoch trước (mét)
+        self.count = np.zeros(size, dtype=np.int32)  # Số epoch liên tục đã làm trơn
+        self.last_time = np.full(size, -np.inf)   # Thời điểm cập nhật gần nhất (giây)
+        self.resets = 0                           # Số lần khởi động lại (do slip/gap)
+
+    def reset(self, prn=None):
+        """Xóa trạng thái của một vệ tinh (hoặc của tất cả nếu prn=None)."""
+        if prn is None:
+            self.count[:] = 0
+            self.last_time[:] = -np.inf
+            return
+        k = sat_index(prn)
+        if k >= 0:
+            self.count[k] = 0
+
+    def state_dict(self):
+        """
+        Trạng thái của các vệ tinh đang được làm trơn dưới dạng dict (lưu được bằng JSON),
+        để tiếp tục bộ lọc ở lần chạy sau (xem load_state).
+        """
+        active = np.flatnonzero(self.count > 0)
+        return {
+            "sats": active.tolist(),
+            "smoothed": self.smoothed[active].tolist(),
+            "prev_phase": self.prev_phase[active].tolist(),
+            "count": self.count[active].tolist(),
+            "last_time": self.last_time[active].tolist(),
+            "resets": self.resets,
+        }
+
+    def load_state(self, state):
+        """Khôi phục trạng thái từ state_dict(); các vệ tinh không có trong state được reset."""
+        self.reset()
+        active = np.asarray(state["sats"], dtype=np.int64)
+        self.smoothed[active] = state["smoothed"]
+        self.prev_phase[active] = state["prev_phase"]
+        self.count[active] = state["count"]
+        self.last_time[active] = state["last_time"]
+        self.resets = state.get("resets", 0)
+
+    def update(self, prn, t, code, phase_cycles, wavelength, lli=None):
+        """
+        Cập nhật bộ lọc cho một vệ tinh tại một epoch.
+
+        Args:
+            prn (str): Mã vệ tinh.
+            t (float): Thời điểm thu (giây, đơn điệu tăng trong một phiên xử lý).
+            code (float): Pseudorange thô (mét).
+            phase_cycles (float hoặc None): Pha sóng mang (chu kỳ).
+            wavelength (float): Bước sóng của sóng mang (mét).
+            lli (int hoặc None): Cờ LLI của quan sát pha.
+
+        Returns:
+            float: Pseudorange đã làm trơn (bằng pseudorange thô ngay sau khi reset).
+        """
+        k = sat_index(prn)
+        if k < 0:
+            return code
+
+        if phase_cycles is None or (lli is not None and lli & 1):
+            # Không có pha hoặc mất khóa: bắt đầu lại từ epoch sau
+            if self.count[k] > 0:
+                self.resets += 1
+            self.count[k] = 0
+            return code
+
+        phase = phase_cycles * wavelength
+        n = self.count[k]
+
+        if n > 0:
+            if t - self.last_time[k] > self.max_gap:
+                n = 0
+            else:
+                predicted = self.smoothed[k] + (phase - self.prev_phase[k])
+                if abs(code - predicted) > self.slip_threshold:
+                    n = 0
+            if n == 0:
+                self.resets += 1
+
+        if n == 0:
+            smoothed = code
+            n = 1
+        else:
+            n = min(n + 1, self.window)
+            smoothed = code / n + (n - 1) / n * predicted
+
+        self.smoothed[k] = smoothed
+        self.prev_phase[k] = phase
+        self.count[k] = n
+        self.last_time[k] = t
+        return smoothed
+
+
+# --- VÍ DỤ SỬ DỤNG: đo chi phí của bước làm trơn ---
+if __name__ == "__main__":
+    import time
+    import random
+
+    hatch = HatchFilter(window=100)
+    wavelength = 2.99792458e8 / 1575.42e6
+    prns = [f"G{n:02d}" for n in range(1, 13)]
+    num_epochs = 3600
+
+    start = time.perf_counter()
+    for k in range(num_epochs):
+        for j, prn in enumerate(prns):
+            true_range = 2.0e7 + 1000.0 * j + 800.0 * k
+            code = true_range + random.gauss(0.0, 1.0)
+            phase = true_range / wavelength + 1234.0
+            hatch.update(prn, float(k), code, phase, wavelength, lli=0)
+    elapsed = time.perf_counter() - start
+
+    per_update = elapsed / (num_epochs * len(prns)) * 1e6
+    print(f"{num_epochs} epoch x {len(prns)} vệ tinh: {elapsed * 1e3:.1f} ms ({per_update:.2f} us / cập nhật)")
+    print(f"Số lần reset: {hatch.resets}")
@@ -0,0 +1,205 @@
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import sys
+import numpy as np
+from lazy_nav import LazyNavigation
+from read_rinex_obs import iter_rinex_obs, read_rinex_obs_header
+from hatch_filter import HatchFilter
+from prepare_inputs import iter_solver_inputs
+from solve_navigation_equations import solve_epoch_batch
+
+CHECKPOINT_VERSION = 2
+CSV_HEADER = "time,x,y,z,clock_bias_m\n"
+# Số byte ở đầu file OBS (header) và ngay trước offset được băm để nhận diện file
+FINGERPRINT_BYTES = 4096
+
+
+def load_checkpoint(path):
+    """Đọc checkpoint JSON; trả về dict hoặc None nếu chưa có hoặc không đọc được."""
+    try:
+        with open(path, 'r') as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Cảnh báo: Bỏ qua checkpoint hỏng '{path}': {e}", file=sys.stderr)
+        return None
+    if checkpoint.get("version") != CHECKPOINT_VERSION:
+        return None
+    return checkpoint
+
+
+def save_checkpoint(path, checkpoint):
+    """Ghi checkpoint an toàn: ghi ra file tạm rồi đổi tên (không để lại file ghi dở)."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def obs_fingerprint(obs_file, offset):
+    """
+    Dấu vân tay (SHA-1) của phần file OBS đã xử lý: FINGERPRINT_BYTES byte đầu file và
+    FINGERPRINT_BYTES byte ngay trước offset. Không đổi khi file chỉ được ghi thêm,
+    nhưng khác đi nếu file bị thay bằng file khác (xoay vòng log, ghi đè), kể cả khi lớn hơn.
+    """
+    h = hashlib.sha1()
+    with open(obs_file, 'rb') as f:
+        h.update(f.read(min(offset, FINGERPRINT_BYTES)))
+        tail_start = max(offset - FINGERPRINT_BYTES, FINGERPRINT_BYTES)
+        if tail_start < offset:
+            f.seek(tail_start)
+            h.update(f.read(offset - tail_start))
+    return h.hexdigest()
+
+
+def _resumable(checkpoint, obs_file, output_file, hatch_window):
+    """Checkpoint còn khớp với file OBS (không bị cắt/thay) và file kết quả hay không."""
+    if checkpoint is None:
+        return False
+    if checkpoint["obs_file"] != os.path.abspath(obs_file) or checkpoint["hatch_window"] != hatch_window:
+        return False
+    if not os.path.exists(output_file) or os.path.getsize(output_file) < checkpoint["output_size"]:
+        return False
+    if not os.path.exists(obs_file) or checkpoint["offset"] > os.path.getsize(obs_file):
+        return False
+    return checkpoint["fingerprint"] == obs_fingerprint(obs_file, checkpoint["offset"])
+
+
+def process_incremental(nav_file, obs_file, output_file, checkpoint_file=None, initial_pos=None,
+                        hatch_window=None, systems="G", chunk_size=256, **solver_options):
+    """
+    Xử lý gia tăng (incremental) một file OBS đang được ghi thêm (ví dụ file ngày, cron mỗi giờ).
+
+    Checkpoint (JSON) lưu vị trí byte sau epoch cuối đã xử lý, thời điểm epoch đó, nghiệm cuối
+    (dùng làm dự đoán ban đầu) và trạng thái bộ lọc Hatch. Lần chạy sau nhảy thẳng (seek) tới
+    dữ liệu mới và chỉ GHI THÊM nghiệm mới vào file CSV, nên chi phí tỷ lệ với lượng dữ liệu mới
+    chứ không với kích thước file. Epoch cuối chưa ghi xong được để dành cho lần chạy sau.
+
+    Checkpoint được cập nhật sau mỗi batch, sau khi đã ghi nghiệm; file CSV được cắt về kích thước
+    ghi trong checkpoint khi tiếp tục, nên một lần chạy bị ngắt giữa chừng không tạo dòng trùng.
+    Nếu checkpoint không còn khớp (file OBS bị thay/cắt ngắn, nhận ra bằng obs_fingerprint;
+    đổi hatch_window) thì xử lý lại từ đầu.
+
+    Args:
+        nav_file (str): File NAV (được lập chỉ mục lại mỗi lần chạy, thường nhỏ so với file OBS).
+        obs_file (str): File OBS đang được ghi thêm.
+        output_file (str): File CSV kết quả (time, x, y, z, clock_bias_m).
+        checkpoint_file (str hoặc None): File checkpoint; mặc định output_file + ".ckpt.json".
+        initial_pos (list hoặc None): Dự đoán ban đầu cho lần chạy đầu tiên; mặc định lấy
+            APPROX POSITION XYZ trong header OBS (hoặc tâm Trái Đất).
+        hatch_window (int hoặc None): Cửa sổ bộ lọc Hatch (None: không làm trơn).
+        systems (str): Các hệ thống vệ tinh được dùng.
+        chunk_size (int): Số epoch mỗi batch (và giữa hai lần ghi checkpoint).
+        **solver_options: Chuyển cho solve_epoch_batch.
+
+    Returns:
+        dict: {"resumed": bool, "epochs": số epoch mới đã đọc, "solutions": số dòng nghiệm đã ghi,
+               "offset": vị trí byte đã xử lý tới}, hoặc None nếu không đọc được file NAV.
+    """
+    if checkpoint_file is None:
+        checkpoint_file = output_file + ".ckpt.json"
+
+    try:
+        nav = LazyNavigation(nav_file)
+    except FileNotFoundError:
+        print(f"Lỗi: Không tìm thấy file tại '{nav_file}'", file=sys.stderr)
+        return None
+
+    checkpoint = load_checkpoint(checkpoint_file)
+    resumed = _resumable(checkpoint, obs_file, output_file, hatch_window)
+    hatch_filter = HatchFilter(window=hatch_window) if hatch_window else None
+
+    if resumed:
+        offset = checkpoint["offset"]
+        last_time = datetime.datetime.fromisoformat(checkpoint["last_time"]) if checkpoint["last_time"] else None
+        guess = checkpoint["last_solution"]
+        if hatch_filter is not None and checkpoint["hatch"]:
+            hatch_filter.load_state(checkpoint["hatch"])
+        output = open(output_file, 'r+')
+        output.truncate(checkpoint["output_size"])
+        output.seek(0, os.SEEK_END)
+    else:
+        offset, last_time, guess = None, None, None
+        output = open(output_file, 'w')
+        output.write(CSV_HEADER)
+
+    if guess is None:
+        header = read_rinex_obs_header(obs_file) if initial_pos is None else None
+        guess = initial_pos or (header and header['approx_position']) or [0.0, 0.0, 0.0]
+
+    progress = {"offset": offset or 0, "last_time": last_time, "epochs": 0}
+    saved_offset = offset
+
+    def new_epochs():
+        for epoch, end in iter_rinex_obs(obs_file, start_offset=offset, with_offsets=True):
+            progress["offset"] = end
+            # Phòng trường hợp offset trỏ vào dữ liệu đã xử lý
+            if last_time is not None and epoch["time"] <= last_time:
+                continue
+            progress["last_time"] = epoch["time"]
+            progress["epochs"] += 1
+            yield epoch
+
+    def write_checkpoint():
+        nonlocal saved_offset
+        output.flush()
+        save_checkpoint(checkpoint_file, {
+            "version": CHECKPOINT_VERSION,
+            "obs_file": os.path.abspath(obs_file),
+            "offset": progress["offset"],
+            "fingerprint": obs_fingerprint(obs_file, progress["offset"]),
+            "last_time": progress["last_time"].isoformat() if progress["last_time"] else None,
+            "last_solution": None if guess is None else [float(v) for v in guess],
+            "output_size": output.tell(),
+            "hatch_window": hatch_window,
+            "hatch": hatch_filter.state_dict() if hatch_filter is not None else None,
+        })
+        saved_offset = progress["offset"]
+
+    written = 0
+    with output:
+        for batch in iter_solver_inputs(nav, new_epochs(), hatch_filter, chunk_size, systems=systems):
+            solutions = solve_epoch_batch(batch, guess[:3], **solver_options)
+            for t, row in zip(batch.times_utc, solutions):
+                if np.all(np.isfinite(row)):
+                    output.write(f"{t.isoformat()},{row[0]:.4f},{row[1]:.4f},{row[2]:.4f},{row[3]:.4f}\n")
+                    guess = row
+                    written += 1
+            write_checkpoint()
+        # Các epoch cuối không tạo batch (ít hơn 4 vệ tinh) vẫn được đánh dấu là đã xử lý
+        if progress["offset"] != saved_offset:
+            write_checkpoint()
+
+    return {"resumed": resumed, "epochs": progress["epochs"], "solutions": written,
+            "offset": progress["offset"]}
+
+
+def main(argv=None):
+    """Giao diện dòng lệnh (dùng cho cron) của process_incremental (xem --help)."""
+    parser = argparse.ArgumentParser(description="Xử lý gia tăng file OBS đang được ghi thêm, có checkpoint.")
+    parser.add_argument("nav_file", help="File RINEX Navigation")
+    parser.add_argument("obs_file", help="File RINEX Observation (đang được ghi thêm)")
+    parser.add_argument("output_file", help="File CSV kết quả (chỉ ghi thêm nghiệm mới)")
+    parser.add_argument("--checkpoint", help="File checkpoint (mặc định: OUTPUT_FILE.ckpt.json)")
+    parser.add_argument("--hatch", type=int, help="Cửa sổ bộ lọc Hatch (số epoch)")
+    parser.add_argument("--mask", type=float, default=10.0, help="Góc ngẩng tối thiểu (độ)")
+    args = parser.parse_args(argv)
+
+    result = process_incremental(args.nav_file, args.obs_file, args.output_file, args.checkpoint,
+                                 hatch_window=args.hatch, elevation_mask_deg=args.mask)
+    if result is None:
+        return 1
+    print(f"{'Tiếp tục từ checkpoint' if result['resumed'] else 'Xử lý từ đầu'}: "
+          f"{result['epochs']} epoch mới, {result['solutions']} nghiệm được ghi thêm "
+          f"(offset {result['offset']})")
+    return 0
+
+
+# --- VÍ DỤ SỬ DỤNG ---
+# python incremental.py 2908-nav-base.nav 2908-base.obs base-solutions.csv --hatch 100
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+# Các kernel tính toán "nóng" (hot loops) với hai backend cùng giao diện:
+#
+#     - "numpy" (mặc định): NumPy thuần, không cần cài thêm gì.
+#     - "numba": cùng thuật toán viết bằng vòng lặp và biên dịch JIT bằng Numba (tùy chọn,
+#       không nằm trong requirements.txt). Phù hợp với các vòng lặp có nhánh phụ thuộc dữ liệu
+#       (hội tụ riêng từng phần tử, số vệ tinh thay đổi theo epoch) mà NumPy phải xử lý bằng mặt nạ.
+#
+# Backend được chọn MỘT lần khi import, qua biến môi trường GNSS_SPP_BACKEND = numpy | numba | auto
+# ("auto": dùng Numba nếu đã cài). Hai backend dùng cùng công thức và cùng thứ tự phép tính nên
+# chỉ có thể khác nhau ở sai số làm tròn của sin/cos/sqrt (cỡ 1 ulp, tùy thư viện toán của nền tảng);
+# test_kernels.py kiểm tra điều này cho cả vòng lặp Python thuần và bản biên dịch Numba (nếu đã cài).
+import math
+import os
+import sys
+import numpy as np
+
+# Giới hạn lặp Newton-Raphson mặc định của phương trình Kepler (giống cal_sat_pos._kepler_state)
+KEPLER_MAX_ITERATIONS = 8
+KEPLER_TOLERANCE = 1e-13
+
+
+def _select_backend():
+    requested = os.environ.get("GNSS_SPP_BACKEND", "numpy").strip().lower()
+    if requested not in ("numpy", "numba", "auto"):
+        print(f"Cảnh báo: GNSS_SPP_BACKEND='{requested}' không hợp lệ, dùng 'numpy'.", file=sys.stderr)
+        return "numpy", None
+    if requested == "numpy":
+        return "numpy", None
+    try:
+        import numba
+    except ImportError:
+        if requested == "numba":
+            print("Cảnh báo: Chưa cài numba, dùng backend 'numpy'.", file=sys.stderr)
+        return "numpy", None
+    return "numba", numba
+
+
+# --- Backend NumPy ---
+
+def _eccentric_anomaly_numpy(M, e, max_iterations):
+    E = M.copy()
+    # Chỉ cập nhật các phần tử chưa hội tụ (mỗi phần tử dừng đúng như vòng lặp vô hướng)
+    active = np.ones(E.shape, dtype=bool)
+    for _ in range(max_iterations):
+        Ea, ea = E[active], e[active]
+        d = (Ea - ea * np.sin(Ea) - M[active]) / (1.0 - ea * np.cos(Ea))
+        E[active] = Ea - d
+        active[active] = np.abs(d) >= KEPLER_TOLERANCE
+        if not active.any():
+            break
+    return E
+
+
+def _line_of_sight_numpy(receiver_pos, sat_pos):
+    diff = sat_pos - receiver_pos
+    # Cộng tuần tự x^2 + y^2 + z^2 (như vòng lặp), không dùng einsum vì thứ tự cộng
+    # của einsum phụ thuộc nhánh SIMD của CPU
+    dx, dy, dz = diff[:, 0], diff[:, 1], diff[:, 2]
+    ranges = np.sqrt(dx * dx + dy * dy + dz * dz)
+    return ranges, diff / ranges[:, None]
+
+
+# --- Backend vòng lặp (biên dịch bằng Numba khi được chọn) ---
+
+def _eccentric_anomaly_loop(M, e, E, max_iterations):
+    for k in range(M.size):
+        Ek = M[k]
+        ek = e[k]
+        for _ in range(max_iterations):
+            d = (Ek - ek * math.sin(Ek) - M[k]) / (1.0 - ek * math.cos(Ek))
+            Ek -= d
+            if abs(d) < KEPLER_TOLERANCE:
+                break
+        E[k] = Ek
+
+
+def _line_of_sight_loop(receiver_pos, sat_pos, ranges, los):
+    for k in range(sat_pos.shape[0]):
+        dx = sat_pos[k, 0] - receiver_pos[0]
+        dy = sat_pos[k, 1] - receiver_pos[1]
+        dz = sat_pos[k, 2] - receiver_pos[2]
+        r = math.sqrt(dx * dx + dy * dy + dz * dz)
+        ranges[k] = r
+        los[k, 0] = dx / r
+        los[k, 1] = dy / r
+        los[k, 2] = dz / r
+
+
+BACKEND, _numba = _select_backend()
+
+if _numba is not None:
+    _eccentric_anomaly_loop = _numba.njit(cache=True)(_eccentric_anomaly_loop)
+    _line_of_sight_loop = _numba.njit(cache=True)(_line_of_sight_loop)
+
+
+# --- Giao diện chung ---
+
+def eccentric_anomaly(M, e, max_iterations=KEPLER_MAX_ITERATIONS):
+    """
+    Giải phương trình Kepler M = E - e*sin(E) bằng Newton-Raphson cho mọi phần tử,
+    mỗi phần tử dừng khi |dE| < KEPLER_TOLERANCE (tối đa max_iterations vòng).
+
+    Args:
+        M (ndarray): Dị thường trung bình (radian), kích thước bất kỳ.
+        e (ndarray): Độ lệch tâm, cùng kích thước với M.
+        max_iterations (int): Số vòng lặp tối đa.
+
+    Returns:
+        ndarray: Dị thường tâm sai E, cùng kích thước với M.
+    """
+    M = np.asarray(M, dtype=np.float64)
+    e = np.broadcast_to(np.asarray(e, dtype=np.float64), M.shape)
+    if BACKEND == "numba":
+        E = np.empty(M.size)
+        _eccentric_anomaly_loop(np.ascontiguousarray(M).ravel(), np.ascontiguousarray(e).ravel(), E,
+                                max_iterations)
+        return E.reshape(M.shape)
+    return _eccentric_anomaly_numpy(M, e, max_iterations)
+
+
+def line_of_sight(receiver_pos, sat_pos):
+    """
+    Khoảng cách hình học và véc-tơ đơn vị hướng nhìn máy thu -> vệ tinh
+    (các cột [-e_x, -e_y, -e_z] của ma trận thiết kế H).
+
+    Args:
+        receiver_pos (ndarray, 3): Vị trí máy thu ECEF (mét).
+        sat_pos (ndarray, n x 3): Vị trí vệ tinh ECEF (mét).
+
+    Returns:
+        tuple: (ranges (n), los (n x 3)).
+    """
+    if BACKEND == "numba":
+        sat_pos = np.ascontiguousarray(sat_pos, dtype=np.float64)
+        ranges = np.empty(len(sat_pos))
+        los = np.empty((len(sat_pos), 3))
+        _line_of_sight_loop(np.asarray(receiver_pos, dtype=np.float64), sat_pos, ranges, los)
+        return ranges, los
+    return _line_of_sight_numpy(receiver_pos, sat_pos)
+
+
+# --- VÍ DỤ SỬ DỤNG ---
+# GNSS_SPP_BACKEND=numba python kernels.py
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(0)
+    M = rng.uniform(-math.pi, math.pi, 1_000_000)
+    e = rng.uniform(0.0, 0.03, M.size)
+
+    eccentric_anomaly(M[:10], e[:10])   # Lần gọi đầu (Numba: biên dịch JIT)
+    start = time.perf_counter()
+    E = eccentric_anomaly(M, e)
+    elapsed = time.perf_counter() - start
+    print(f"Backend: {BACKEND}")
+    print(f"Kepler: {M.size} phần tử trong {elapsed * 1e3:.1f} ms, "
+          f"sai số lớn nhất {np.max(np.abs(E - e * np.sin(E) - M)):.2e} rad")
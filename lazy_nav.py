@@ -0,0 +1,194 @@
+import collections
+import sys
+import threading
+import numpy as np
+from read_rinex_nav import _parse_float, _parse_record, _glonass_toe, NAV_ORBIT_LINES, KEPLER_ORBIT_LINES
+
+# Các hệ thống có bản ghi dạng Kepler (8 dòng, Toe nằm ở cột đầu của dòng orbit thứ 3)
+KEPLER_SYSTEMS = 'GECJI'
+
+
+class LazyNavigation:
+    """
+    Dữ liệu NAV được đọc "lười" (lazy) từ file RINEX Navigation.
+
+    Khi khởi tạo chỉ quét file một lượt để lập chỉ mục (index): với mỗi bản ghi chỉ lấy
+    PRN, thời điểm tham chiếu (Toe; tb đổi sang giờ GPS với GLONASS) và vị trí byte (offset)
+    trong file, KHÔNG phân tích các tham số quỹ đạo. Một bản ghi chỉ được phân tích đầy đủ ở lần đầu tiên nó được
+    yêu cầu, sau đó lưu trong bộ đệm LRU.
+
+    Có thể dùng thay cho dict trả về bởi read_rinex_nav ở những chỗ chỉ cần
+    `prn in nav` và `nav[prn]`, nhưng nên dùng find_best() để chỉ phân tích đúng bản ghi cần thiết.
+    Dùng chung được giữa nhiều thread: chỉ các thao tác trên bộ đệm được khóa, việc phân tích
+    bản ghi chạy ngoài khóa.
+    """
+
+    def __init__(self, file_path, cache_size=256):
+        """
+        Args:
+            file_path (str): Đường dẫn file RINEX navigation.
+            cache_size (int): Số bản ghi đã phân tích tối đa giữ trong bộ đệm LRU.
+
+        Raises:
+            FileNotFoundError: nếu không tìm thấy file.
+        """
+        self.file_path = file_path
+        self.cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()   # Bảo vệ _cache, _bad_offsets và parsed_count
+        self._bad_offsets = set()   # Bản ghi hỏng (phân tích thất bại), không chọn lại
+        self.parsed_count = 0   # Số lần phải phân tích bản ghi (cache miss)
+
+        index = collections.defaultdict(list)
+        with open(file_path, 'rb') as f:
+            # --- Bỏ qua Header ---
+            offset = 0
+            for line in f:
+                offset += len(line)
+                if b"END OF HEADER" in line:
+                    break
+
+            # --- Quét các dòng đầu bản ghi ---
+            # Dòng đầu bản ghi bắt đầu bằng mã hệ thống ở cột 1; dòng orbit bắt đầu bằng khoảng trắng.
+            current = None   # [prn, offset, ref_time, số dòng đã gặp]
+            for line in f:
+                first = line[:1]
+                if first and first not in b' \r\n':
+                    sat_prn = line[0:3].decode('ascii', 'replace').strip()
+                    if sat_prn and sat_prn[0] in 'GECJIRS':
+                        current = [sat_prn, offset, None, 1]
+                        index[sat_prn].append(current)
+                        # GLONASS: thời điểm tham chiếu tb nằm ngay trên dòng đầu bản ghi
+                        if sat_prn[0] == 'R':
+                            try:
+                                current[2] = _glonass_toe(line.decode('ascii', 'replace'))
+                            except (ValueError, IndexError):
+                                pass
+                    else:
+                        current = None
+                elif current is not None:
+                    current[3] += 1
+                    # Toe (giây trong tuần) nằm ở cột đầu của dòng orbit thứ 3
+                    if current[3] == 4 and current[0][0] in KEPLER_SYSTEMS:
+                        current[2] = _parse_float(line[4:23].decode('ascii', 'replace'))
+                offset += len(line)
+
+        # Chuyển chỉ mục sang mảng NumPy cho từng PRN: offsets và thời điểm tham chiếu
+        self._offsets = {}
+        self._ref_times = {}
+        for sat_prn, records in index.items():
+            records = [r for r in records if r[2] is not None]
+            if not records:
+                continue
+            self._offsets[sat_prn] = np.array([r[1] for r in records], dtype=np.int64)
+            self._ref_times[sat_prn] = np.array([r[2] for r in records], dtype=np.float64)
+
+    @property
+    def record_count(self):
+        """Tổng số bản ghi đã lập chỉ mục."""
+        return sum(len(v) for v in self._offsets.values())
+
+    def keys(self):
+        return self._offsets.keys()
+
+    def __contains__(self, prn):
+        return prn in self._offsets
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, prn):
+        """Trả về list mọi ephemeris của một PRN (phân tích tất cả bản ghi của PRN đó)."""
+        records = [self._load(int(offset), prn) for offset in self._offsets[prn]]
+        return [eph for eph in records if eph is not None]
+
+    def get(self, prn, default=None):
+        if prn not in self._offsets:
+            return default
+        return self[prn]
+
+    def find_best(self, prn, t):
+        """
+        Tìm ephemeris có Toe gần t nhất (không quá 4 giờ), cùng tiêu chí với
+        prepare_inputs.find_best_ephemeris, nhưng chọn trên chỉ mục và chỉ phân tích
+        đúng bản ghi được chọn. Nếu bản ghi được chọn bị hỏng thì đánh dấu và chọn
+        bản ghi gần kế tiếp, giống read_rinex_nav (bỏ bản ghi hỏng ngay khi đọc).
+
+        Returns:
+            dict hoặc None.
+        """
+        ref_times = self._ref_times.get(prn)
+        if ref_times is None:
+            return None
+
+        # Khoảng cách thời gian, xử lý week crossover
+        dt = np.abs(t - ref_times)
+        dt = np.where(dt > 302400, 604800 - dt, dt)
+        offsets = self._offsets[prn]
+        with self._lock:
+            bad_offsets = list(self._bad_offsets)
+        if bad_offsets:
+            dt[np.isin(offsets, bad_offsets)] = np.inf
+
+        while True:
+            k = int(np.argmin(dt))
+            # Nếu bản tin quá cũ (> 4 giờ = 14400s), không sử dụng
+            if dt[k] > 14400:
+                return None
+            eph = self._load(int(offsets[k]), prn)
+            if eph is not None:
+                return eph
+            with self._lock:
+                self._bad_offsets.add(int(offsets[k]))
+            dt[k] = np.inf
+
+    def _load(self, offset, prn):
+        """
+        Phân tích bản ghi của vệ tinh prn tại offset (hoặc lấy từ bộ đệm LRU). Nếu dòng đầu
+        bản ghi tại offset không phải của prn (offset lệch, ví dụ file bị thay) thì coi như
+        bản ghi hỏng và trả về None.
+        """
+        with self._lock:
+            eph = self._cache.get(offset)
+            if eph is not None:
+                self._cache.move_to_end(offset)
+                return eph
+
+        with open(self.file_path, 'rb') as f:
+            f.seek(offset)
+            line1 = f.readline().decode('ascii', 'replace')
+            num_lines = NAV_ORBIT_LINES.get(line1[:1], KEPLER_ORBIT_LINES)
+            orbit_lines = [f.readline().decode('ascii', 'replace') for _ in range(num_lines)]
+        if line1[:3].strip() != prn:
+            print(f"Warning: Skipping record at offset {offset}: expected {prn}, found '{line1[:3].strip()}'",
+                  file=sys.stderr)
+            return None
+        try:
+            eph = _parse_record(line1, orbit_lines)
+        except (ValueError, IndexError, TypeError, AttributeError) as e:
+            print(f"Warning: Skipping corrupted record starting with '{line1.strip()}'. Error: {e}", file=sys.stderr)
+            return None
+
+        with self._lock:
+            self.parsed_count += 1
+            self._cache[offset] = eph
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return eph
+
+
+# --- Ví dụ Sử dụng ---
+if __name__ == "__main__":
+    import time
+
+    rinex_file = "2908-nav-base.nav"
+
+    start = time.perf_counter()
+    nav = LazyNavigation(rinex_file)
+    elapsed = time.perf_counter() - start
+    print(f"Đã lập chỉ mục {nav.record_count} bản ghi cho {len(nav)} vệ tinh trong {elapsed * 1e3:.1f} ms")
+
+    eph = nav.find_best('G05', 345600.0)
+    if eph:
+        print(f"G05: Toe = {eph['Toe']}, epoch = {eph['epoch']}")
+    print(f"Số bản ghi đã phân tích: {nav.parsed_count}")
@@ -1,6 +1,7 @@
 from prepare_inputs import *
 from solve_navigation_equations import *
 from coord_transform import *
+from read_rinex_nav import read_rinex_nav_header
 
 if __name__ == "__main__":
     
@@ -12,6 +13,14 @@ if __name__ == "__main__":
     # APPROX_POS_XYZ = [-1626584.7059, 5730519.4572, 2271864.3916] # Từ header
 
     APPROX_POS_XYZ = [0, 0, 0] # Từ tâm trái đất
+
+    ELEVATION_MASK_DEG = 10.0 # Góc ngẩng tối thiểu (độ)
+
+    # Tham số Klobuchar từ header file .nav (nếu có) để hiệu chỉnh tầng điện ly
+    nav_header = read_rinex_nav_header(NAV_FILE)
+    iono_params = None
+    if nav_header and nav_header['ion_alpha'] and nav_header['ion_beta']:
+        iono_params = (nav_header['ion_alpha'], nav_header['ion_beta'])
     
     # 1. Chuẩn bị dữ liệu
     solver_data = prepare_basic_solver_inputs(NAV_FILE, OBS_FILE)
@@ -20,14 +29,19 @@ if __name__ == "__main__":
         # 2. Lấy dữ liệu của epoch đầu tiên
         first_epoch_data = solver_data[0]
         print(f"\n--- BẮT ĐẦU GIẢI HỆ PHƯƠNG TRÌNH CHO EPOCH ĐẦU TIÊN ---")
-        print(f"Thời gian: {first_epoch_data['time_utc']}")
+        print(f"Thời gian: {first_epoch_data.time_utc}")
         print(f"Dự đoán ban đầu (X, Y, Z): {APPROX_POS_XYZ}")
-        print(f"Số vệ tinh sử dụng: {len(first_epoch_data['satellites'])}")
+        print(f"Số vệ tinh sử dụng: {len(first_epoch_data)}")
 
         # 3. Gọi hàm giải
-        final_solution = solve_navigation_equations(first_epoch_data, APPROX_POS_XYZ)
+        position = solve_position(first_epoch_data, APPROX_POS_XYZ,
+                                  iono_params=iono_params,
+                                  troposphere=True,
+                                  elevation_mask_deg=ELEVATION_MASK_DEG,
+                                  weighting=True)
 
-        if final_solution is not None:
+        if position is not None:
+            final_solution = position.solution
             x_receiver = final_solution[0]
             y_receiver = final_solution[1]
             z_receiver = final_solution[2]
@@ -48,6 +62,17 @@ if __name__ == "__main__":
             print(f"Latitude  : {lat} degrees")
             print(f"Longitude : {lon} degrees")
             print(f"Height    : {h} meters")
+
+            # 4. Vận tốc từ Doppler (dùng lại ma trận H của bài toán vị trí)
+            velocity = solve_velocity(first_epoch_data, position)
+            if velocity is not None:
+                print("\n--- VẬN TỐC MÁY THU (TỪ DOPPLER) ---")
+                print(f"  Vx: {velocity[0]} m/s")
+                print(f"  Vy: {velocity[1]} m/s")
+                print(f"  Vz: {velocity[2]} m/s")
+                print(f"  Tốc độ trôi đồng hồ (c*ddt_r): {velocity[3]} m/s")
+            else:
+                print("\nKhông đủ quan sát Doppler để tính vận tốc.")
         else:
             print("\nGiải hệ phương trình thất bại.")
 
@@ -0,0 +1,215 @@
+import datetime
+import math
+import sys
+import numpy as np
+from read_rinex_nav import read_rinex_nav
+from hatch_filter import sat_index
+from shared_ephemeris import (GPS_EPOCH, pack_ephemeris, SharedEphemerisTable,
+                              _prn_from_index)
+
+# Tham số số thực của bản ghi GLONASS (tên như trong read_rinex_nav); cột 0 là vệ tinh, cột 1 là tb
+GLONASS_FIELDS = [
+    'Toe', 'TauN', 'GammaN', 'tk', 'X', 'Xdot', 'Xacc', 'health', 'Y', 'Ydot', 'Yacc',
+    'freq_num', 'Z', 'Zdot', 'Zacc', 'age',
+]
+GLONASS_COLUMNS = ['sat', 'epoch_gps_seconds'] + GLONASS_FIELDS
+
+
+def is_healthy(eph):
+    """Cờ sức khỏe của bản tin: SV_health (Kepler) hoặc health (GLONASS) bằng 0 hoặc không có."""
+    health = eph.get('health') if 'X' in eph else eph.get('SV_health')
+    return not health
+
+
+def _record_key(prn, eph):
+    """
+    Khóa nhận diện cùng một bộ dữ liệu quảng bá: cùng PRN, cùng thời điểm tham chiếu và
+    cùng IODE. Galileo phát song song I/NAV và F/NAV với cùng IODnav nhưng hiệu chỉnh
+    đồng hồ khác nhau, nên nguồn dữ liệu (trường L2_codes) cũng nằm trong khóa.
+    GLONASS không có IODE: thời điểm tb xác định bộ dữ liệu.
+    """
+    if prn[0] == 'R':
+        return (eph['epoch'],)
+    if prn[0] == 'E':
+        return (eph['epoch'], eph['Toe'], eph['IODE'], eph.get('L2_codes'))
+    return (eph['epoch'], eph['Toe'], eph['IODE'])
+
+
+class MergedNavigation:
+    """
+    Kho ephemeris gộp từ nhiều file NAV (file theo ngày, file của nhiều trạm).
+
+    Mỗi PRN có một list bản tin sắp theo thời gian, đã loại bản ghi trùng hoàn toàn và bản ghi
+    tương đương theo (Toe, IODE); mỗi bản tin mang cờ 'health_ok' tính một lần khi nạp.
+    find_best() chỉ chọn trong các bản tin khỏe (chỉ mục Toe dạng mảng NumPy), nên dùng được
+    ở mọi chỗ cần dữ liệu NAV trong prepare_inputs giống LazyNavigation.
+    """
+
+    def __init__(self, nav=None):
+        self._records = {}
+        self._ref_times = {}
+        self._healthy = {}
+        self.stats = {'records': 0, 'exact_duplicates': 0, 'iode_duplicates': 0, 'unhealthy': 0}
+        if nav:
+            self.add(nav)
+
+    # --- Nạp dữ liệu ---
+
+    def add(self, nav):
+        """
+        Gộp thêm dữ liệu NAV dạng {prn: [eph, ...]} (ví dụ kết quả read_rinex_nav).
+        Với các bản ghi trùng, bản ghi gặp trước được giữ lại.
+        """
+        for prn, eph_list in nav.items():
+            records = self._records.get(prn, [])
+            seen = {_record_key(prn, eph): eph for eph in records}
+            for eph in eph_list:
+                self.stats['records'] += 1
+                key = _record_key(prn, eph)
+                kept = seen.get(key)
+                if kept is not None:
+                    same = all(kept.get(name) == value for name, value in eph.items())
+                    self.stats['exact_duplicates' if same else 'iode_duplicates'] += 1
+                    continue
+                eph = dict(eph, health_ok=is_healthy(eph))
+                if not eph['health_ok']:
+                    self.stats['unhealthy'] += 1
+                seen[key] = eph
+                records.append(eph)
+            records.sort(key=lambda e: e['epoch'])
+            self._records[prn] = records
+            self._index(prn)
+
+    def _index(self, prn):
+        """Chỉ mục Toe của các bản tin khỏe của một PRN (dùng cho find_best)."""
+        healthy = [eph for eph in self._records[prn] if eph['health_ok']]
+        self._healthy[prn] = healthy
+        self._ref_times[prn] = np.array([eph['Toe'] for eph in healthy], dtype=np.float64)
+
+    # --- Truy vấn (giống dict của read_rinex_nav) ---
+
+    @property
+    def record_count(self):
+        """Tổng số bản ghi sau khi loại trùng."""
+        return sum(len(v) for v in self._records.values())
+
+    def keys(self):
+        return self._records.keys()
+
+    def items(self):
+        return self._records.items()
+
+    def __contains__(self, prn):
+        return prn in self._records
+
+    def __len__(self):
+        return len(self._records)
+
+    def __getitem__(self, prn):
+        """Trả về list mọi ephemeris (kể cả bản tin không khỏe) của một PRN, sắp theo thời gian."""
+        return self._records[prn]
+
+    def get(self, prn, default=None):
+        return self._records.get(prn, default)
+
+    def find_best(self, prn, t):
+        """
+        Tìm ephemeris KHỎE có Toe gần t nhất (không quá 4 giờ), cùng tiêu chí với
+        prepare_inputs.find_best_ephemeris. Trả về dict hoặc None.
+        """
+        ref_times = self._ref_times.get(prn)
+        if ref_times is None or len(ref_times) == 0:
+            return None
+
+        # Khoảng cách thời gian, xử lý week crossover
+        dt = np.abs(t - ref_times)
+        dt = np.where(dt > 302400, 604800 - dt, dt)
+        k = int(np.argmin(dt))
+
+        # Nếu bản tin quá cũ (> 4 giờ = 14400s), không sử dụng
+        if dt[k] > 14400:
+            return None
+        return self._healthy[prn][k]
+
+    # --- Lưu / mở lại ---
+
+    def save(self, path):
+        """
+        Ghi kho ra một file .npz gọn: bảng Kepler (cùng định dạng pack_ephemeris /
+        SharedEphemerisTable) và bảng GLONASS. Mở lại bằng MergedNavigation.load.
+        """
+        np.savez(path, kepler=pack_ephemeris(self), glonass=self._pack_glonass())
+
+    @classmethod
+    def load(cls, path):
+        """Mở kho đã lưu bằng save(). Trả về MergedNavigation hoặc None nếu không đọc được."""
+        try:
+            with np.load(path) as data:
+                kepler, glonass = data['kepler'], data['glonass']
+        except (FileNotFoundError, OSError, KeyError) as e:
+            print(f"Lỗi: Không đọc được kho ephemeris '{path}': {e}", file=sys.stderr)
+            return None
+
+        table = SharedEphemerisTable(kepler)
+        nav = {prn: table[prn] for prn in table.keys()}
+        for row in glonass:
+            eph = {'epoch': GPS_EPOCH + datetime.timedelta(seconds=float(row[1]))}
+            for name, value in zip(GLONASS_FIELDS, row[2:]):
+                eph[name] = None if math.isnan(value) else float(value)
+            if eph['freq_num'] is not None:
+                eph['freq_num'] = int(eph['freq_num'])
+            nav.setdefault(_prn_from_index(int(row[0])), []).append(eph)
+
+        return cls(nav)
+
+    def _pack_glonass(self):
+        rows = []
+        for prn, eph_list in self._records.items():
+            if prn[0] != 'R' or sat_index(prn) < 0:
+                continue
+            for eph in eph_list:
+                row = [float(sat_index(prn)), (eph['epoch'] - GPS_EPOCH).total_seconds()]
+                row += [math.nan if eph.get(name) is None else eph[name] for name in GLONASS_FIELDS]
+                rows.append(row)
+        return np.array(rows, dtype=np.float64).reshape(-1, len(GLONASS_COLUMNS))
+
+
+def merge_navigation(nav_files):
+    """
+    Đọc và gộp nhiều file NAV thành một MergedNavigation (sắp theo thời gian, loại trùng,
+    gắn cờ sức khỏe). File không đọc được được bỏ qua (read_rinex_nav đã báo lỗi).
+
+    Returns:
+        MergedNavigation hoặc None nếu không đọc được file nào.
+    """
+    merged = MergedNavigation()
+    loaded = 0
+    for path in nav_files:
+        nav = read_rinex_nav(path)
+        if nav is None:
+            continue
+        merged.add(nav)
+        loaded += 1
+    return merged if loaded else None
+
+
+# --- VÍ DỤ SỬ DỤNG ---
+if __name__ == "__main__":
+    import os
+    import tempfile
+
+    NAV_FILES = ['2908-nav-base.nav', '2908-nav-base.nav'] # Các file .nav (ví dụ: nhiều trạm cùng ngày)
+
+    merged = merge_navigation(NAV_FILES)
+    if merged:
+        print(f"Đã gộp {len(NAV_FILES)} file: {merged.stats['records']} bản ghi -> {merged.record_count} bản ghi, "
+              f"{len(merged)} vệ tinh")
+        print(f"Trùng hoàn toàn: {merged.stats['exact_duplicates']}, trùng (Toe, IODE): "
+              f"{merged.stats['iode_duplicates']}, không khỏe: {merged.stats['unhealthy']}")
+
+        # Lưu ra thư mục tạm (không để lại file trong thư mục làm việc)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store_path = os.path.join(tmp_dir, 'merged-nav.npz')
+            merged.save(store_path)
+            reloaded = MergedNavigation.load(store_path)
+            print(f"Mở lại từ {store_path}: {reloaded.record_count} bản ghi")
@@ -0,0 +1,169 @@
+import heapq
+import os
+import sys
+import numpy as np
+from lazy_nav import LazyNavigation
+from nav_merge import MergedNavigation
+from read_rinex_obs import iter_rinex_obs
+from epoch_batch import EpochBatchBuilder
+from hatch_filter import HatchFilter
+from prepare_inputs import BroadcastSatelliteStates, select_ephemeris, _prepare_epoch, datetime_to_gps_sow
+from solve_navigation_equations import solve_epoch_batch
+
+# Thời gian bay danh định của tín hiệu GPS (giây): ~20 000 km / c.
+# Thời gian bay thực tế của mọi máy thu trên mặt đất nằm trong khoảng 0.065 - 0.090 s.
+NOMINAL_TRAVEL_TIME = 0.075
+
+
+class SharedSatelliteStates(BroadcastSatelliteStates):
+    """
+    Bộ đệm trạng thái vệ tinh dùng chung cho nhiều máy thu trong cùng một epoch.
+
+    Với mỗi (PRN, thời điểm thu t_r) chỉ giải Kepler MỘT lần tại thời điểm phát danh định
+    t_ref = t_r - NOMINAL_TRAVEL_TIME. Mỗi máy thu sau đó hiệu chỉnh thời gian bay bằng
+    ngoại suy tuyến tính theo vận tốc và tốc độ trôi đồng hồ vệ tinh:
+
+        X(t_s) = X(t_ref) + V(t_ref) * (t_s - t_ref),   dt_sat(t_s) = dt_sat(t_ref) + ddt_sat * (t_s - t_ref)
+
+    Với |t_s - t_ref| < ~0.015 s, sai số bỏ qua gia tốc (~0.6 m/s^2) nhỏ hơn 0.1 mm.
+    Bộ đệm chỉ giữ các vệ tinh của epoch hiện tại: khi t_r đổi thì bộ đệm được làm mới,
+    nên các máy thu cần được xử lý xen kẽ theo thời gian (xem prepare_network_inputs).
+    """
+
+    def __init__(self, nav, travel_time=NOMINAL_TRAVEL_TIME):
+        super().__init__(nav)
+        self.travel_time = travel_time
+        self._time = None
+        self._cache = {}
+        self.computed = 0   # Số lần giải Kepler thực sự
+        self.requests = 0   # Số lần máy thu yêu cầu trạng thái vệ tinh
+
+    def _reference(self, prn, t_r):
+        """(TGD, t_ref, trạng thái tại t_ref) của vệ tinh, tính một lần cho mỗi epoch."""
+        if t_r != self._time:
+            self._time = t_r
+            self._cache.clear()
+        if prn in self._cache:
+            return self._cache[prn]
+
+        entry = None
+        t_ref = t_r - self.travel_time
+        eph = select_ephemeris(self.nav, prn, t_ref)
+        if eph:
+            state = self._compute(prn, eph, t_ref)
+            self.computed += 1
+            if state is not None:
+                entry = (eph.get("TGD", 0.0) or 0.0, t_ref, state)
+        self._cache[prn] = entry
+        return entry
+
+    def group_delay(self, prn, t_r):
+        entry = self._reference(prn, t_r)
+        return None if entry is None else entry[0]
+
+    def state(self, prn, t_r, t_s):
+        entry = self._reference(prn, t_r)
+        if entry is None:
+            return None
+        self.requests += 1
+        _, t_ref, (X, Y, Z, dt_sat, VX, VY, VZ, ddt_sat) = entry
+        dt = t_s - t_ref
+        return (X + VX * dt, Y + VY * dt, Z + VZ * dt, dt_sat + ddt_sat * dt,
+                VX, VY, VZ, ddt_sat)
+
+
+def open_navigation(nav):
+    """
+    Mở nguồn dữ liệu NAV cho chế độ mạng: đường dẫn file RINEX NAV (LazyNavigation), đường dẫn
+    kho .npz đã lưu bằng MergedNavigation.save (MergedNavigation.load), hoặc đối tượng NAV đã mở
+    (MergedNavigation, LazyNavigation, dict của read_rinex_nav) được dùng trực tiếp.
+
+    Returns:
+        Đối tượng NAV, hoặc None nếu không mở được.
+    """
+    if not isinstance(nav, (str, os.PathLike)):
+        return nav
+    if os.fspath(nav).endswith(".npz"):
+        return MergedNavigation.load(nav)
+    try:
+        return LazyNavigation(nav)
+    except FileNotFoundError:
+        print(f"Lỗi: Không tìm thấy file tại '{nav}'", file=sys.stderr)
+        return None
+
+
+def prepare_network_inputs(nav, obs_files, hatch_window=None, travel_time=NOMINAL_TRAVEL_TIME):
+    """
+    Chuẩn bị dữ liệu cho nhiều trạm (máy thu) dùng chung một bộ dữ liệu NAV.
+
+    Các file OBS được đọc theo luồng (iter_rinex_obs) và trộn theo thời gian (heapq.merge),
+    nên các trạm có cùng thời điểm epoch được xử lý liền nhau và dùng chung trạng thái vệ tinh
+    trong SharedSatelliteStates: chi phí tính vệ tinh tỷ lệ với số (PRN, epoch) chứ không
+    nhân theo số trạm.
+
+    Args:
+        nav (str hoặc object): File NAV, kho ephemeris .npz (MergedNavigation.save) hoặc
+            đối tượng NAV đã mở, ví dụ MergedNavigation gộp từ nhiều file (xem open_navigation).
+        obs_files (list): Đường dẫn các file OBS (mỗi file một trạm).
+        hatch_window (int hoặc None): Cửa sổ bộ lọc Hatch (mỗi trạm một bộ lọc riêng).
+        travel_time (float): Thời gian bay danh định (giây) dùng làm thời điểm tham chiếu.
+
+    Returns:
+        tuple: (list EpochBatch theo thứ tự obs_files, SharedSatelliteStates đã dùng),
+               hoặc None nếu không mở được dữ liệu NAV.
+    """
+    nav = open_navigation(nav)
+    if nav is None:
+        return None
+    sat_states = SharedSatelliteStates(nav, travel_time)
+    builders = [EpochBatchBuilder() for _ in obs_files]
+    hatch_filters = [HatchFilter(window=hatch_window) if hatch_window else None for _ in obs_files]
+
+    def tagged(k, path):
+        for epoch in iter_rinex_obs(path):
+            yield datetime_to_gps_sow(epoch["time"]), k, epoch
+
+    streams = [tagged(k, path) for k, path in enumerate(obs_files)]
+    for _, k, epoch in heapq.merge(*streams, key=lambda item: (item[0], item[1])):
+        _prepare_epoch(builders[k], epoch, nav, hatch_filters[k], sat_states)
+
+    return [builder.build() for builder in builders], sat_states
+
+
+def solve_network(nav, obs_files, initial_pos, hatch_window=None, velocity=False, **solver_options):
+    """
+    Giải SPP cho nhiều trạm dùng chung một bộ dữ liệu NAV (xem prepare_network_inputs;
+    nav có thể là file NAV, kho .npz của MergedNavigation hoặc đối tượng NAV).
+
+    Returns:
+        list: Kết quả solve_epoch_batch của từng trạm, theo thứ tự obs_files;
+              None nếu không mở được dữ liệu NAV.
+    """
+    prepared = prepare_network_inputs(nav, obs_files, hatch_window)
+    if prepared is None:
+        return None
+    batches, _ = prepared
+    return [solve_epoch_batch(batch, initial_pos, velocity=velocity, **solver_options)
+            for batch in batches]
+
+
+# --- VÍ DỤ SỬ DỤNG ---
+if __name__ == "__main__":
+    import time
+
+    NAV_FILE = '2908-nav-base.nav' # File .nav; hoặc kho .npz đã gộp, ví dụ:
+                                   # merge_navigation([...]).save('merged-nav.npz')
+    OBS_FILES = ['2908-base.obs', 'test.obs'] # Các file .obs của các trạm
+
+    start = time.perf_counter()
+    prepared = prepare_network_inputs(NAV_FILE, OBS_FILES)
+    if prepared is None:
+        sys.exit(1)
+    batches, sat_states = prepared
+    elapsed = time.perf_counter() - start
+
+    print(f"Chuẩn bị {len(OBS_FILES)} trạm trong {elapsed:.3f} s")
+    print(f"Số lần giải Kepler: {sat_states.computed} cho {sat_states.requests} yêu cầu trạng thái vệ tinh")
+    for path, batch in zip(OBS_FILES, batches):
+        solutions = solve_epoch_batch(batch, [0, 0, 0])
+        print(f"{path}: {len(batch)} epoch, nghiệm đầu tiên: {np.round(solutions[0, :3], 3) if len(batch) else None}")
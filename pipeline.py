@@ -0,0 +1,299 @@
+import multiprocessing
+import queue
+import threading
+import time
+import numpy as np
+from read_rinex_obs import iter_rinex_obs
+from lazy_nav import LazyNavigation
+from epoch_batch import EpochBatchBuilder
+from hatch_filter import HatchFilter
+from prepare_inputs import _prepare_epoch, BroadcastSatelliteStates
+from solve_navigation_equations import solve_position, solve_velocity
+
+class _EndOfStream:
+    """Dấu hiệu kết thúc luồng dữ liệu giữa các stage (vẫn nhận ra được sau khi pickle)."""
+
+
+class StageStats:
+    """
+    Bộ đếm của một stage trong pipeline.
+
+    Thuộc tính:
+        name (str): Tên stage.
+        items_in, items_out (int): Số phần tử nhận vào / đẩy ra.
+        busy_time (float): Thời gian xử lý thực sự (giây).
+        blocked_time (float): Thời gian chờ vì hàng đợi phía sau đầy (backpressure).
+        idle_time (float): Thời gian chờ dữ liệu từ stage phía trước.
+    """
+    __slots__ = ("name", "items_in", "items_out", "busy_time", "blocked_time", "idle_time")
+
+    def __init__(self, name):
+        self.name = name
+        self.items_in = 0
+        self.items_out = 0
+        self.busy_time = 0.0
+        self.blocked_time = 0.0
+        self.idle_time = 0.0
+
+    @property
+    def throughput(self):
+        """Số phần tử xử lý được mỗi giây thời gian bận (items/s)."""
+        return self.items_in / self.busy_time if self.busy_time > 0 else float('inf')
+
+    def __repr__(self):
+        return (f"{self.name:<8} in={self.items_in:<6} out={self.items_out:<6} "
+                f"busy={self.busy_time:7.3f}s blocked={self.blocked_time:7.3f}s "
+                f"idle={self.idle_time:7.3f}s ({self.throughput:,.0f} items/s)")
+
+
+def _put(q, item, stats):
+    start = time.perf_counter()
+    q.put(item)
+    stats.blocked_time += time.perf_counter() - start
+    if not isinstance(item, _EndOfStream):
+        stats.items_out += len(item)
+
+
+def _source_worker(index, factory, out_q, stats, report_q, chunk_size):
+    """Stage nguồn: lấy phần tử từ iterable và đẩy vào hàng đợi đầu tiên theo từng khối."""
+    error = None
+    chunk = []
+    try:
+        iterator = iter(factory())
+        while True:
+            start = time.perf_counter()
+            item = next(iterator, _EndOfStream)
+            stats.busy_time += time.perf_counter() - start
+            if item is _EndOfStream:
+                break
+            stats.items_in += 1
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                _put(out_q, chunk, stats)
+                chunk = []
+    except Exception as e:
+        error = e
+    finally:
+        if chunk:
+            _put(out_q, chunk, stats)
+        _put(out_q, _EndOfStream(), stats)
+        report_q.put((index, stats, error))
+
+
+def _stage_worker(index, factory, in_q, out_q, stats, report_q, chunk_size, batched=False):
+    """
+    Stage xử lý: nhận từng khối phần tử, xử lý, đẩy kết quả sang hàng đợi sau.
+    Với batched=True, fn nhận cả khối và trả về một khối kết quả (hoặc None), được chuyển nguyên khối.
+    """
+    error = None
+    chunk = []
+    try:
+        start = time.perf_counter()
+        fn = factory()
+        stats.busy_time += time.perf_counter() - start
+        while True:
+            start = time.perf_counter()
+            items = in_q.get()
+            stats.idle_time += time.perf_counter() - start
+            if isinstance(items, _EndOfStream):
+                break
+            stats.items_in += len(items)
+            start = time.perf_counter()
+            if batched:
+                result = fn(items)
+                stats.busy_time += time.perf_counter() - start
+                if result is not None and len(result) > 0:
+                    _put(out_q, result, stats)
+                continue
+            for item in items:
+                result = fn(item)
+                if result is not None:
+                    chunk.append(result)
+            stats.busy_time += time.perf_counter() - start
+            if len(chunk) >= chunk_size:
+                _put(out_q, chunk, stats)
+                chunk = []
+    except Exception as e:
+        error = e
+        # Rút cạn hàng đợi đầu vào để stage phía trước không bị chặn và có thể kết thúc
+        while not isinstance(in_q.get(), _EndOfStream):
+            pass
+    finally:
+        if chunk:
+            _put(out_q, chunk, stats)
+        _put(out_q, _EndOfStream(), stats)
+        report_q.put((index, stats, error))
+
+
+class StagedExecutor:
+    """
+    Chạy một nguồn dữ liệu qua chuỗi stage, mỗi stage trong một thread (hoặc process) riêng,
+    nối với nhau bằng hàng đợi có giới hạn (bounded queue) để có backpressure.
+
+    Mỗi stage là một cặp (name, factory): factory() được gọi TRONG thread/process của stage
+    (nên việc khởi tạo nặng như lập chỉ mục file NAV cũng chạy song song với các stage khác)
+    và trả về hàm xử lý fn(item) -> kết quả, hoặc None để bỏ phần tử đó.
+    Stage dạng (name, factory, True) xử lý theo khối: fn(chunk) nhận cả khối và trả về một khối
+    kết quả có len() (list, EpochBatch, ...), ví dụ để gom nhiều epoch vào một EpochBatch.
+
+    Tổng thời gian chạy tiến tới thời gian của stage chậm nhất thay vì tổng các stage.
+    Với use_processes=False các stage là thread nên chỉ chồng lấp được ở những đoạn nhả GIL
+    (đọc file, NumPy); với use_processes=True mỗi stage là một process (fork) và chạy song song
+    thật sự, đổi lại phải pickle các phần tử qua hàng đợi. Các phần tử được chuyển giữa các stage
+    theo từng khối chunk_size phần tử để giảm chi phí đồng bộ hóa/IPC cho mỗi phần tử.
+    """
+
+    def __init__(self, source_name, source_factory, stages, queue_size=16, chunk_size=1,
+                 use_processes=False):
+        """
+        Args:
+            source_name (str): Tên stage nguồn.
+            source_factory (callable): Trả về iterable các phần tử đầu vào (gọi trong stage nguồn).
+            stages (list): Danh sách (name, factory) hoặc (name, factory, batched) của các stage xử lý.
+            queue_size (int): Số khối tối đa trong mỗi hàng đợi giữa hai stage.
+            chunk_size (int): Số phần tử trong mỗi khối chuyển giữa các stage.
+            use_processes (bool): Chạy mỗi stage trong một process thay vì thread.
+        """
+        self.source_name = source_name
+        self.source_factory = source_factory
+        self.stages = stages
+        self.queue_size = queue_size
+        self.chunk_size = chunk_size
+        self.use_processes = use_processes
+        self.stats = [StageStats(source_name)] + [StageStats(stage[0]) for stage in stages]
+
+    def run(self):
+        """
+        Khởi động các stage và trả ra (generator) kết quả của stage cuối cùng theo thứ tự.
+        Ngoại lệ xảy ra trong bất kỳ stage nào được ném lại ở đây; self.stats được cập nhật
+        khi tất cả các stage đã kết thúc.
+        """
+        if self.use_processes:
+            ctx = multiprocessing.get_context('fork')
+            make_queue, make_worker = ctx.Queue, ctx.Process
+        else:
+            make_queue, make_worker = queue.Queue, threading.Thread
+
+        queues = [make_queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        report_q = make_queue()
+        workers = [make_worker(target=_source_worker, name=self.source_name, daemon=True,
+                               args=(0, self.source_factory, queues[0], self.stats[0], report_q,
+                                     self.chunk_size))]
+        for k, stage in enumerate(self.stages):
+            name, factory = stage[:2]
+            batched = len(stage) > 2 and stage[2]
+            workers.append(make_worker(target=_stage_worker, name=name, daemon=True,
+                                       args=(k + 1, factory, queues[k], queues[k + 1],
+                                             self.stats[k + 1], report_q, self.chunk_size, batched)))
+        for w in workers:
+            w.start()
+
+        out_q = queues[-1]
+        while True:
+            items = out_q.get()
+            if isinstance(items, _EndOfStream):
+                break
+            yield from items
+
+        # Thu thập thống kê và lỗi từ mọi stage
+        error = None
+        for _ in workers:
+            index, stats, stage_error = report_q.get()
+            self.stats[index] = stats
+            if stage_error is not None and error is None:
+                error = stage_error
+        for w in workers:
+            w.join()
+        if error is not None:
+            raise error
+
+
+def run_pipeline(nav_file, obs_file, initial_pos, queue_size=16, chunk_size=16, hatch_window=None,
+                 velocity=False, use_processes=False, **solver_options):
+    """
+    Xử lý SPP theo pipeline 3 stage chạy song song:
+        parse   : đọc file OBS theo luồng (iter_rinex_obs),
+        prepare : chọn ephemeris + tính vị trí vệ tinh (LazyNavigation, bộ lọc Hatch),
+                  gom mỗi khối chunk_size epoch thành một EpochBatch,
+        solve   : giải vị trí (và vận tốc) bằng ILS, warm start từ epoch trước.
+
+    Args:
+        nav_file, obs_file (str): Đường dẫn file NAV và OBS.
+        initial_pos (list): Vị trí dự đoán ban đầu [x, y, z].
+        queue_size (int): Số khối tối đa trong mỗi hàng đợi giữa các stage.
+        chunk_size (int): Số epoch trong mỗi khối chuyển giữa các stage.
+        hatch_window (int hoặc None): Cửa sổ bộ lọc Hatch (None = không làm trơn).
+        velocity (bool): Giải thêm vận tốc từ Doppler.
+        use_processes (bool): Chạy mỗi stage trong một process riêng (song song thật sự).
+        **solver_options: Chuyển cho solve_position (iono_params, troposphere, ...).
+
+    Returns:
+        dict: {
+            "times": list datetime của các epoch đã giải,
+            "positions": ndarray (n x 4) [x, y, z, c_dt_r],
+            "velocities": ndarray (n x 4) [vx, vy, vz, c_ddt_r] hoặc None,
+            "stats": list StageStats,
+        }
+    """
+
+    def make_prepare():
+        # Lập chỉ mục NAV trong thread prepare, song song với việc đọc OBS
+        nav = LazyNavigation(nav_file)
+        sat_states = BroadcastSatelliteStates(nav)
+        hatch = HatchFilter(window=hatch_window) if hatch_window else None
+
+        def prepare(epochs):
+            # Một EpochBatch liền kề cho cả khối epoch
+            builder = EpochBatchBuilder()
+            for epoch in epochs:
+                _prepare_epoch(builder, epoch, nav, hatch, sat_states)
+            return builder.build() if len(builder) > 0 else None
+        return prepare
+
+    def make_solve():
+        state = {"guess": initial_pos}
+
+        def solve(batch):
+            results = []
+            for epoch_view in batch:
+                result = solve_position(epoch_view, state["guess"], verbose=False, **solver_options)
+                if result is None:
+                    continue
+                state["guess"] = result.solution[:3]
+                v = solve_velocity(epoch_view, result) if velocity else None
+                results.append((epoch_view.time_utc, result.solution, v))
+            return results
+        return solve
+
+    executor = StagedExecutor("parse", lambda: iter_rinex_obs(obs_file),
+                              [("prepare", make_prepare, True), ("solve", make_solve, True)],
+                              queue_size=queue_size, chunk_size=chunk_size,
+                              use_processes=use_processes)
+
+    times, positions, velocities = [], [], []
+    for time_utc, position, v in executor.run():
+        times.append(time_utc)
+        positions.append(position)
+        velocities.append(v if v is not None else np.full(4, np.nan))
+
+    return {
+        "times": times,
+        "positions": np.array(positions).reshape(-1, 4),
+        "velocities": np.array(velocities).reshape(-1, 4) if velocity else None,
+        "stats": executor.stats,
+    }
+
+
+# --- VÍ DỤ SỬ DỤNG ---
+if __name__ == "__main__":
+
+    NAV_FILE = '2908-nav-base.nav' # File .nav
+    OBS_FILE = 'test.obs' # File .obs
+
+    start = time.perf_counter()
+    result = run_pipeline(NAV_FILE, OBS_FILE, [0, 0, 0], velocity=True, use_processes=True)
+    elapsed = time.perf_counter() - start
+
+    print(f"Đã giải {len(result['times'])} epoch trong {elapsed:.3f} s")
+    for stats in result["stats"]:
+        print(stats)
@@ -0,0 +1,451 @@
+import argparse
+import collections
+import datetime
+import glob
+import itertools
+import json
+import os
+import queue
+import re
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from nav_merge import merge_navigation
+from read_rinex_nav import read_rinex_nav_header
+from read_rinex_obs import iter_rinex_obs, read_rinex_obs_header
+from epoch_batch import EpochBatchBuilder
+from hatch_filter import HatchFilter
+from network import SharedSatelliteStates
+from prepare_inputs import _prepare_epoch, datetime_to_gps_sow
+from solve_navigation_equations import solve_epoch_batch
+
+# Số epoch đọc và giải mỗi lượt với yêu cầu theo file OBS
+OBS_FILE_CHUNK = 256
+# PRN hợp lệ trong yêu cầu: mã hệ thống + 2 chữ số (G05, R21, ...)
+PRN_PATTERN = re.compile(r"[GRECJIS]\d{2}")
+
+
+class NavigationSnapshot:
+    """Một phiên bản dữ liệu NAV đã nạp (không đổi sau khi tạo; bản mới thay thế cả đối tượng)."""
+    __slots__ = ("nav", "iono_params", "signature", "loaded_at")
+
+    def __init__(self, nav, iono_params, signature):
+        # nav (MergedNavigation) nằm hoàn toàn trong bộ nhớ và chỉ đọc sau khi nạp:
+        # dùng chung được giữa các worker và không phụ thuộc file NAV sau khi nạp
+        self.nav = nav
+        self.iono_params = iono_params
+        self.signature = signature
+        self.loaded_at = datetime.datetime.now()
+
+
+class NavigationStore:
+    """
+    Giữ dữ liệu NAV "nóng" trong bộ nhớ cho dịch vụ chạy lâu dài.
+
+    Nguồn NAV là một file hoặc một thư mục (mọi file khớp pattern), được đọc hết vào bộ nhớ
+    bằng merge_navigation (kể cả khi chỉ có một file) để mỗi phiên bản giữ dữ liệu của riêng nó.
+    Chữ ký (đường dẫn, mtime, kích thước) của các file được kiểm tra tối đa mỗi check_interval giây;
+    khi có file mới hoặc file thay đổi, NAV được nạp lại và THAY THẾ nguyên khối: các yêu cầu
+    đang chạy vẫn dùng phiên bản cũ cho tới khi xong.
+    """
+
+    def __init__(self, source, pattern="*.nav", check_interval=2.0):
+        self.source = source
+        self.pattern = pattern
+        self.check_interval = check_interval
+        self.reloads = 0
+        self._reload_lock = threading.Lock()
+        self._checked_at = 0.0
+        self._snapshot = None
+        self.current()
+
+    def _files(self):
+        if os.path.isdir(self.source):
+            return sorted(glob.glob(os.path.join(self.source, self.pattern)))
+        return [self.source]
+
+    def _signature(self):
+        signature = []
+        for path in self._files():
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            signature.append((path, st.st_mtime_ns, st.st_size))
+        return tuple(signature)
+
+    def _load(self, signature):
+        paths = [path for path, _, _ in signature]
+        if not paths:
+            print(f"Lỗi: Không có file NAV trong '{self.source}'", file=sys.stderr)
+            return None
+        # Không dùng LazyNavigation: nó đọc lại file theo offset, nên khi file bị thay tại chỗ
+        # thì phiên bản cũ (yêu cầu đang chạy) sẽ đọc nhầm dữ liệu của file mới
+        nav = merge_navigation(paths)
+        if nav is None:
+            return None
+
+        iono_params = None
+        header = read_rinex_nav_header(paths[0])
+        if header and header['ion_alpha'] and header['ion_beta']:
+            iono_params = (header['ion_alpha'], header['ion_beta'])
+        return NavigationSnapshot(nav, iono_params, signature)
+
+    def current(self):
+        """Phiên bản NAV hiện tại (nạp lại trước nếu file NAV đã thay đổi)."""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return snapshot
+
+        with self._reload_lock:
+            if self._snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return self._snapshot
+            signature = self._signature()
+            self._checked_at = time.monotonic()
+            if self._snapshot is None or signature != self._snapshot.signature:
+                loaded = self._load(signature)
+                if loaded is not None:
+                    if self._snapshot is not None:
+                        self.reloads += 1
+                    self._snapshot = loaded
+            return self._snapshot
+
+
+def parse_epochs(items):
+    """
+    Chuyển các epoch dạng JSON sang cấu trúc của read_rinex_obs.
+
+    Mỗi epoch: {"time": "2025-08-28T02:00:00", "observations": {"G05": {"C1C": 2.1e7, ...}}};
+    giá trị quan sát là số hoặc {"value": ..., "lli": ..., "ssi": ...}.
+
+    Raises:
+        ValueError, KeyError, TypeError: nếu epoch không hợp lệ (kể cả PRN không đúng dạng G05).
+    """
+    epochs = []
+    for item in items:
+        observations = collections.defaultdict(dict)
+        for prn, obs in item["observations"].items():
+            if not PRN_PATTERN.fullmatch(prn):
+                raise ValueError(f"PRN không hợp lệ: {prn!r}")
+            for code, value in obs.items():
+                if not isinstance(value, dict):
+                    value = {"value": value, "lli": None, "ssi": None}
+                observations[prn][code] = {"value": float(value["value"]),
+                                           "lli": value.get("lli"), "ssi": value.get("ssi")}
+        epochs.append({"time": datetime.datetime.fromisoformat(item["time"]), "observations": observations})
+    return epochs
+
+
+def _solution_rows(batch, solutions):
+    return {t: (None if not np.all(np.isfinite(row)) else
+                {"time": t.isoformat(), "x": float(row[0]), "y": float(row[1]), "z": float(row[2]),
+                 "clock_bias_m": float(row[3])})
+            for t, row in zip(batch.times_utc, solutions)}
+
+
+class _ObsFileRequest:
+    """Yêu cầu giải cả một file OBS trong hàng đợi của PositioningService."""
+    __slots__ = ("obs_file", "hatch_window")
+
+    def __init__(self, obs_file, hatch_window=None):
+        self.obs_file = obs_file
+        self.hatch_window = hatch_window
+
+
+class PositioningService:
+    """
+    Dịch vụ định vị dùng chung một NavigationStore cho mọi yêu cầu.
+
+    Các yêu cầu (danh sách epoch) được đưa vào hàng đợi; mỗi worker lấy một yêu cầu rồi gom thêm
+    các yêu cầu đang chờ (tối đa max_batch) và xử lý chung một lượt: epoch của mọi yêu cầu được
+    sắp theo thời gian nên các yêu cầu cùng thời điểm dùng chung trạng thái vệ tinh
+    (SharedSatelliteStates, như chế độ mạng nhiều trạm trong network.py).
+    Yêu cầu theo file OBS cũng đi qua hàng đợi nhưng được xử lý riêng theo luồng (iter_rinex_obs),
+    sau các yêu cầu theo epoch của cùng lượt. Lỗi của một yêu cầu chỉ trả về cho yêu cầu đó.
+    """
+
+    def __init__(self, store, workers=2, max_batch=64, systems="G", **solver_options):
+        """
+        Args:
+            store (NavigationStore): Nguồn dữ liệu NAV.
+            workers (int): Số thread worker xử lý yêu cầu.
+            max_batch (int): Số yêu cầu tối đa gom trong một lượt.
+            systems (str): Các hệ thống vệ tinh được dùng.
+            **solver_options: Chuyển cho solve_epoch_batch; iono=False để không dùng tham số
+                Klobuchar từ header NAV (mặc định dùng nếu có).
+        """
+        self.store = store
+        self.max_batch = max_batch
+        self.systems = systems
+        self.solver_options = solver_options
+        self.requests = 0
+        self.batches = 0
+        self._stats_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._workers = [threading.Thread(target=self._worker, daemon=True) for _ in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def _options(self, snapshot):
+        options = dict(self.solver_options)
+        if options.pop("iono", True) and snapshot.iono_params is not None:
+            options["iono_params"] = snapshot.iono_params
+        return options
+
+    # --- Gửi yêu cầu ---
+
+    def submit(self, epochs, initial_pos=None):
+        """
+        Gửi một danh sách epoch (cấu trúc read_rinex_obs). Trả về Future với kết quả là list
+        nghiệm theo thứ tự epoch ({"time", "x", "y", "z", "clock_bias_m"} hoặc None nếu không giải được).
+        """
+        future = Future()
+        self._queue.put((epochs, initial_pos, future))
+        return future
+
+    def submit_obs_file(self, obs_file, initial_pos=None, hatch_window=None):
+        """Gửi yêu cầu giải mọi epoch của một file OBS trên máy chủ. Trả về Future (list nghiệm)."""
+        future = Future()
+        self._queue.put((_ObsFileRequest(obs_file, hatch_window), initial_pos, future))
+        return future
+
+    def solve_obs_file(self, obs_file, initial_pos=None, hatch_window=None):
+        """Như submit_obs_file nhưng chờ và trả về list nghiệm."""
+        return self.submit_obs_file(obs_file, initial_pos, hatch_window).result()
+
+    def _count(self, requests, batches=0):
+        with self._stats_lock:
+            self.requests += requests
+            self.batches += batches
+
+    # --- Worker ---
+
+    def _worker(self):
+        while True:
+            jobs = [self._queue.get()]
+            while len(jobs) < self.max_batch:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            epoch_jobs = [job for job in jobs if not isinstance(job[0], _ObsFileRequest)]
+            if epoch_jobs:
+                try:
+                    outcomes = self._process(epoch_jobs)
+                except Exception as e:
+                    # Lỗi chung của cả lượt (ví dụ không lấy được dữ liệu NAV)
+                    outcomes = [e] * len(epoch_jobs)
+                for (_, _, future), outcome in zip(epoch_jobs, outcomes):
+                    if isinstance(outcome, Exception):
+                        future.set_exception(outcome)
+                    else:
+                        future.set_result(outcome)
+
+            for request, initial_pos, future in jobs:
+                if not isinstance(request, _ObsFileRequest):
+                    continue
+                try:
+                    future.set_result(self._solve_obs_file(request, initial_pos))
+                except Exception as e:
+                    future.set_exception(e)
+
+    def _process(self, jobs):
+        """
+        Xử lý chung một lượt yêu cầu theo danh sách epoch. Trả về list kết quả theo thứ tự jobs;
+        phần tử là ngoại lệ nếu yêu cầu đó lỗi (các yêu cầu khác trong lượt không bị ảnh hưởng).
+        """
+        snapshot = self.store.current()
+        sat_states = SharedSatelliteStates(snapshot.nav)
+        builders = [EpochBatchBuilder() for _ in jobs]
+        failed = [None] * len(jobs)
+
+        # Chuẩn bị epoch của mọi yêu cầu theo thứ tự thời gian (dùng chung trạng thái vệ tinh)
+        order = []
+        for k, (epochs, _, _) in enumerate(jobs):
+            try:
+                order.extend((datetime_to_gps_sow(epoch["time"]), k, i) for i, epoch in enumerate(epochs))
+            except Exception as e:
+                failed[k] = e
+        order.sort()
+        for _, k, i in order:
+            if failed[k] is not None:
+                continue
+            try:
+                _prepare_epoch(builders[k], jobs[k][0][i], snapshot.nav, None, sat_states, self.systems)
+            except Exception as e:
+                failed[k] = e
+
+        options = self._options(snapshot)
+        outcomes = []
+        for (epochs, initial_pos, _), builder, error in zip(jobs, builders, failed):
+            if error is not None:
+                outcomes.append(error)
+                continue
+            try:
+                batch = builder.build()
+                rows = _solution_rows(batch, solve_epoch_batch(batch, initial_pos or [0.0, 0.0, 0.0], **options))
+                outcomes.append([rows.get(epoch["time"]) for epoch in epochs])
+            except Exception as e:
+                outcomes.append(e)
+
+        self._count(len(jobs), 1)
+        return outcomes
+
+    def _solve_obs_file(self, request, initial_pos):
+        """Giải mọi epoch của một file OBS theo từng khối OBS_FILE_CHUNK epoch. Trả về list nghiệm."""
+        snapshot = self.store.current()
+        if initial_pos is None:
+            header = read_rinex_obs_header(request.obs_file)
+            initial_pos = (header and header['approx_position']) or [0.0, 0.0, 0.0]
+        hatch_filter = HatchFilter(window=request.hatch_window) if request.hatch_window else None
+        sat_states = SharedSatelliteStates(snapshot.nav)
+
+        results = []
+        guess = initial_pos
+        options = self._options(snapshot)
+        epochs = iter_rinex_obs(request.obs_file)
+        while True:
+            chunk = list(itertools.islice(epochs, OBS_FILE_CHUNK))
+            if not chunk:
+                break
+            builder = EpochBatchBuilder()
+            for epoch in chunk:
+                _prepare_epoch(builder, epoch, snapshot.nav, hatch_filter, sat_states, self.systems)
+            batch = builder.build()
+            solutions = solve_epoch_batch(batch, guess, **options)
+            results.extend(row for row in _solution_rows(batch, solutions).values() if row is not None)
+            finite = np.flatnonzero(np.all(np.isfinite(solutions), axis=1))
+            if len(finite):
+                guess = solutions[finite[-1], :3]
+        self._count(1)
+        return results
+
+
+# --- Giao diện HTTP ---
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    GET  /health : trạng thái dịch vụ (số bản ghi NAV, thời điểm nạp, số lần nạp lại).
+    POST /solve  : {"epochs": [...], "initial_pos": [x, y, z]}
+                   hoặc {"obs_file": "đường/dẫn.obs", "initial_pos": ..., "hatch_window": 100}
+                   -> {"solutions": [...]}.
+    """
+    service = None   # PositioningService, gán khi tạo máy chủ
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send(404, {"error": f"không có {self.path}"})
+            return
+        service = self.service
+        snapshot = service.store.current()
+        self._send(200, {
+            "status": "ok" if snapshot is not None else "no navigation data",
+            "satellites": len(snapshot.nav) if snapshot else 0,
+            "nav_loaded_at": snapshot.loaded_at.isoformat() if snapshot else None,
+            "nav_reloads": service.store.reloads,
+            "requests": service.requests,
+            "batches": service.batches,
+        })
+
+    def do_POST(self):
+        if self.path != "/solve":
+            self._send(404, {"error": f"không có {self.path}"})
+            return
+        if self.service.store.current() is None:
+            self._send(503, {"error": "chưa có dữ liệu NAV"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            initial_pos = request.get("initial_pos")
+            if "obs_file" in request:
+                if not os.path.isfile(request["obs_file"]):
+                    self._send(400, {"error": f"không tìm thấy file {request['obs_file']}"})
+                    return
+                solutions = self.service.solve_obs_file(request["obs_file"], initial_pos,
+                                                        request.get("hatch_window"))
+            else:
+                epochs = parse_epochs(request["epochs"])
+                solutions = self.service.submit(epochs, initial_pos).result()
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self._send(400, {"error": f"yêu cầu không hợp lệ: {e}"})
+            return
+        except Exception as e:
+            print(f"Lỗi: Không xử lý được yêu cầu /solve: {e!r}", file=sys.stderr)
+            self._send(500, {"error": f"lỗi khi xử lý yêu cầu: {e}"})
+            return
+        self._send(200, {"solutions": solutions})
+
+    def log_message(self, format, *args):
+        # Không ghi log cho từng yêu cầu (hàng nghìn yêu cầu nhỏ)
+        pass
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Máy chủ HTTP trên Unix socket (mỗi kết nối một thread)."""
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ("local", 0)   # BaseHTTPRequestHandler cần client_address dạng (host, port)
+
+
+def make_server(service, host="127.0.0.1", port=8765, unix_socket=None):
+    """Tạo máy chủ HTTP (TCP hoặc Unix socket) cho service; gọi serve_forever() để chạy."""
+    handler = type("Handler", (_Handler,), {"service": service})
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.unlink(unix_socket)
+        return ThreadingUnixHTTPServer(unix_socket, handler)
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    """Chạy dịch vụ định vị (xem --help)."""
+    parser = argparse.ArgumentParser(description="Dịch vụ định vị SPP chạy lâu dài, giữ dữ liệu NAV trong bộ nhớ.")
+    parser.add_argument("nav_source", help="File NAV hoặc thư mục chứa các file NAV")
+    parser.add_argument("--pattern", default="*.nav", help="Mẫu tên file NAV khi nav_source là thư mục")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="Lắng nghe trên Unix socket thay vì TCP")
+    parser.add_argument("--workers", type=int, default=2, help="Số worker giải yêu cầu")
+    parser.add_argument("--max-batch", type=int, default=64, help="Số yêu cầu tối đa gom trong một lượt")
+    parser.add_argument("--mask", type=float, default=10.0, help="Góc ngẩng tối thiểu (độ)")
+    args = parser.parse_args(argv)
+
+    store = NavigationStore(args.nav_source, args.pattern)
+    if store.current() is None:
+        return 1
+    service = PositioningService(store, workers=args.workers, max_batch=args.max_batch,
+                                 troposphere=True, elevation_mask_deg=args.mask, weighting=True)
+    server = make_server(service, args.host, args.port, args.unix)
+    print(f"Dịch vụ định vị sẵn sàng tại {args.unix or f'http://{args.host}:{args.port}'} "
+          f"({len(store.current().nav)} vệ tinh trong dữ liệu NAV)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+# --- VÍ DỤ SỬ DỤNG ---
+# python positioning_service.py 2908-nav-base.nav --port 8765
+# curl -s localhost:8765/solve -d '{"obs_file": "test.obs"}'
+if __name__ == "__main__":
+    sys.exit(main())
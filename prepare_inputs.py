@@ -1,13 +1,18 @@
 import math
 import datetime
 import sys
-from read_rinex_nav import read_rinex_nav
+from lazy_nav import LazyNavigation
 from read_rinex_obs import read_rinex_obs
-from cal_sat_pos import calculate_satellite_position
+from cal_sat_pos import calculate_satellite_state
+from epoch_batch import EpochBatchBuilder
+from hatch_filter import HatchFilter
+from glonass import GlonassPropagator, glonass_frequency
 
 # Hằng số tốc độ ánh sáng
 c = 2.99792458e8
 OMEGA_E_DOT = 7.2921151467e-5
+# Tần số sóng mang GPS L1 (Hz), dùng để đổi Doppler (Hz) sang tốc độ thay đổi khoảng cách (m/s)
+FREQ_L1 = 1575.42e6
 
 def datetime_to_gps_sow(dt):
     """
@@ -51,110 +56,255 @@ def find_best_ephemeris(eph_list, t_s):
     return best
 
 
-def prepare_basic_solver_inputs(nav_file, obs_file):
+def select_ephemeris(nav, prn, t_s):
+    """
+    Chọn ephemeris phù hợp nhất của vệ tinh prn tại thời điểm t_s.
+    nav có thể là dict từ read_rinex_nav, hoặc đối tượng có find_best() như LazyNavigation
+    (chỉ phân tích bản ghi được chọn) và SharedEphemerisTable (bảng trong bộ nhớ chia sẻ).
+    """
+    if hasattr(nav, "find_best"):
+        return nav.find_best(prn, t_s)
+    return find_best_ephemeris(nav[prn], t_s)
+
+
+def carrier_wavelength(nav, prn, t_r):
+    """
+    Bước sóng (mét) của sóng mang L1/G1 dùng cho pha và Doppler của vệ tinh prn.
+    GLONASS dùng FDMA nên bước sóng phụ thuộc số kênh tần số trong bản tin;
+    trả về None nếu không có bản tin GLONASS phù hợp.
+    """
+    if prn.startswith("R"):
+        eph = select_ephemeris(nav, prn, t_r)
+        if not eph or eph.get("freq_num") is None:
+            return None
+        return c / glonass_frequency(eph["freq_num"])
+    return c / FREQ_L1
+
+
+class BroadcastSatelliteStates:
+    """
+    Nguồn trạng thái vệ tinh mặc định của _prepare_epoch: chọn ephemeris quảng bá và
+    giải Kepler đầy đủ cho từng (vệ tinh, thời điểm phát); vệ tinh GLONASS được tính bằng
+    GlonassPropagator (tích phân RK4 một lần cho mỗi bản tin, sau đó nội suy).
+
+    Các nguồn khác (ví dụ bộ đệm dùng chung cho nhiều máy thu trong network.py)
+    cung cấp cùng giao diện: `prn in states`, group_delay() và state().
+    """
+
+    def __init__(self, nav, glonass=None):
+        self.nav = nav
+        self.glonass = glonass if glonass is not None else GlonassPropagator()
+
+    def __contains__(self, prn):
+        return prn in self.nav
+
+    def group_delay(self, prn, t_r):
+        """TGD (giây) của ephemeris phù hợp tại thời điểm thu t_r, hoặc None nếu không có ephemeris."""
+        eph = select_ephemeris(self.nav, prn, t_r)
+        if not eph:
+            return None
+        return eph.get("TGD", 0.0) or 0.0
+
+    def state(self, prn, t_r, t_s):
+        """
+        Trạng thái vệ tinh tại thời điểm phát t_s (chưa hiệu chỉnh Sagnac):
+        (X, Y, Z, dt_sat, VX, VY, VZ, ddt_sat), hoặc None nếu không tính được.
+        """
+        eph = select_ephemeris(self.nav, prn, t_s)
+        if not eph:
+            return None
+        return self._compute(prn, eph, t_s)
+
+    def _compute(self, prn, eph, t_s):
+        """Trạng thái vệ tinh từ một bản tin cụ thể, hoặc None nếu không tính được."""
+        if prn.startswith("R"):
+            state = self.glonass.state(eph, t_s)
+        else:
+            state = calculate_satellite_state(eph, t_s)
+        if state[0] is None:
+            return None
+        return state
+
+
+def prepare_basic_solver_inputs(nav_file, obs_file, hatch_window=None, sat_states=None, systems="G"):
     """
     Đọc và chuẩn bị dữ liệu đầu vào cho bộ giải (Solver).
     Quy trình:
-    1. Đọc file NAV và OBS.
+    1. Đọc file OBS và lập chỉ mục file NAV (LazyNavigation: bản ghi ephemeris chỉ được
+       phân tích khi cần đến).
     2. Với mỗi epoch và mỗi vệ tinh:
-       - Lấy Pseudorange thô (C1C).
+       - Chỉ lấy vệ tinh thuộc các hệ thống trong `systems` (mặc định chỉ GPS).
+       - Lấy Pseudorange thô (C1C), làm trơn bằng bộ lọc Hatch nếu hatch_window được đặt.
        - Trừ TGD (Total Group Delay) khỏi Pseudorange (cho Single Frequency).
        - Tính thời gian phát tín hiệu (Transmission Time).
-       - Tính tọa độ vệ tinh và sai số đồng hồ vệ tinh.
+       - Tính tọa độ, vận tốc vệ tinh, sai số và tốc độ trôi đồng hồ vệ tinh.
+       - Đổi Doppler D1C (nếu có) sang tốc độ thay đổi khoảng cách (range rate).
     3. Gom nhóm các vệ tinh hợp lệ theo epoch.
+
+    Args:
+        nav_file, obs_file (str): Đường dẫn file NAV và OBS.
+        hatch_window (int hoặc None): Độ dài cửa sổ bộ lọc Hatch (số epoch);
+                                      None = dùng pseudorange thô.
+        sat_states (object hoặc None): Nguồn trạng thái vệ tinh thay thế, ví dụ
+                                       read_precise_products.PreciseSatelliteStates;
+                                       None = ephemeris quảng bá từ nav_file.
+        systems (str): Các hệ thống vệ tinh được dùng, ví dụ "G" hoặc "GR" (GPS + GLONASS).
+
+    Returns:
+        EpochBatch: Các epoch có ít nhất 4 vệ tinh, lưu dưới dạng mảng NumPy liền kề;
+                    None nếu không đọc được file NAV hoặc OBS.
     """
     # Đọc dữ liệu thô
-    nav = read_rinex_nav(nav_file)
+    try:
+        nav = LazyNavigation(nav_file)
+    except FileNotFoundError:
+        print(f"Lỗi: Không tìm thấy file tại '{nav_file}'", file=sys.stderr)
+        return None
     obs = read_rinex_obs(obs_file)
+    if obs is None:
+        return None
+    hatch_filter = HatchFilter(window=hatch_window) if hatch_window else None
+    # Tạo một lần để giữ bộ đệm cung quỹ đạo GLONASS giữa các epoch
+    if sat_states is None:
+        sat_states = BroadcastSatelliteStates(nav)
 
-    epochs = []
-
+    builder = EpochBatchBuilder()
     for epoch in obs:
-        dt = epoch["time"]
-        # Chuyển đổi thời gian thu (Receiver Time) sang GPS SOW
-        _, t_r = datetime_to_gps_sow(dt)
-
-        epoch_struct = {
-            "time_utc": dt,
-            "time_sow": t_r,
-            "satellites": []
-        }
-
-        for prn, o in epoch["observations"].items():
-            # Chỉ xử lý vệ tinh GPS ('G') và có dữ liệu NAV
-            if not prn.startswith("G"):
-                continue
-            if prn not in nav:
-                continue
-
-            # Chỉ xử lý nếu có dữ liệu giả khoảng cách C1C (L1 C/A code)
-            if "C1C" not in o:
-                continue
-
-            rho_raw = o["C1C"]["value"]
-
-            # --- BƯỚC 1: Lấy TGD để hiệu chỉnh Pseudorange ---
-            # Tìm ephemeris sơ bộ (dựa trên t_r) để lấy TGD
-            best_eph = find_best_ephemeris(nav[prn], t_r)
-            if not best_eph: 
-                continue
-
-            # TGD (Total Group Delay): Độ trễ phần cứng giữa tần số L1 và L2.
-            # Người dùng đơn tần L1 CẦN trừ giá trị này khỏi pseudorange đo được.
-            tgd = best_eph.get("TGD", 0.0) or 0.0
-
-            # Pseudorange đã hiệu chỉnh TGD
-            rho_corr = rho_raw - c*tgd
-
-            # --- BƯỚC 2: Ước tính thời gian phát (Transmission Time) ---
-            # Thời gian bay = Quãng đường / Tốc độ ánh sáng
-            t_travel = rho_corr / c
-            # Thời gian phát (t_s) = Thời gian thu (t_r) - Thời gian bay
-            t_s = t_r - t_travel
-
-            # --- BƯỚC 3: Tìm Ephemeris chính xác tại thời điểm phát ---
-            eph = find_best_ephemeris(nav[prn], t_s)
-            if not eph:
-                continue
-
-            # --- BƯỚC 4: Tính vị trí và đồng hồ vệ tinh ---
-            # Hàm trả về: Tọa độ (đã xoay Sagnac) và Sai số đồng hồ (đã tính tương đối tính)
-            X, Y, Z, dt_sat = calculate_satellite_position(eph, t_s)
-
-            # ===========================================================
-            # BƯỚC 5: HIỆU CHỈNH QUAY TRÁI ĐẤT (SAGNAC EFFECT)
-            # ===========================================================
-            # Trong thời gian tín hiệu bay từ vệ tinh xuống máy thu
-            # Trái Đất đã tự quay một góc nhỏ. Hệ tọa độ ECEF gắn với Trái Đất cũng quay theo.
-            # Cần xoay tọa độ vệ tinh (tại t_phát) sang hệ quy chiếu ECEF (tại t_thu).
-            
-            # Ước lượng thời gian lan truyền tín hiệu (travel time)
-            # t_travel = rho_corr / c
-            
-            # Góc quay của Trái Đất trong thời gian đó
-            theta = OMEGA_E_DOT * t_travel
+        _prepare_epoch(builder, epoch, nav, hatch_filter, sat_states, systems)
 
-            # Phép xoay trục Z
-            X_rot = X*math.cos(theta) + Y*math.sin(theta)
-            Y_rot = -X*math.sin(theta) + Y*math.cos(theta)
-            Z_rot = Z
-            
-            if X is None:
-                continue
+    return builder.build()
+
+
+def iter_solver_inputs(nav, obs_epochs, hatch_filter=None, chunk_size=1, sat_states=None, systems="G"):
+    """
+    Phiên bản streaming của prepare_basic_solver_inputs.
+
+    Args:
+        nav (dict hoặc LazyNavigation): Dữ liệu NAV đã đọc.
+        obs_epochs (iterable): Các epoch OBS, ví dụ iter_rinex_obs(obs_file).
+        hatch_filter (HatchFilter hoặc None): Bộ lọc Hatch giữ trạng thái giữa các epoch.
+        chunk_size (int): Số epoch hợp lệ trong mỗi EpochBatch trả ra.
+        sat_states (object hoặc None): Nguồn trạng thái vệ tinh thay thế (xem prepare_basic_solver_inputs).
+        systems (str): Các hệ thống vệ tinh được dùng (mặc định chỉ GPS).
+
+    Yields:
+        EpochBatch: Mỗi batch chứa tối đa chunk_size epoch.
+    """
+    if sat_states is None:
+        sat_states = BroadcastSatelliteStates(nav)
+
+    builder = EpochBatchBuilder()
+    for epoch in obs_epochs:
+        _prepare_epoch(builder, epoch, nav, hatch_filter, sat_states, systems)
+        if len(builder) >= chunk_size:
+            yield builder.build()
+            builder = EpochBatchBuilder()
+    if len(builder) > 0:
+        yield builder.build()
+
+
+def _prepare_epoch(builder, epoch, nav, hatch_filter=None, sat_states=None, systems="G", min_satellites=4):
+    """
+    Chuẩn bị dữ liệu cho MỘT epoch OBS và thêm vào builder
+    (bỏ qua epoch nếu có ít hơn min_satellites vệ tinh hợp lệ; mặc định 4 để giải vị trí).
+    sat_states là nguồn trạng thái vệ tinh; mặc định BroadcastSatelliteStates(nav).
+    """
+    if sat_states is None:
+        sat_states = BroadcastSatelliteStates(nav)
+
+    dt = epoch["time"]
+    # Chuyển đổi thời gian thu (Receiver Time) sang GPS SOW
+    week, t_r = datetime_to_gps_sow(dt)
+
+    builder.begin_epoch(dt, t_r)
+
+    for prn, o in epoch["observations"].items():
+        # Chỉ xử lý vệ tinh thuộc các hệ thống được chọn và có dữ liệu NAV
+        if prn[0] not in systems:
+            continue
+        if prn not in sat_states:
+            continue
+
+        # Chỉ xử lý nếu có dữ liệu giả khoảng cách C1C (L1 C/A code)
+        if "C1C" not in o:
+            continue
+
+        rho_raw = o["C1C"]["value"]
+
+        # Bước sóng L1/G1 (GLONASS: theo số kênh tần số của vệ tinh)
+        wavelength = carrier_wavelength(nav, prn, t_r)
+        if wavelength is None:
+            continue
+
+        # --- BƯỚC 0 (TÙY CHỌN): Làm trơn pseudorange bằng pha sóng mang L1C ---
+        # Cập nhật cả khi vệ tinh bị loại ở các bước sau để giữ tính liên tục của bộ lọc
+        if hatch_filter is not None:
+            phase = o.get("L1C")
+            rho_raw = hatch_filter.update(prn, week * 604800.0 + t_r, rho_raw,
+                                          phase["value"] if phase else None,
+                                          wavelength,
+                                          phase["lli"] if phase else None)
+
+        # --- BƯỚC 1: Lấy TGD để hiệu chỉnh Pseudorange ---
+        # Tìm ephemeris sơ bộ (dựa trên t_r) để lấy TGD
+        # TGD (Total Group Delay): Độ trễ phần cứng giữa tần số L1 và L2.
+        # Người dùng đơn tần L1 CẦN trừ giá trị này khỏi pseudorange đo được.
+        tgd = sat_states.group_delay(prn, t_r)
+        if tgd is None:
+            continue
+
+        # Pseudorange đã hiệu chỉnh TGD
+        rho_corr = rho_raw - c*tgd
+
+        # --- BƯỚC 2: Ước tính thời gian phát (Transmission Time) ---
+        # Thời gian bay = Quãng đường / Tốc độ ánh sáng
+        t_travel = rho_corr / c
+        # Thời gian phát (t_s) = Thời gian thu (t_r) - Thời gian bay
+        t_s = t_r - t_travel
+
+        # --- BƯỚC 3 + 4: Tìm Ephemeris tại thời điểm phát, tính vị trí, vận tốc và đồng hồ vệ tinh ---
+        # Trả về: Tọa độ, vận tốc, sai số đồng hồ (đã tính tương đối tính) và tốc độ trôi
+        # (vận tốc được tính giải tích trong cùng một lần giải Kepler)
+        state = sat_states.state(prn, t_r, t_s)
+        if state is None:
+            continue
+        X, Y, Z, dt_sat, VX, VY, VZ, ddt_sat = state
+
+        # ===========================================================
+        # BƯỚC 5: HIỆU CHỈNH QUAY TRÁI ĐẤT (SAGNAC EFFECT)
+        # ===========================================================
+        # Trong thời gian tín hiệu bay từ vệ tinh xuống máy thu
+        # Trái Đất đã tự quay một góc nhỏ. Hệ tọa độ ECEF gắn với Trái Đất cũng quay theo.
+        # Cần xoay tọa độ vệ tinh (tại t_phát) sang hệ quy chiếu ECEF (tại t_thu).
+        
+        # Ước lượng thời gian lan truyền tín hiệu (travel time)
+        # t_travel = rho_corr / c
+        
+        # Góc quay của Trái Đất trong thời gian đó
+        theta = OMEGA_E_DOT * t_travel
+
+        # Phép xoay trục Z
+        X_rot = X*math.cos(theta) + Y*math.sin(theta)
+        Y_rot = -X*math.sin(theta) + Y*math.cos(theta)
+        Z_rot = Z
+        # Véc-tơ vận tốc được xoay cùng góc
+        VX_rot = VX*math.cos(theta) + VY*math.sin(theta)
+        VY_rot = -VX*math.sin(theta) + VY*math.cos(theta)
+
+        # Doppler D1C (Hz) -> range rate (m/s): dấu âm vì Doppler dương khi vệ tinh tiến lại gần
+        range_rate = math.nan
+        if "D1C" in o:
+            range_rate = -o["D1C"]["value"] * wavelength
 
-            # Lưu dữ liệu sạch vào cấu trúc để Solver sử dụng
-            epoch_struct["satellites"].append({
-                "prn": prn,
-                "pseudorange": rho_corr,       # Pseudorange đã trừ TGD
-                "sat_pos_ecef": (X_rot, Y_rot, Z_rot),     # Vị trí vệ tinh tại t_s (hệ ECEF t_r)
-                "sat_clock_corr_meters": c * dt_sat # Sai số đồng hồ vệ tinh (đổi ra mét)
-            })
+        # Lưu dữ liệu sạch vào batch để Solver sử dụng:
+        # Pseudorange đã trừ TGD, vị trí vệ tinh tại t_s (hệ ECEF t_r),
+        # sai số đồng hồ vệ tinh (đổi ra mét), vận tốc và tốc độ trôi đồng hồ (m/s), range rate
+        builder.add_satellite(prn, rho_corr, X_rot, Y_rot, Z_rot, c * dt_sat,
+                              VX_rot, VY_rot, VZ, c * ddt_sat, range_rate)
 
-        # Chỉ giữ lại các epoch có đủ số lượng vệ tinh tối thiểu (4) để giải
-        if len(epoch_struct["satellites"]) >= 4:
-            epochs.append(epoch_struct)
+    # Chỉ giữ lại các epoch có đủ số lượng vệ tinh tối thiểu (4 khi giải vị trí)
+    builder.end_epoch(min_satellites=min_satellites)
 
-    return epochs
 
 
 
@@ -171,15 +321,16 @@ if __name__ == "__main__":
         # In ra dữ liệu đã chuẩn bị cho epoch đầu tiên
         first_epoch_data = solver_data[0]
         print(f"\n--- DỮ LIỆU ĐÃ SẴN SÀNG CHO BỘ GIẢI (EPOCH ĐẦU TIÊN) ---")
-        print(f"Thời gian (UTC): {first_epoch_data['time_utc']}")
-        print(f"Thời gian (SOW): {first_epoch_data['time_sow']:.3f} s")
-        print(f"Tìm thấy {len(first_epoch_data['satellites'])} vệ tinh GPS hợp lệ:")
+        print(f"Thời gian (UTC): {first_epoch_data.time_utc}")
+        print(f"Thời gian (SOW): {first_epoch_data.time_sow:.3f} s")
+        print(f"Tìm thấy {len(first_epoch_data)} vệ tinh GPS hợp lệ:")
 
         # In thông tin của 4 vệ tinh đầu tiên
-        for sat in first_epoch_data['satellites'][:4]:
-            print(f"  --- Vệ tinh: {sat['prn']} ---")
-            print(f"    Pseudorange (rho_i):  {sat['pseudorange']:12.3f} m")
-            print(f"    Sat. Pos (X_s):       {sat['sat_pos_ecef'][0]:12.3f} m")
-            print(f"    Sat. Pos (Y_s):       {sat['sat_pos_ecef'][1]:12.3f} m")
-            print(f"    Sat. Pos (Z_s):       {sat['sat_pos_ecef'][2]:12.3f} m")
-            print(f"    Sat. Clock correction:{sat['sat_clock_corr_meters'] * 1e9 / c:12.3f} ns")
\ No newline at end of file
+        for j in range(min(4, len(first_epoch_data))):
+            sat_pos = first_epoch_data.sat_pos_ecef[j]
+            print(f"  --- Vệ tinh: {first_epoch_data.prn[j]} ---")
+            print(f"    Pseudorange (rho_i):  {first_epoch_data.pseudorange[j]:12.3f} m")
+            print(f"    Sat. Pos (X_s):       {sat_pos[0]:12.3f} m")
+            print(f"    Sat. Pos (Y_s):       {sat_pos[1]:12.3f} m")
+            print(f"    Sat. Pos (Z_s):       {sat_pos[2]:12.3f} m")
+            print(f"    Sat. Clock correction:{first_epoch_data.sat_clock_corr_meters[j] * 1e9 / c:12.3f} ns")
\ No newline at end of file
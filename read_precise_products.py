@@ -0,0 +1,310 @@
+import datetime
+import math
+import sys
+import numpy as np
+from prepare_inputs import datetime_to_gps_sow, select_ephemeris
+
+c = 2.99792458e8
+
+# Giá trị đánh dấu "không có dữ liệu" trong SP3
+SP3_BAD_CLOCK = 999999.0
+
+
+def _gps_seconds(dt):
+    """Số giây GPS kể từ mốc GPS (1980-01-06) của một datetime (giả định đã là giờ GPS)."""
+    week, sow = datetime_to_gps_sow(dt)
+    return week * 604800.0 + sow
+
+
+def _parse_epoch(fields):
+    """['2025', '8', '28', '0', '0', '0.00000000'] -> datetime."""
+    year, month, day, hour, minute = (int(v) for v in fields[:5])
+    sec_full = float(fields[5])
+    second = int(sec_full)
+    microsecond = int(round((sec_full - second) * 1_000_000))
+    return datetime.datetime(year, month, day, hour, minute, second) + datetime.timedelta(microseconds=microsecond)
+
+
+class GriddedSeries:
+    """
+    Chuỗi giá trị của nhiều vệ tinh trên cùng một lưới thời gian đều, lưu dạng mảng NumPy dày
+    values (n_sat x n_epoch x n_comp); ô thiếu dữ liệu là NaN.
+
+    Nội suy Lagrange bậc `order` (order + 1 điểm mốc) dùng dạng barycentric: với các mốc cách đều
+    trọng số w_j = (-1)^j * C(order, j) được tính trước một lần, và đoạn mốc cần dùng được xác định
+    trực tiếp (O(1)) từ (t - t0) / step thay vì tìm kiếm trong danh sách bản ghi.
+    """
+
+    def __init__(self, prns, t0, step, values, order):
+        """
+        Args:
+            prns (list): Mã vệ tinh theo thứ tự hàng của values.
+            t0 (float): Thời điểm của mốc đầu tiên (giây GPS kể từ 1980-01-06).
+            step (float): Khoảng cách giữa hai mốc (giây).
+            values (ndarray): n_sat x n_epoch x n_comp.
+            order (int): Bậc đa thức nội suy (1 = tuyến tính).
+        """
+        self.prns = list(prns)
+        self.index = {prn: k for k, prn in enumerate(self.prns)}
+        self.t0 = t0
+        self.step = step
+        self.values = values
+        self.order = min(order, values.shape[1] - 1)
+
+        n = self.order
+        self._nodes = np.arange(n + 1, dtype=np.float64)
+        self._weights = np.array([(-1) ** j * math.comb(n, j) for j in range(n + 1)], dtype=np.float64)
+
+    @property
+    def t_end(self):
+        return self.t0 + self.step * (self.values.shape[1] - 1)
+
+    def __contains__(self, prn):
+        return prn in self.index
+
+    def interpolate(self, prn, t):
+        """
+        Nội suy giá trị của vệ tinh prn tại (các) thời điểm t (giây GPS, vô hướng hoặc mảng).
+
+        Returns:
+            ndarray (len(t) x n_comp); NaN nếu t nằm ngoài lưới hoặc đoạn mốc có dữ liệu thiếu.
+        """
+        series = self.values[self.index[prn]]
+        n_epoch = series.shape[0]
+        n_points = self.order + 1
+
+        t = np.atleast_1d(np.asarray(t, dtype=np.float64))
+        x = (t - self.t0) / self.step
+
+        # Chỉ số mốc đầu của đoạn: đặt t ở giữa đoạn (lệch sát biên thì dịch đoạn vào trong lưới)
+        start = np.floor(x).astype(np.int64) - (n_points // 2 - 1)
+        start = np.clip(start, 0, n_epoch - n_points)
+        u = x - start
+        f = series[start[:, None] + np.arange(n_points)]   # m x n_points x n_comp
+
+        diff = u[:, None] - self._nodes
+        on_node = diff == 0.0
+        diff[on_node] = 1.0
+        coef = self._weights / diff
+        # Trùng mốc: công thức barycentric suy biến, lấy đúng giá trị tại mốc
+        coef = np.where(on_node.any(axis=1, keepdims=True), on_node.astype(np.float64), coef)
+        result = np.einsum('mj,mjk->mk', coef, f) / coef.sum(axis=1)[:, None]
+
+        outside = (x < 0.0) | (x > n_epoch - 1)
+        result[outside] = np.nan
+        return result
+
+
+def _build_series(epochs, records, n_comp, order, step=None):
+    """
+    Dựng GriddedSeries từ danh sách thời điểm (giây GPS) và records {prn: [(t, values), ...]}.
+    Bước lưới lấy từ tham số (header) hoặc khoảng cách nhỏ nhất giữa hai epoch liên tiếp.
+    """
+    times = np.unique(np.asarray(epochs, dtype=np.float64))
+    if len(times) < 2:
+        print("Lỗi: Cần ít nhất 2 epoch để nội suy.", file=sys.stderr)
+        return None
+    if not step:
+        step = float(np.min(np.diff(times)))
+    t0 = times[0]
+    n_epoch = int(round((times[-1] - t0) / step)) + 1
+
+    prns = sorted(records)
+    values = np.full((len(prns), n_epoch, n_comp), np.nan)
+    for k, prn in enumerate(prns):
+        rows = records[prn]
+        idx = np.rint((np.array([r[0] for r in rows]) - t0) / step).astype(np.int64)
+        values[k, idx] = [r[1] for r in rows]
+    return GriddedSeries(prns, t0, step, values, order)
+
+
+def read_sp3(file_path, order=9, clock_order=1):
+    """
+    Đọc file quỹ đạo chính xác SP3 (c/d).
+
+    Args:
+        file_path (str): Đường dẫn file SP3.
+        order (int): Bậc nội suy Lagrange cho vị trí (mặc định 9, tức 10 điểm mốc).
+        clock_order (int): Bậc nội suy cho đồng hồ SP3 (mặc định tuyến tính).
+
+    Returns:
+        dict: {'positions': GriddedSeries (mét, ECEF), 'clocks': GriddedSeries (giây)},
+              hoặc None nếu không đọc được file.
+    """
+    step = None
+    epochs = []
+    positions = {}
+    clocks = {}
+    t = None
+
+    try:
+        with open(file_path, 'r') as f:
+            for line in f:
+                if line.startswith('##'):
+                    # Dòng 2 của header: GPS week, SOW, khoảng cách epoch (giây)
+                    try:
+                        step = float(line[24:38])
+                    except ValueError:
+                        step = None
+                elif line.startswith('*'):
+                    try:
+                        t = _gps_seconds(_parse_epoch(line[1:].split()))
+                        epochs.append(t)
+                    except (ValueError, IndexError) as e:
+                        print(f"Lỗi khi phân tích epoch SP3: '{line.strip()}'. Lỗi: {e}", file=sys.stderr)
+                        t = None
+                elif line.startswith('P') and t is not None:
+                    prn = line[1:4].replace(' ', '0')
+                    try:
+                        x, y, z = float(line[4:18]), float(line[18:32]), float(line[32:46])
+                        clk_str = line[46:60].strip()
+                        clk = float(clk_str) if clk_str else SP3_BAD_CLOCK
+                    except ValueError:
+                        continue
+                    # Vị trí 0.000000 nghĩa là không có dữ liệu
+                    if x != 0.0 or y != 0.0 or z != 0.0:
+                        positions.setdefault(prn, []).append((t, (x * 1e3, y * 1e3, z * 1e3)))
+                    if abs(clk) < SP3_BAD_CLOCK:
+                        clocks.setdefault(prn, []).append((t, (clk * 1e-6,)))
+                elif line.startswith('EOF'):
+                    break
+    except FileNotFoundError:
+        print(f"Lỗi: Không tìm thấy file tại {file_path}", file=sys.stderr)
+        return None
+
+    if not positions:
+        print(f"Lỗi: Không có bản ghi vị trí trong {file_path}", file=sys.stderr)
+        return None
+
+    return {
+        'positions': _build_series(epochs, positions, 3, order, step),
+        'clocks': _build_series(epochs, clocks, 1, clock_order, step) if clocks else None,
+    }
+
+
+def read_rinex_clk(file_path, order=1):
+    """
+    Đọc file đồng hồ chính xác RINEX CLK, chỉ lấy các bản ghi đồng hồ vệ tinh (AS).
+
+    Returns:
+        GriddedSeries: sai số đồng hồ vệ tinh (giây), hoặc None nếu không đọc được file.
+    """
+    epochs = []
+    clocks = {}
+
+    try:
+        with open(file_path, 'r') as f:
+            for line in f:
+                if "END OF HEADER" in line:
+                    break
+            for line in f:
+                if not line.startswith('AS '):
+                    continue
+                parts = line.split()
+                try:
+                    t = _gps_seconds(_parse_epoch(parts[2:8]))
+                    bias = float(parts[9].replace('D', 'E'))
+                except (ValueError, IndexError) as e:
+                    print(f"Lỗi khi phân tích bản ghi CLK: '{line.strip()}'. Lỗi: {e}", file=sys.stderr)
+                    continue
+                epochs.append(t)
+                clocks.setdefault(parts[1], []).append((t, (bias,)))
+    except FileNotFoundError:
+        print(f"Lỗi: Không tìm thấy file tại {file_path}", file=sys.stderr)
+        return None
+
+    if not clocks:
+        print(f"Lỗi: Không có bản ghi đồng hồ vệ tinh (AS) trong {file_path}", file=sys.stderr)
+        return None
+    return _build_series(epochs, clocks, 1, order)
+
+
+class PreciseSatelliteStates:
+    """
+    Nguồn trạng thái vệ tinh từ sản phẩm chính xác (SP3 + CLK), dùng thay cho ephemeris quảng bá
+    trong prepare_basic_solver_inputs(..., sat_states=...).
+
+    Vận tốc và tốc độ trôi đồng hồ lấy bằng sai phân trung tâm của đa thức nội suy.
+    Đồng hồ chính xác không chứa hiệu chỉnh tương đối tính nên được cộng thêm -2 (r.v) / c^2.
+    TGD lấy từ ephemeris quảng bá nếu có nav (đồng hồ chính xác quy về tổ hợp P1/P2).
+    """
+
+    def __init__(self, positions, clocks=None, nav=None, derivative_step=0.5):
+        """
+        Args:
+            positions (GriddedSeries): Vị trí vệ tinh, ví dụ read_sp3(...)['positions'].
+            clocks (GriddedSeries hoặc None): Đồng hồ vệ tinh (read_rinex_clk); None = dùng đồng hồ SP3.
+            nav (dict hoặc LazyNavigation hoặc None): Dữ liệu NAV để lấy TGD.
+            derivative_step (float): Bước (giây) của sai phân trung tâm.
+        """
+        self.positions = positions
+        self.clocks = clocks
+        self.nav = nav
+        self.h = derivative_step
+
+    def __contains__(self, prn):
+        return prn in self.positions and self.clocks is not None and prn in self.clocks
+
+    def _absolute_time(self, sow):
+        """Đổi giây trong tuần sang giây GPS, chọn tuần gần giữa lưới SP3 nhất."""
+        center = 0.5 * (self.positions.t0 + self.positions.t_end)
+        week = round((center - sow) / 604800.0)
+        return week * 604800.0 + sow
+
+    def group_delay(self, prn, t_r):
+        if self.nav is None or prn not in self.nav:
+            return 0.0
+        eph = select_ephemeris(self.nav, prn, t_r)
+        if not eph:
+            return 0.0
+        return eph.get("TGD", 0.0) or 0.0
+
+    def state(self, prn, t_r, t_s):
+        t = self._absolute_time(t_s)
+        times = np.array([t - self.h, t, t + self.h])
+        pos = self.positions.interpolate(prn, times)
+        clk = self.clocks.interpolate(prn, times)[:, 0]
+        if np.isnan(pos).any() or np.isnan(clk).any():
+            return None
+
+        vel = (pos[2] - pos[0]) / (2.0 * self.h)
+        ddt_sat = (clk[2] - clk[0]) / (2.0 * self.h)
+        dt_sat = clk[1] - 2.0 * float(np.dot(pos[1], vel)) / c**2
+        X, Y, Z = pos[1]
+        return (float(X), float(Y), float(Z), float(dt_sat),
+                float(vel[0]), float(vel[1]), float(vel[2]), float(ddt_sat))
+
+
+def load_precise_states(sp3_file, clk_file=None, nav=None):
+    """
+    Đọc SP3 (và CLK nếu có) rồi tạo PreciseSatelliteStates.
+    Trả về None nếu không đọc được sản phẩm.
+    """
+    sp3 = read_sp3(sp3_file)
+    if sp3 is None or sp3['positions'] is None:
+        return None
+    clocks = read_rinex_clk(clk_file) if clk_file else sp3['clocks']
+    if clocks is None:
+        print("Lỗi: Không có dữ liệu đồng hồ vệ tinh chính xác.", file=sys.stderr)
+        return None
+    return PreciseSatelliteStates(sp3['positions'], clocks, nav)
+
+
+# --- VÍ DỤ SỬ DỤNG ---
+if __name__ == "__main__":
+    from lazy_nav import LazyNavigation
+    from prepare_inputs import prepare_basic_solver_inputs
+    from solve_navigation_equations import solve_epoch_batch
+
+    NAV_FILE = '2908-nav-base.nav' # File .nav (chỉ dùng lấy TGD)
+    OBS_FILE = 'test.obs' # File .obs
+    SP3_FILE = 'igs.sp3' # File quỹ đạo chính xác
+    CLK_FILE = 'igs.clk' # File đồng hồ chính xác
+
+    sat_states = load_precise_states(SP3_FILE, CLK_FILE, LazyNavigation(NAV_FILE))
+    if sat_states:
+        batch = prepare_basic_solver_inputs(NAV_FILE, OBS_FILE, sat_states=sat_states)
+        solutions = solve_epoch_batch(batch, [0, 0, 0])
+        print(f"Đã giải {len(batch)} epoch với quỹ đạo/đồng hồ chính xác")
+        if len(batch):
+            print(f"Nghiệm epoch đầu tiên: {np.round(solutions[0], 3)}")
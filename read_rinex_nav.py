@@ -2,6 +2,14 @@ import datetime
 import sys
 import collections # Dùng defaultdict cho tiện
 
+# Số giây nhuận GPS - UTC (từ 01/2017). Thời điểm tham chiếu tb của GLONASS được ghi theo UTC.
+GPS_UTC_LEAP_SECONDS = 18
+
+# Số dòng orbit sau dòng SV/EPOCH/SV CLK của mỗi hệ thống (RINEX 3.02).
+# GLONASS và SBAS phát véc-tơ trạng thái (3 dòng); các hệ thống khác dùng tham số Kepler (7 dòng).
+NAV_ORBIT_LINES = {'R': 3, 'S': 3}
+KEPLER_ORBIT_LINES = 7
+
 def _parse_float(s):
     """
     Hàm phụ trợ để phân tích chuỗi số thực RINEX (bao gồm mũ 'D').
@@ -25,10 +33,206 @@ def _parse_float(s):
             print(f"Warning: Could not parse float from '{s}'", file=sys.stderr)
             return None # Trả về None nếu không parse được
 
+def _parse_record_epoch(line1):
+    """Thời điểm tham chiếu (datetime) trong dòng SV/EPOCH/SV CLK."""
+    year = int(line1[4:8])
+    month = int(line1[9:11])
+    day = int(line1[12:14])
+    hour = int(line1[15:17])
+    minute = int(line1[18:20])
+    # Xử lý giây cẩn thận hơn
+    sec_str = line1[21:23]
+    second = float(sec_str) if sec_str.strip() else 0.0
+    return datetime.datetime(year, month, day, hour, minute, int(second), int((second % 1)*1e6) )
+
+def _glonass_toe(line1):
+    """
+    Thời điểm tham chiếu tb của bản ghi GLONASS (ghi theo UTC) đổi sang giây trong tuần GPS.
+    """
+    epoch_time = _parse_record_epoch(line1)
+    gps_seconds = (epoch_time - datetime.datetime(1980, 1, 6)).total_seconds() + GPS_UTC_LEAP_SECONDS
+    return gps_seconds % 604800.0
+
+def _parse_nav_record(line1, orbit_lines):
+    """
+    Phân tích một bản ghi ephemeris dạng Kepler (dòng SV/EPOCH/SV CLK + 7 dòng orbit).
+    Dùng chung cho read_rinex_nav và bộ đọc lười (LazyNavigation).
+
+    Returns:
+        dict: Tham số ephemeris (xem read_rinex_nav).
+    Raises:
+        ValueError, IndexError, TypeError: nếu bản ghi bị hỏng hoặc thiếu tham số bắt buộc.
+    """
+    epoch_time = _parse_record_epoch(line1)
+
+    sv_clock_bias = _parse_float(line1[23:42]) # a0
+    sv_clock_drift = _parse_float(line1[42:61]) # a1
+    sv_clock_drift_rate = _parse_float(line1[61:80]) # a2
+
+    # Phân tích 7 dòng orbit parameters
+    params_list = []
+    for line in orbit_lines:
+        # Xử lý các dòng trống (nếu có) BÊN TRONG một bản ghi
+        if not line.strip():
+            params_list.extend([None, None, None, None])
+            continue
+
+        # Lấy 4 tham số trên mỗi dòng orbit
+        for k in range(4, 80, 19):
+            if k < len(line): # Đảm bảo dòng đủ dài
+                chunk = line[k:min(k+19, len(line))]
+            else:
+                chunk = "" # Nếu dòng quá ngắn
+            params_list.append(_parse_float(chunk))
+    
+    # --- Kiểm tra các tham số quan trọng (BUG 5) ---
+    # Kiểm tra xem các giá trị BẮT BUỘC có bị None không
+    critical_indices = [3, 5, 7, 8, 9, 10, 11, 12, 14, 15, 16] # M0, e, sqrt_a, Toe, etc.
+    
+
+    # --- Kiểm tra số lượng tham số đọc được ---
+    # Cần ít nhất 17 tham số orbit (đến i_dot) từ dòng 2-6
+    # Chuẩn RINEX v3 có thể có tới 28 tham số (hết dòng 8)
+    if len(params_list) < 17:
+         raise ValueError(f"Incomplete parameter list ({len(params_list)} < 17)")
+
+    if sv_clock_bias is None or sv_clock_drift is None or sv_clock_drift_rate is None:
+         raise ValueError(f"Clock parameter is None.")
+
+    for i in critical_indices:
+        if params_list[i] is None:
+            raise ValueError(f"Critical parameter {i} ('{params_list[i]}') is None.")
+
+    # --- Gán tham số vào dictionary theo tên chuẩn ---
+    # Thứ tự tham số trong list tương ứng với thứ tự trong file RINEX v3
+    # Ánh xạ tới tên trong Bảng 3.8 và/hoặc tên chuẩn RINEX
+    epoch_params = {
+        'epoch': epoch_time,
+        # Clock (từ line1) - Đặt tên theo Bảng 3.8
+        'a0': sv_clock_bias,
+        'a1': sv_clock_drift,
+        'a2': sv_clock_drift_rate,
+        # Orbit params (từ params_list) - Tên theo Bảng 3.8 / RINEX chuẩn
+        'IODE': params_list[0],  # Hoặc Issue of Data, Ephemeris
+        'Crs': params_list[1],
+        'Delta_n': params_list[2], # Delta n
+        'M0': params_list[3],      # Mean Anomaly at Reference Time
+        'Cuc': params_list[4],
+        'e': params_list[5],       # Eccentricity
+        'Cus': params_list[6],
+        'sqrt_a': params_list[7],  # Square Root of Semi-Major Axis
+        'Toe': params_list[8],     # Time of Ephemeris (sec of GPS week) -> t_oe
+        'Cic': params_list[9],
+        'Omega0': params_list[10], # Longitude of Ascending Node of Orbit Plane at Weekly Epoch -> Omega_r
+        'Cis': params_list[11],
+        'i0': params_list[12],     # Inclination Angle at Reference Time
+        'Crc': params_list[13],
+        'omega': params_list[14],  # Argument of Perigee
+        'Omega_dot': params_list[15], # Rate of Right Ascension -> Omega dot
+        'i_dot': params_list[16],  # Rate of Inclination Angle -> i dot
+        # Các tham số tùy chọn khác từ dòng 6, 7, 8 (nếu có)
+        'L2_codes': params_list[17] if len(params_list) > 17 else None, # Codes on L2 channel
+        'GPS_Week': params_list[18] if len(params_list) > 18 else None, # GPS Week Number (truncated)
+        'L2_Pflag': params_list[19] if len(params_list) > 19 else None, # L2 P data flag
+        'SV_acc': params_list[20] if len(params_list) > 20 else None,   # SV accuracy (m)
+        'SV_health': params_list[21] if len(params_list) > 21 else None, # SV health (bits 17-22 w 4 sf 1)
+        'TGD': params_list[22] if len(params_list) > 22 else None,      # Total Group Delay (L1/L2) (sec)
+        'IODC': params_list[23] if len(params_list) > 23 else None,     # Issue of Data, Clock
+        'TransTime': params_list[24] if len(params_list) > 24 else None, # Transmission time of message (sec of GPS week)
+        'FitInterval': params_list[25] if len(params_list) > 25 else None, # Fit interval (hours) - GPS/QZSS only
+    }
+    return epoch_params
+
+def _parse_glonass_record(line1, orbit_lines):
+    """
+    Phân tích một bản ghi GLONASS (dòng SV/EPOCH/SV CLK + 3 dòng orbit).
+    GLONASS phát véc-tơ trạng thái trong hệ PZ-90 tại thời điểm tb thay vì tham số Kepler;
+    vị trí, vận tốc, gia tốc được đổi từ km sang mét.
+
+    Returns:
+        dict: {'epoch' (tb, UTC), 'Toe' (tb theo giây trong tuần GPS), 'TauN', 'GammaN', 'tk',
+               'X', 'Xdot', 'Xacc', 'Y', 'Ydot', 'Yacc', 'Z', 'Zdot', 'Zacc',
+               'health', 'freq_num', 'age'}
+    Raises:
+        ValueError, IndexError, TypeError: nếu bản ghi bị hỏng hoặc thiếu tham số bắt buộc.
+    """
+    epoch_time = _parse_record_epoch(line1)
+
+    minus_tau_n = _parse_float(line1[23:42]) # -TauN: sai số đồng hồ vệ tinh (giây)
+    gamma_n = _parse_float(line1[42:61])     # +GammaN: độ lệch tần số tương đối
+    tk = _parse_float(line1[61:80])          # Thời điểm khung bản tin (giây trong tuần UTC)
+    if minus_tau_n is None or gamma_n is None:
+        raise ValueError("Clock parameter is None.")
+
+    params_list = []
+    for line in orbit_lines:
+        for k in range(4, 80, 19):
+            params_list.append(_parse_float(line[k:k+19]) if k < len(line) else None)
+    if len(params_list) < 12:
+        raise ValueError(f"Incomplete parameter list ({len(params_list)} < 12)")
+    for i in (0, 1, 2, 4, 5, 6, 8, 9, 10):
+        if params_list[i] is None:
+            raise ValueError(f"Critical parameter {i} is None.")
+
+    return {
+        'epoch': epoch_time,
+        'Toe': _glonass_toe(line1),
+        'TauN': -minus_tau_n,
+        'GammaN': gamma_n,
+        'tk': tk,
+        'X': params_list[0] * 1e3, 'Xdot': params_list[1] * 1e3, 'Xacc': params_list[2] * 1e3,
+        'health': params_list[3],
+        'Y': params_list[4] * 1e3, 'Ydot': params_list[5] * 1e3, 'Yacc': params_list[6] * 1e3,
+        'freq_num': int(params_list[7]) if params_list[7] is not None else None, # Số kênh tần số (-7..+6)
+        'Z': params_list[8] * 1e3, 'Zdot': params_list[9] * 1e3, 'Zacc': params_list[10] * 1e3,
+        'age': params_list[11],                                                  # Tuổi dữ liệu (ngày)
+    }
+
+def _parse_record(line1, orbit_lines):
+    """Phân tích một bản ghi theo hệ thống vệ tinh (GLONASS: véc-tơ trạng thái, còn lại: Kepler)."""
+    if line1[0] == 'R':
+        return _parse_glonass_record(line1, orbit_lines)
+    return _parse_nav_record(line1, orbit_lines)
+
+def read_rinex_nav_header(file_path):
+    """
+    Đọc header của file RINEX Navigation để lấy các tham số tầng điện ly (Klobuchar).
+    Hỗ trợ cả nhãn RINEX v3 ('IONOSPHERIC CORR' với GPSA/GPSB)
+    và RINEX v2 ('ION ALPHA' / 'ION BETA').
+
+    Returns:
+        dict: {'ion_alpha': [a0..a3] hoặc None, 'ion_beta': [b0..b3] hoặc None}.
+              Trả về None nếu file không đọc được.
+    """
+    header = {'ion_alpha': None, 'ion_beta': None}
+    try:
+        with open(file_path, 'r') as f:
+            for line in f:
+                label = line[60:].strip()
+                if label == 'END OF HEADER':
+                    break
+                if label == 'IONOSPHERIC CORR':
+                    key = {'GPSA': 'ion_alpha', 'GPSB': 'ion_beta'}.get(line[0:4])
+                    if key:
+                        header[key] = [_parse_float(line[5 + 12*k:17 + 12*k]) for k in range(4)]
+                elif label in ('ION ALPHA', 'ION BETA'):
+                    key = 'ion_alpha' if label == 'ION ALPHA' else 'ion_beta'
+                    header[key] = [_parse_float(line[2 + 12*k:14 + 12*k]) for k in range(4)]
+    except FileNotFoundError:
+        print(f"Error: File not found at {file_path}", file=sys.stderr)
+        return None
+
+    # Bỏ qua bộ tham số nếu có giá trị không đọc được
+    for key in ('ion_alpha', 'ion_beta'):
+        if header[key] is not None and None in header[key]:
+            header[key] = None
+    return header
+
 def read_rinex_nav(file_path):
     """
-    Đọc file GPS Navigation RINEX v3.0x  và trích xuất
+    Đọc file Navigation RINEX v3.0x  và trích xuất
     các tham số ephemeris cần thiết để tính toán tọa độ vệ tinh
+    (tham số Kepler cho GPS/Galileo/BeiDou/QZSS/IRNSS, véc-tơ trạng thái cho GLONASS)
     Phiên bản này đã sửa lỗi để xử lý các file .nav có dòng trống hoặc không mong muốn.
 
     Args:
@@ -62,115 +266,36 @@ def read_rinex_nav(file_path):
                 if not line1.strip(): # Bỏ qua dòng trống
                     continue
 
+                # Phân tích dòng 1
+                sat_prn = line1[0:3].strip() 
+
+                # *** SỬA LỖI CHÍNH (BUG 3) ***
+                # Nếu dòng này không phải là một PRN hợp lệ, 
+                # chỉ bỏ qua dòng NÀY và tiếp tục tìm.
+                # KHÔNG bỏ qua 7 dòng tiếp theo.
+                if not sat_prn or sat_prn[0] not in 'GECJIRS': 
+                    # print(f"Warning: Skipping non-record line: '{line1.strip()}'", file=sys.stderr)
+                    continue # Chỉ bỏ qua dòng này, lặp lại vòng while
+
                 try:
-                    # Phân tích dòng 1
-                    sat_prn = line1[0:3].strip() 
-
-                    # *** SỬA LỖI CHÍNH (BUG 3) ***
-                    # Nếu dòng này không phải là một PRN hợp lệ, 
-                    # chỉ bỏ qua dòng NÀY và tiếp tục tìm.
-                    # KHÔNG bỏ qua 7 dòng tiếp theo.
-                    if not sat_prn or sat_prn[0] not in 'GECJIRS': 
-                        # print(f"Warning: Skipping non-record line: '{line1.strip()}'", file=sys.stderr)
-                        continue # Chỉ bỏ qua dòng này, lặp lại vòng while
-
-                    year = int(line1[4:8])
-                    month = int(line1[9:11])
-                    day = int(line1[12:14])
-                    hour = int(line1[15:17])
-                    minute = int(line1[18:20])
-                    # Xử lý giây cẩn thận hơn
-                    sec_str = line1[21:23]
-                    second = float(sec_str) if sec_str.strip() else 0.0
-                    epoch_time = datetime.datetime(year, month, day, hour, minute, int(second), int((second % 1)*1e6) )
-
-                    sv_clock_bias = _parse_float(line1[23:42]) # a0
-                    sv_clock_drift = _parse_float(line1[42:61]) # a1
-                    sv_clock_drift_rate = _parse_float(line1[61:80]) # a2
-
-                    # Đọc 7 dòng orbit parameters
-                    params_list = []
-                    for i_line in range(7):
+                    # Đọc các dòng orbit parameters (7 dòng Kepler, 3 dòng GLONASS/SBAS)
+                    orbit_lines = []
+                    for i_line in range(NAV_ORBIT_LINES.get(sat_prn[0], KEPLER_ORBIT_LINES)):
                         line = f.readline()
                         if not line: # Nếu hết file giữa chừng
                             raise EOFError(f"Incomplete record for {sat_prn}. Reached EOF.")
-                        
-                        # Xử lý các dòng trống (nếu có) BÊN TRONG một bản ghi
-                        if not line.strip():
-                            params_list.extend([None, None, None, None])
-                            continue
-
-                        # Lấy 4 tham số trên mỗi dòng orbit
-                        for k in range(4, 80, 19):
-                            if k < len(line): # Đảm bảo dòng đủ dài
-                                chunk = line[k:min(k+19, len(line))]
-                            else:
-                                chunk = "" # Nếu dòng quá ngắn
-                            params_list.append(_parse_float(chunk))
-                    
-                    # --- Kiểm tra các tham số quan trọng (BUG 5) ---
-                    # Kiểm tra xem các giá trị BẮT BUỘC có bị None không
-                    critical_indices = [3, 5, 7, 8, 9, 10, 11, 12, 14, 15, 16] # M0, e, sqrt_a, Toe, etc.
-                    
-
-                    # --- Kiểm tra số lượng tham số đọc được ---
-                    # Cần ít nhất 17 tham số orbit (đến i_dot) từ dòng 2-6
-                    # Chuẩn RINEX v3 có thể có tới 28 tham số (hết dòng 8)
-                    if len(params_list) < 17:
-                         raise ValueError(f"Incomplete parameter list ({len(params_list)} < 17)")
-
-                    if sv_clock_bias is None or sv_clock_drift is None or sv_clock_drift_rate is None:
-                         raise ValueError(f"Clock parameter is None.")
-
-                    for i in critical_indices:
-                        if params_list[i] is None:
-                            raise ValueError(f"Critical parameter {i} ('{params_list[i]}') is None.")
-
-                    # --- Gán tham số vào dictionary theo tên chuẩn ---
-                    # Thứ tự tham số trong list tương ứng với thứ tự trong file RINEX v3
-                    # Ánh xạ tới tên trong Bảng 3.8 và/hoặc tên chuẩn RINEX
-                    epoch_params = {
-                        'epoch': epoch_time,
-                        # Clock (từ line1) - Đặt tên theo Bảng 3.8
-                        'a0': sv_clock_bias,
-                        'a1': sv_clock_drift,
-                        'a2': sv_clock_drift_rate,
-                        # Orbit params (từ params_list) - Tên theo Bảng 3.8 / RINEX chuẩn
-                        'IODE': params_list[0],  # Hoặc Issue of Data, Ephemeris
-                        'Crs': params_list[1],
-                        'Delta_n': params_list[2], # Delta n
-                        'M0': params_list[3],      # Mean Anomaly at Reference Time
-                        'Cuc': params_list[4],
-                        'e': params_list[5],       # Eccentricity
-                        'Cus': params_list[6],
-                        'sqrt_a': params_list[7],  # Square Root of Semi-Major Axis
-                        'Toe': params_list[8],     # Time of Ephemeris (sec of GPS week) -> t_oe
-                        'Cic': params_list[9],
-                        'Omega0': params_list[10], # Longitude of Ascending Node of Orbit Plane at Weekly Epoch -> Omega_r
-                        'Cis': params_list[11],
-                        'i0': params_list[12],     # Inclination Angle at Reference Time
-                        'Crc': params_list[13],
-                        'omega': params_list[14],  # Argument of Perigee
-                        'Omega_dot': params_list[15], # Rate of Right Ascension -> Omega dot
-                        'i_dot': params_list[16],  # Rate of Inclination Angle -> i dot
-                        # Các tham số tùy chọn khác từ dòng 6, 7, 8 (nếu có)
-                        'L2_codes': params_list[17] if len(params_list) > 17 else None, # Codes on L2 channel
-                        'GPS_Week': params_list[18] if len(params_list) > 18 else None, # GPS Week Number (truncated)
-                        'L2_Pflag': params_list[19] if len(params_list) > 19 else None, # L2 P data flag
-                        'SV_acc': params_list[20] if len(params_list) > 20 else None,   # SV accuracy (m)
-                        'SV_health': params_list[21] if len(params_list) > 21 else None, # SV health (bits 17-22 w 4 sf 1)
-                        'TGD': params_list[22] if len(params_list) > 22 else None,      # Total Group Delay (L1/L2) (sec)
-                        'IODC': params_list[23] if len(params_list) > 23 else None,     # Issue of Data, Clock
-                        'TransTime': params_list[24] if len(params_list) > 24 else None, # Transmission time of message (sec of GPS week)
-                        'FitInterval': params_list[25] if len(params_list) > 25 else None, # Fit interval (hours) - GPS/QZSS only
-                    }
+                        orbit_lines.append(line)
+
+                    # SBAS chưa được hỗ trợ: chỉ bỏ qua đúng số dòng của bản ghi
+                    if sat_prn[0] == 'S':
+                        continue
 
                     # Thêm vào dictionary chính
-                    ephemeris_data[sat_prn].append(epoch_params)
+                    ephemeris_data[sat_prn].append(_parse_record(line1, orbit_lines))
 
                 # *** SỬA LỖI CHÍNH (BUG 2) ***
                 except (ValueError, IndexError, TypeError, AttributeError, EOFError) as e:
-                    # Nếu CÓ LỖI khi đang đọc 8 dòng (vd: EOF, parse int/float lỗi,...)
+                    # Nếu CÓ LỖI khi đang đọc bản ghi (vd: EOF, parse int/float lỗi,...)
                     # Báo lỗi và BỎ QUA bản ghi này.
                     # Vòng lặp while True sẽ tự động đọc dòng tiếp theo
                     # để tìm 1 header mới. KHÔNG CẦN skip 7 dòng.
@@ -5,9 +5,10 @@ import collections
 def _parse_obs_value(chunk):
     """
     Hàm phụ trợ để phân tích một khối quan sát 16 ký tự (F14.3, I1, I1).
-    Trả về (value, ssi)
+    Trả về (value, lli, ssi)
     """
     value = None
+    lli = None
     ssi = None
 
     # Giá trị chính (F14.3) là 14 ký tự đầu tiên
@@ -19,6 +20,15 @@ def _parse_obs_value(chunk):
             except ValueError:
                 value = None  # Lỗi hoặc giá trị trống
 
+    # LLI (Loss of Lock Indicator, I1) là ký tự thứ 15 (index 14)
+    if len(chunk) >= 15:
+        lli_str = chunk[14:15].strip()
+        if lli_str:
+            try:
+                lli = int(lli_str)
+            except ValueError:
+                lli = None
+
     # SSI (I1) là ký tự thứ 16 (index 15)
     if len(chunk) >= 16:
         ssi_str = chunk[15:16].strip()  # Lấy ký tự tại index 15
@@ -28,7 +38,132 @@ def _parse_obs_value(chunk):
             except ValueError:
                 ssi = None  # Lỗi hoặc trống
 
-    return (value, ssi)
+    return (value, lli, ssi)
+
+def _read_obs_header(f):
+    """
+    Đọc phần header của file OBS (con trỏ file dừng ngay sau dòng END OF HEADER).
+    Trả về map obs_types: {'G': ['C1C', 'L1C', ...], 'R': ['C1C', 'L1C', ...]},
+    hoặc None nếu header không hợp lệ.
+    """
+    obs_types = {}
+
+    while True:
+        line = f.readline()
+        if not line:
+            print("Lỗi: File rỗng hoặc không có END OF HEADER.", file=sys.stderr)
+            return None
+        
+        if "SYS / # / OBS TYPES" in line:
+            parts = line.split()
+            sys_id = parts[0]  # 'G', 'R', 'E', ... 
+            
+            # Tìm vị trí kết thúc của danh sách types
+            end_index = -1
+            for i, part in enumerate(parts):
+                if part == 'SYS':
+                    end_index = i
+                    break
+            
+            if end_index != -1:
+                 # Lấy các loại quan sát (ví dụ: C1C, L1C, S1C, ...) 
+                obs_types[sys_id] = parts[2:end_index] 
+            
+            # (Bỏ qua xử lý các dòng tiếp theo (continuation lines) 
+            # vì file test.obs không sử dụng chúng)
+
+        if "END OF HEADER" in line:
+            break
+
+    if not obs_types:
+        print("Lỗi: Không tìm thấy 'SYS / # / OBS TYPES' trong header.", file=sys.stderr)
+        return None
+
+    return obs_types
+
+def _iter_obs_body(f, obs_types, with_offsets=False):
+    """
+    Đọc lần lượt từng epoch trong phần dữ liệu (Data Body) của file OBS.
+    Là generator: mỗi lần chỉ giữ một epoch trong bộ nhớ.
+
+    Nếu with_offsets=True, trả ra (epoch, offset) với offset là vị trí ngay sau dòng cuối
+    của epoch (dùng để đọc tiếp bằng f.seek), và dừng ở epoch chưa ghi xong (thiếu dòng
+    vệ tinh hoặc dòng cuối chưa có ký tự xuống dòng) thay vì trả ra epoch thiếu dữ liệu.
+    """
+    while True:
+        epoch_line = f.readline()
+        if not epoch_line:
+            break  # Hết file
+        if with_offsets and not epoch_line.endswith('\n'):
+            break  # Dòng epoch đang được ghi dở
+        
+        if epoch_line.startswith('>'):
+            # Bắt đầu một epoch mới
+            parts = epoch_line.split()
+            try:
+                year = int(parts[1])
+                month = int(parts[2])
+                day = int(parts[3])
+                hour = int(parts[4])
+                minute = int(parts[5])
+                sec_full = float(parts[6])
+                second = int(sec_full)
+                microsecond = int((sec_full - second) * 1_000_000)
+                
+                epoch_time = datetime.datetime(year, month, day, hour, minute, second, microsecond)
+                num_sats = int(parts[8])
+                
+                epoch_data = {
+                    "time": epoch_time,
+                    "observations": collections.defaultdict(dict)
+                }
+
+                # Đọc các dòng quan sát của N vệ tinh
+                complete = True
+                for _ in range(num_sats):
+                    obs_line = f.readline()
+                    if not obs_line or (with_offsets and not obs_line.endswith('\n')):
+                        complete = False
+                        break 
+                    
+                    prn = obs_line[0:3].strip() # ví dụ: 'G05', 'R21' [cite: 4390, 4392]
+                    sys_id = prn[0] # 'G', 'R', ...
+                    
+                    # Lấy danh sách các loại obs cho hệ thống này
+                    types_for_sys = obs_types.get(sys_id)
+                    if not types_for_sys:
+                        continue # Bỏ qua nếu không có định nghĩa (vd: 'S' cho SBAS)
+
+                    line_data = obs_line[3:] # Dữ liệu bắt đầu từ cột 4
+                    sat_obs = {}
+
+                    # Mỗi quan sát chiếm 16 ký tự
+                    for i, obs_code in enumerate(types_for_sys):
+                        start_idx = i * 16
+                        end_idx = start_idx + 16
+                        
+                        if len(line_data) < start_idx + 14: # Cần ít nhất 14 ký tự cho 1 giá trị
+                            break
+                        
+                        chunk = line_data[start_idx:end_idx]
+                        (value, lli, ssi) = _parse_obs_value(chunk)
+                        
+                        if value is not None:
+                            sat_obs[obs_code] = {"value": value, "lli": lli, "ssi": ssi}
+                    
+                    if sat_obs:
+                        epoch_data["observations"][prn] = sat_obs
+
+                if not with_offsets:
+                    yield epoch_data
+                elif complete:
+                    yield epoch_data, f.tell()
+                else:
+                    return  # Epoch cuối chưa ghi xong: lần đọc sau bắt đầu lại từ dòng epoch
+
+            except (ValueError, IndexError, TypeError) as e:
+                print(f"Lỗi khi phân tích epoch: '{epoch_line.strip()}'. Lỗi: {e}", file=sys.stderr)
+                continue
 
 def read_rinex_obs(file_path):
     """
@@ -46,8 +181,8 @@ def read_rinex_obs(file_path):
                       "time": datetime_object,
                       "observations": {
                           "G05": {
-                              "C1C": {"value": 20123456.789, "ssi": 7},
-                              "L1C": {"value": 109269531.790, "ssi": 7},
+                              "C1C": {"value": 20123456.789, "lli": None, "ssi": 7},
+                              "L1C": {"value": 109269531.790, "lli": 0, "ssi": 7},
                               ...
                           },
                           "R21": { ... },
@@ -57,110 +192,15 @@ def read_rinex_obs(file_path):
                   ...
               ]
     """
-    all_epochs_data = []
-    # obs_types sẽ lưu map: {'G': ['C1C', 'L1C', ...], 'R': ['C1C', 'L1C', ...]}
-    obs_types = {}  
-
     try:
         with open(file_path, 'r') as f:
             # --- 1. Đọc Header ---
-            while True:
-                line = f.readline()
-                if not line:
-                    print("Lỗi: File rỗng hoặc không có END OF HEADER.", file=sys.stderr)
-                    return None
-                
-                if "SYS / # / OBS TYPES" in line:
-                    parts = line.split()
-                    sys_id = parts[0]  # 'G', 'R', 'E', ... 
-                    
-                    # Tìm vị trí kết thúc của danh sách types
-                    end_index = -1
-                    for i, part in enumerate(parts):
-                        if part == 'SYS':
-                            end_index = i
-                            break
-                    
-                    if end_index != -1:
-                         # Lấy các loại quan sát (ví dụ: C1C, L1C, S1C, ...) 
-                        obs_types[sys_id] = parts[2:end_index] 
-                    
-                    # (Bỏ qua xử lý các dòng tiếp theo (continuation lines) 
-                    # vì file test.obs không sử dụng chúng)
-
-                if "END OF HEADER" in line:
-                    break
-
-            if not obs_types:
-                print("Lỗi: Không tìm thấy 'SYS / # / OBS TYPES' trong header.", file=sys.stderr)
+            obs_types = _read_obs_header(f)
+            if obs_types is None:
                 return None
 
             # --- 2. Đọc Dữ liệu (Data Body) ---
-            while True:
-                epoch_line = f.readline()
-                if not epoch_line:
-                    break  # Hết file
-                
-                if epoch_line.startswith('>'):
-                    # Bắt đầu một epoch mới
-                    parts = epoch_line.split()
-                    try:
-                        year = int(parts[1])
-                        month = int(parts[2])
-                        day = int(parts[3])
-                        hour = int(parts[4])
-                        minute = int(parts[5])
-                        sec_full = float(parts[6])
-                        second = int(sec_full)
-                        microsecond = int((sec_full - second) * 1_000_000)
-                        
-                        epoch_time = datetime.datetime(year, month, day, hour, minute, second, microsecond)
-                        num_sats = int(parts[8])
-                        
-                        epoch_data = {
-                            "time": epoch_time,
-                            "observations": collections.defaultdict(dict)
-                        }
-
-                        # Đọc các dòng quan sát của N vệ tinh
-                        for _ in range(num_sats):
-                            obs_line = f.readline()
-                            if not obs_line:
-                                break 
-                            
-                            prn = obs_line[0:3].strip() # ví dụ: 'G05', 'R21' [cite: 4390, 4392]
-                            sys_id = prn[0] # 'G', 'R', ...
-                            
-                            # Lấy danh sách các loại obs cho hệ thống này
-                            types_for_sys = obs_types.get(sys_id)
-                            if not types_for_sys:
-                                continue # Bỏ qua nếu không có định nghĩa (vd: 'S' cho SBAS)
-
-                            line_data = obs_line[3:] # Dữ liệu bắt đầu từ cột 4
-                            sat_obs = {}
-
-                            # Mỗi quan sát chiếm 16 ký tự
-                            for i, obs_code in enumerate(types_for_sys):
-                                start_idx = i * 16
-                                end_idx = start_idx + 16
-                                
-                                if len(line_data) < start_idx + 14: # Cần ít nhất 14 ký tự cho 1 giá trị
-                                    break
-                                
-                                chunk = line_data[start_idx:end_idx]
-                                (value, ssi) = _parse_obs_value(chunk)
-                                
-                                if value is not None:
-                                    sat_obs[obs_code] = {"value": value, "ssi": ssi}
-                            
-                            if sat_obs:
-                                epoch_data["observations"][prn] = sat_obs
-
-                        all_epochs_data.append(epoch_data)
-
-                    except (ValueError, IndexError, TypeError) as e:
-                        print(f"Lỗi khi phân tích epoch: '{epoch_line.strip()}'. Lỗi: {e}", file=sys.stderr)
-                        continue
+            return list(_iter_obs_body(f, obs_types))
 
     except FileNotFoundError:
         print(f"Lỗi: Không tìm thấy file tại {file_path}", file=sys.stderr)
@@ -169,7 +209,53 @@ def read_rinex_obs(file_path):
         print(f"Lỗi không mong muốn: {e}", file=sys.stderr)
         return None
 
-    return all_epochs_data
+def read_rinex_obs_header(file_path):
+    """
+    Đọc các thông tin trong header file OBS ngoài danh sách loại quan sát.
+
+    Returns:
+        dict: {'approx_position': [X, Y, Z] (mét, ECEF) hoặc None nếu header không có
+               APPROX POSITION XYZ}, hoặc None nếu không đọc được file.
+    """
+    header = {'approx_position': None}
+    try:
+        with open(file_path, 'r') as f:
+            for line in f:
+                if "APPROX POSITION XYZ" in line:
+                    try:
+                        header['approx_position'] = [float(line[0:14]), float(line[14:28]), float(line[28:42])]
+                    except ValueError:
+                        print(f"Lỗi khi phân tích APPROX POSITION XYZ: '{line.strip()}'", file=sys.stderr)
+                if "END OF HEADER" in line:
+                    break
+    except FileNotFoundError:
+        print(f"Lỗi: Không tìm thấy file tại {file_path}", file=sys.stderr)
+        return None
+    return header
+
+def iter_rinex_obs(file_path, start_offset=None, with_offsets=False):
+    """
+    Phiên bản streaming của read_rinex_obs: trả về generator, đọc và trả ra
+    từng epoch (cùng cấu trúc như read_rinex_obs) mà không nạp toàn bộ file vào bộ nhớ.
+    Nếu file không đọc được thì generator kết thúc ngay (không có epoch nào).
+
+    Args:
+        file_path (str): Đường dẫn file OBS.
+        start_offset (int hoặc None): Vị trí (byte) bắt đầu đọc phần dữ liệu, lấy từ offset
+            của một lần đọc trước; header vẫn được đọc để lấy danh sách loại quan sát.
+        with_offsets (bool): Trả ra (epoch, offset sau epoch) và bỏ qua epoch cuối nếu
+            chưa ghi xong (xem _iter_obs_body), dùng cho xử lý gia tăng (incremental.py).
+    """
+    try:
+        with open(file_path, 'r') as f:
+            obs_types = _read_obs_header(f)
+            if obs_types is None:
+                return
+            if start_offset is not None:
+                f.seek(start_offset)
+            yield from _iter_obs_body(f, obs_types, with_offsets)
+    except FileNotFoundError:
+        print(f"Lỗi: Không tìm thấy file tại {file_path}", file=sys.stderr)
 
 # --- VÍ DỤ SỬ DỤNG ---
 if __name__ == "__main__":
@@ -0,0 +1,252 @@
+import datetime
+import math
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from hatch_filter import sat_index, SYSTEMS, MAX_PRN_PER_SYSTEM
+
+# Mốc thời gian GPS (không có tzinfo, giống trường 'epoch' của read_rinex_nav)
+GPS_EPOCH = datetime.datetime(1980, 1, 6)
+
+# Các tham số số thực của một bản ghi ephemeris dạng Kepler (tên như trong read_rinex_nav)
+EPHEMERIS_FIELDS = [
+    'a0', 'a1', 'a2', 'IODE', 'Crs', 'Delta_n', 'M0', 'Cuc', 'e', 'Cus', 'sqrt_a', 'Toe',
+    'Cic', 'Omega0', 'Cis', 'i0', 'Crc', 'omega', 'Omega_dot', 'i_dot', 'L2_codes',
+    'GPS_Week', 'L2_Pflag', 'SV_acc', 'SV_health', 'TGD', 'IODC', 'TransTime', 'FitInterval',
+]
+
+# Cột của bảng: chỉ số vệ tinh, thời điểm Toc (giây kể từ mốc GPS), sau đó là các tham số
+COLUMNS = ['sat', 'toc_gps_seconds'] + EPHEMERIS_FIELDS
+COL = {name: k for k, name in enumerate(COLUMNS)}
+
+
+def _prn_from_index(k):
+    """Ngược lại của sat_index: 0 -> 'G01', 64 -> 'R01'."""
+    return f"{SYSTEMS[k // MAX_PRN_PER_SYSTEM]}{k % MAX_PRN_PER_SYSTEM + 1:02d}"
+
+
+def pack_ephemeris(nav):
+    """
+    Đóng gói dữ liệu NAV dạng {prn: [eph, ...]} thành một bảng float64 (n_records x len(COLUMNS)),
+    sắp xếp theo (vệ tinh, Toe). Tham số thiếu (None) được lưu là NaN.
+    Chỉ các bản ghi dạng Kepler được đóng gói (bản ghi GLONASS dạng véc-tơ trạng thái bị bỏ qua).
+    """
+    rows = []
+    for prn, eph_list in nav.items():
+        k = sat_index(prn)
+        if k < 0:
+            continue
+        for eph in eph_list:
+            if eph.get('sqrt_a') is None:
+                continue
+            toc = (eph['epoch'] - GPS_EPOCH).total_seconds()
+            row = [float(k), toc]
+            for name in EPHEMERIS_FIELDS:
+                value = eph.get(name)
+                row.append(math.nan if value is None else value)
+            rows.append(row)
+
+    table = np.array(rows, dtype=np.float64).reshape(-1, len(COLUMNS))
+    if len(table):
+        # Sắp xếp ổn định theo vệ tinh rồi theo Toe (giữ thứ tự file cho các bản ghi trùng Toe)
+        order = np.lexsort((table[:, COL['Toe']], table[:, COL['sat']]))
+        table = table[order]
+    return table
+
+
+class SharedEphemerisTable:
+    """
+    Bảng ephemeris dạng mảng NumPy liền kề, có thể đặt trong bộ nhớ chia sẻ
+    (multiprocessing.shared_memory) hoặc trong file ánh xạ bộ nhớ (memory-mapped .npy).
+
+    Process cha tạo bảng MỘT lần (create); các process con chỉ cần handle (tên vùng nhớ +
+    số bản ghi) để gắn vào (attach) ở chế độ chỉ đọc, không sao chép và không giải tuần tự hóa.
+
+    Dùng được ở mọi chỗ cần dữ liệu NAV trong prepare_inputs (`prn in table`, find_best()).
+    """
+
+    def __init__(self, table, shm=None, owner=False):
+        self.table = table
+        self._shm = shm
+        self._owner = owner
+        self._eph_cache = {}
+
+        # Chỉ mục theo vệ tinh: các bản ghi của vệ tinh k nằm trong [start[k], start[k+1])
+        sats = table[:, COL['sat']]
+        self._start = np.searchsorted(sats, np.arange(len(SYSTEMS) * MAX_PRN_PER_SYSTEM + 1) - 0.5)
+
+    # --- Tạo / gắn bảng ---
+
+    @classmethod
+    def create(cls, nav):
+        """Đóng gói nav vào một vùng nhớ chia sẻ mới (process cha gọi một lần)."""
+        packed = pack_ephemeris(nav)
+        shm = shared_memory.SharedMemory(create=True, size=max(packed.nbytes, 1))
+        table = np.ndarray(packed.shape, dtype=np.float64, buffer=shm.buf)
+        table[:] = packed
+        table.flags.writeable = False
+        return cls(table, shm, owner=True)
+
+    @property
+    def handle(self):
+        """Thông tin (picklable) để process khác gắn vào bảng: (tên vùng nhớ, số bản ghi)."""
+        return (self._shm.name, self.table.shape[0])
+
+    @classmethod
+    def attach(cls, handle):
+        """Gắn vào bảng đã có trong bộ nhớ chia sẻ (chỉ đọc, không sao chép)."""
+        name, n_records = handle
+        shm = shared_memory.SharedMemory(name=name)
+        table = np.ndarray((n_records, len(COLUMNS)), dtype=np.float64, buffer=shm.buf)
+        table.flags.writeable = False
+        return cls(table, shm, owner=False)
+
+    def save(self, path):
+        """Ghi bảng ra file .npy để mở lại bằng open_mmap."""
+        np.save(path, np.asarray(self.table))
+
+    @classmethod
+    def open_mmap(cls, path):
+        """Mở bảng từ file .npy bằng memory-map (chỉ đọc; các process dùng chung page cache)."""
+        return cls(np.load(path, mmap_mode='r'))
+
+    def close(self):
+        """Tách khỏi vùng nhớ chia sẻ; process tạo bảng đồng thời giải phóng vùng nhớ."""
+        if self._shm is None:
+            return
+        self.table = None
+        self._eph_cache.clear()
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- Truy vấn ---
+
+    def _rows(self, prn):
+        k = sat_index(prn)
+        if k < 0:
+            return 0, 0
+        return int(self._start[k]), int(self._start[k + 1])
+
+    def __contains__(self, prn):
+        start, end = self._rows(prn)
+        return end > start
+
+    def __len__(self):
+        return int(np.count_nonzero(np.diff(self._start)))
+
+    def keys(self):
+        return [_prn_from_index(k) for k in np.flatnonzero(np.diff(self._start))]
+
+    def __getitem__(self, prn):
+        """Trả về list mọi ephemeris (dict) của một PRN."""
+        start, end = self._rows(prn)
+        if end == start:
+            raise KeyError(prn)
+        return [self._eph(i) for i in range(start, end)]
+
+    def find_best(self, prn, t):
+        """
+        Tìm ephemeris có Toe gần t nhất (không quá 4 giờ), cùng tiêu chí với
+        prepare_inputs.find_best_ephemeris. Trả về dict hoặc None.
+        """
+        start, end = self._rows(prn)
+        if end == start:
+            return None
+
+        # Khoảng cách thời gian, xử lý week crossover
+        dt = np.abs(t - self.table[start:end, COL['Toe']])
+        dt = np.where(dt > 302400, 604800 - dt, dt)
+        k = int(np.argmin(dt))
+
+        # Nếu bản tin quá cũ (> 4 giờ = 14400s), không sử dụng
+        if dt[k] > 14400:
+            return None
+        return self._eph(start + k)
+
+    def _eph(self, i):
+        """Dựng dict ephemeris (giống read_rinex_nav) cho bản ghi i; kết quả được nhớ lại."""
+        eph = self._eph_cache.get(i)
+        if eph is None:
+            row = self.table[i]
+            eph = {'epoch': GPS_EPOCH + datetime.timedelta(seconds=float(row[COL['toc_gps_seconds']]))}
+            for name in EPHEMERIS_FIELDS:
+                value = float(row[COL[name]])
+                eph[name] = None if math.isnan(value) else value
+            self._eph_cache[i] = eph
+        return eph
+
+
+# --- Chuẩn bị dữ liệu song song trên nhiều process ---
+
+_worker_table = None
+_worker_states = None
+
+
+def _attach_worker(handle):
+    """
+    Initializer của process con: gắn vào bảng ephemeris chia sẻ và tạo nguồn trạng thái
+    vệ tinh MỘT lần (bộ đệm cung GLONASS của GlonassPropagator dùng chung cho mọi khối).
+    """
+    from prepare_inputs import BroadcastSatelliteStates
+
+    global _worker_table, _worker_states
+    _worker_table = SharedEphemerisTable.attach(handle)
+    _worker_states = BroadcastSatelliteStates(_worker_table)
+
+
+def _prepare_chunk(epochs):
+    from prepare_inputs import _prepare_epoch
+    from epoch_batch import EpochBatchBuilder
+
+    builder = EpochBatchBuilder()
+    for epoch in epochs:
+        _prepare_epoch(builder, epoch, _worker_table, sat_states=_worker_states)
+    return builder.build()
+
+
+def prepare_solver_inputs_parallel(nav_file, obs_file, workers=4, chunk_size=256):
+    """
+    Giống prepare_basic_solver_inputs nhưng chia các epoch OBS cho nhiều process.
+    Dữ liệu NAV được đóng gói một lần vào bộ nhớ chia sẻ; các process con gắn vào ở
+    chế độ chỉ đọc thay vì nhận bản sao pickle của dict NAV hoặc tự đọc lại file NAV.
+
+    Lưu ý: không hỗ trợ bộ lọc Hatch (trạng thái làm trơn phụ thuộc thứ tự các epoch).
+
+    Returns:
+        EpochBatch: Cùng kết quả như prepare_basic_solver_inputs.
+    """
+    from lazy_nav import LazyNavigation
+    from read_rinex_obs import read_rinex_obs
+    from epoch_batch import EpochBatch
+
+    lazy = LazyNavigation(nav_file)
+    nav = {prn: lazy[prn] for prn in lazy.keys()}
+    obs = read_rinex_obs(obs_file) or []
+    chunks = [obs[k:k + chunk_size] for k in range(0, len(obs), chunk_size)]
+
+    with SharedEphemerisTable.create(nav) as table:
+        with multiprocessing.Pool(processes=workers, initializer=_attach_worker,
+                                  initargs=(table.handle,)) as pool:
+            batches = pool.map(_prepare_chunk, chunks)
+
+    return EpochBatch.concatenate(batches)
+
+
+# --- VÍ DỤ SỬ DỤNG ---
+if __name__ == "__main__":
+    import time
+
+    NAV_FILE = '2908-nav-base.nav' # File .nav
+    OBS_FILE = 'test.obs' # File .obs
+
+    start = time.perf_counter()
+    batch = prepare_solver_inputs_parallel(NAV_FILE, OBS_FILE, workers=4)
+    print(f"{batch} trong {time.perf_counter() - start:.3f} s")
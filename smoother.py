@@ -0,0 +1,251 @@
+import collections
+import datetime
+import numpy as np
+from solve_navigation_equations import solve_position
+
+# Phương sai ban đầu của vận tốc (m/s)^2 khi khởi tạo bộ lọc từ nghiệm đầu tiên
+INITIAL_VELOCITY_VAR = 100.0 ** 2
+
+
+class _Entry:
+    """Một epoch trong bộ đệm vòng của bộ làm trơn."""
+    __slots__ = ("t", "x", "P", "x_pred", "gain", "clock")
+
+    def __init__(self, t, x, P, x_pred, clock):
+        self.t = t
+        self.x = x              # Trạng thái sau lọc [x, y, z, vx, vy, vz]
+        self.P = P              # Hiệp phương sai sau lọc (6 x 6)
+        self.x_pred = x_pred    # Trạng thái dự báo từ epoch trước (None với epoch đầu)
+        self.gain = None        # Hệ số RTS C_k = P_k F^T P_{k+1|k}^-1, tính khi có epoch sau
+        self.clock = clock      # c*dt_r của nghiệm gốc (không làm trơn)
+
+
+class FixedLagSmoother:
+    """
+    Bộ làm trơn Rauch–Tung–Striebel trễ cố định (fixed-lag) cho chuỗi nghiệm vị trí.
+
+    Bộ lọc Kalman mô hình vận tốc không đổi (trạng thái [vị trí, vận tốc], gia tốc là nhiễu trắng
+    với mật độ phổ accel_psd) nhận nghiệm từng epoch làm đo đạc, với hiệp phương sai
+    sigma^2 * (H^T W H)^-1 của bộ giải (PositionSolution.normal_inv).
+
+    Chỉ giữ bộ đệm vòng (deque) của lag + 1 epoch gần nhất: khi có epoch mới, lượt RTS ngược
+    chạy trên bộ đệm và trả ra nghiệm đã làm trơn của epoch cũ nhất, tức trễ đúng `lag` epoch.
+    Hệ số RTS của mỗi epoch chỉ phụ thuộc kết quả lọc nên được tính MỘT lần khi epoch sau tới;
+    lượt ngược chỉ còn lag phép nhân ma trận - véc-tơ 6 x 6. Bộ nhớ O(lag), không phụ thuộc độ dài dữ liệu.
+
+    Sai lệch đồng hồ máy thu (c*dt_r) có thể nhảy (clock steering), nên không được làm trơn:
+    cột thứ 4 của kết quả là giá trị của nghiệm gốc.
+    """
+
+    def __init__(self, lag=20, sigma=3.0, accel_psd=1.0, max_gap=30.0):
+        """
+        Args:
+            lag (int): Độ trễ (số epoch) giữa epoch mới nhất và epoch được trả ra.
+            sigma (float): Độ lệch chuẩn pseudorange (mét) nhân với ma trận cofactor của bộ giải.
+            accel_psd (float): Mật độ phổ nhiễu gia tốc (m^2/s^3) của mô hình vận tốc không đổi.
+            max_gap (float): Khoảng trống dữ liệu tối đa (giây); lớn hơn thì làm trơn lại từ đầu.
+        """
+        self.lag = lag
+        self.sigma = sigma
+        self.accel_psd = accel_psd
+        self.max_gap = max_gap
+        self._buffer = collections.deque(maxlen=lag + 1)
+        self._last = None   # (t, x, P) của epoch mới nhất
+
+    # --- Mô hình ---
+
+    def _predict(self, x, P, dt):
+        F = np.eye(6)
+        F[:3, 3:] = np.eye(3) * dt
+        q = self.accel_psd
+        Q = np.zeros((6, 6))
+        Q[:3, :3] = np.eye(3) * (q * dt**3 / 3.0)
+        Q[:3, 3:] = Q[3:, :3] = np.eye(3) * (q * dt**2 / 2.0)
+        Q[3:, 3:] = np.eye(3) * (q * dt)
+        return F, F @ x, F @ P @ F.T + Q
+
+    # --- Luồng dữ liệu ---
+
+    def push(self, t, solution, cofactor=None):
+        """
+        Thêm nghiệm của một epoch.
+
+        Args:
+            t (datetime hoặc float): Thời điểm epoch (tăng dần).
+            solution (array hoặc None): [x, y, z, c_dt_r] của bộ giải; None/NaN nếu epoch giải thất bại
+                (khi đó chỉ có bước dự báo).
+            cofactor (array hoặc None): Ma trận (H^T W H)^-1 của bộ giải (ít nhất 3 x 3);
+                None thì dùng ma trận đơn vị.
+
+        Returns:
+            list: Các epoch đã làm trơn sẵn sàng trả ra, mỗi phần tử (t, [x, y, z, c_dt_r], [vx, vy, vz]).
+        """
+        out = []
+        if self._last is not None:
+            dt = t - self._last[0]
+            if isinstance(dt, datetime.timedelta):
+                dt = dt.total_seconds()
+            if dt <= 0 or dt > self.max_gap:
+                out = self.flush()
+        has_measurement = solution is not None and np.all(np.isfinite(solution[:3]))
+
+        if self._last is None:
+            if not has_measurement:
+                return out + [(t, np.full(4, np.nan), np.full(3, np.nan))]
+            # Khởi tạo từ nghiệm đầu tiên
+            R = self._measurement_cov(cofactor)
+            P = np.zeros((6, 6))
+            P[:3, :3] = R
+            P[3:, 3:] = np.eye(3) * INITIAL_VELOCITY_VAR
+            x = np.concatenate((np.asarray(solution[:3], dtype=np.float64), np.zeros(3)))
+            entry = _Entry(t, x, P, None, float(solution[3]))
+        else:
+            previous = self._buffer[-1]
+            F, x_pred, P_pred = self._predict(previous.x, previous.P, dt)
+            x, P = x_pred, P_pred
+            if has_measurement:
+                # Cập nhật Kalman với đo đạc vị trí (H = [I 0])
+                R = self._measurement_cov(cofactor)
+                S = P_pred[:3, :3] + R
+                K = np.linalg.solve(S, P_pred[:3, :]).T
+                x = x_pred + K @ (np.asarray(solution[:3], dtype=np.float64) - x_pred[:3])
+                P = P_pred - K @ P_pred[:3, :]
+                P = 0.5 * (P + P.T)
+            # Hệ số RTS của epoch trước: C = P_k F^T P_{k+1|k}^-1
+            previous.gain = np.linalg.solve(P_pred, F @ previous.P).T
+            entry = _Entry(t, x, P, x_pred, float(solution[3]) if has_measurement else np.nan)
+
+        if len(self._buffer) == self._buffer.maxlen:
+            self._buffer.popleft()
+        self._buffer.append(entry)
+        self._last = (t, x, P)
+
+        if len(self._buffer) == self._buffer.maxlen:
+            out.append(self._emit(self._backward()[0], self._buffer[0]))
+        return out
+
+    def push_solution(self, t, result):
+        """Như push, với kết quả PositionSolution của solve_position (None nếu giải thất bại)."""
+        if result is None:
+            return self.push(t, None)
+        return self.push(t, result.solution, result.normal_inv)
+
+    def flush(self):
+        """
+        Làm trơn và trả ra mọi epoch còn trong bộ đệm (cuối dữ liệu hoặc gặp khoảng trống),
+        rồi khởi động lại bộ lọc.
+        """
+        out = []
+        if self._buffer:
+            states = self._backward()
+            # Epoch cũ nhất đã được trả ra khi bộ đệm đầy
+            start = 1 if len(self._buffer) == self._buffer.maxlen else 0
+            out = [self._emit(states[k], self._buffer[k]) for k in range(start, len(self._buffer))]
+        self._buffer.clear()
+        self._last = None
+        return out
+
+    # --- Nội bộ ---
+
+    def _measurement_cov(self, cofactor):
+        if cofactor is None:
+            return np.eye(3) * self.sigma**2
+        return np.asarray(cofactor, dtype=np.float64)[:3, :3] * self.sigma**2
+
+    def _backward(self):
+        """Lượt RTS ngược trên bộ đệm; trả về list trạng thái đã làm trơn theo thứ tự thời gian."""
+        buffer = self._buffer
+        states = [None] * len(buffer)
+        smoothed = buffer[-1].x
+        states[-1] = smoothed
+        for k in range(len(buffer) - 2, -1, -1):
+            smoothed = buffer[k].x + buffer[k].gain @ (smoothed - buffer[k + 1].x_pred)
+            states[k] = smoothed
+        return states
+
+    @staticmethod
+    def _emit(state, entry):
+        return (entry.t, np.append(state[:3], entry.clock), state[3:].copy())
+
+
+def smooth_solutions(times, solutions, cofactors=None, lag=20, **smoother_options):
+    """
+    Làm trơn một chuỗi nghiệm đã có (ví dụ kết quả solve_epoch_batch / run_pipeline).
+
+    Args:
+        times (list): Thời điểm các epoch (datetime hoặc giây).
+        solutions (ndarray, n x 4): [x, y, z, c_dt_r]; hàng NaN là epoch giải thất bại.
+        cofactors (list hoặc None): Ma trận (H^T W H)^-1 của từng epoch (None: ma trận đơn vị).
+        lag (int), **smoother_options: Xem FixedLagSmoother.
+
+    Returns:
+        tuple: (positions n x 4 [x, y, z, c_dt_r], velocities n x 3), cùng thứ tự với times.
+    """
+    smoother = FixedLagSmoother(lag=lag, **smoother_options)
+    positions = np.full((len(times), 4), np.nan)
+    velocities = np.full((len(times), 3), np.nan)
+    k = 0
+
+    def store(items):
+        nonlocal k
+        for _, position, velocity in items:
+            positions[k] = position
+            velocities[k] = velocity
+            k += 1
+
+    for i, t in enumerate(times):
+        store(smoother.push(t, solutions[i], None if cofactors is None else cofactors[i]))
+    store(smoother.flush())
+    return positions, velocities
+
+
+def smooth_epoch_batch(batch, initial_pos, lag=20, smoother_options=None, **solver_options):
+    """
+    Giải và làm trơn mọi epoch của một EpochBatch: dùng (H^T W H)^-1 của từng epoch làm
+    hiệp phương sai đo đạc. Nghiệm epoch trước là dự đoán ban đầu cho epoch sau (như solve_epoch_batch).
+
+    Returns:
+        dict: {"times": list, "positions": ndarray (n x 4) đã làm trơn,
+               "velocities": ndarray (n x 3), "raw": ndarray (n x 4) nghiệm chưa làm trơn}
+    """
+    smoother = FixedLagSmoother(lag=lag, **(smoother_options or {}))
+    raw = np.full((len(batch), 4), np.nan)
+    times, positions, velocities = [], [], []
+
+    def store(items):
+        for t, position, velocity in items:
+            times.append(t)
+            positions.append(position)
+            velocities.append(velocity)
+
+    guess = initial_pos
+    for k, epoch in enumerate(batch):
+        result = solve_position(epoch, guess, verbose=False, **solver_options)
+        if result is not None:
+            raw[k] = result.solution
+            guess = result.solution[:3]
+        store(smoother.push_solution(epoch.time_utc, result))
+    store(smoother.flush())
+
+    return {
+        "times": times,
+        "positions": np.array(positions).reshape(-1, 4),
+        "velocities": np.array(velocities).reshape(-1, 3),
+        "raw": raw,
+    }
+
+
+# --- VÍ DỤ SỬ DỤNG ---
+if __name__ == "__main__":
+    from prepare_inputs import prepare_basic_solver_inputs
+
+    NAV_FILE = '2908-nav-base.nav' # File .nav
+    OBS_FILE = 'test.obs' # File .obs
+
+    batch = prepare_basic_solver_inputs(NAV_FILE, OBS_FILE)
+    if batch:
+        result = smooth_epoch_batch(batch, [0, 0, 0], lag=30, elevation_mask_deg=10.0, weighting=True)
+        raw, smoothed = result["raw"][:, :3], result["positions"][:, :3]
+        print(f"{len(batch)} epoch, trễ 30 epoch")
+        print(f"Độ lệch chuẩn vị trí (X, Y, Z) trước khi làm trơn: {np.round(np.nanstd(raw, axis=0), 3)} m")
+        print(f"Độ lệch chuẩn vị trí (X, Y, Z) sau khi làm trơn:   {np.round(np.nanstd(smoothed, axis=0), 3)} m")
@@ -2,81 +2,185 @@ import numpy as np
 import math
 import sys
 from typing import List, Dict, Any, Optional, Tuple
+from epoch_batch import EpochBatch, EpochView
+from epoch_geometry import EpochGeometry
+from atmosphere import klobuchar_delay, saastamoinen_delay
+from hatch_filter import SYSTEMS
 
-def solve_navigation_equations(epoch_data: Dict[str, Any], initial_pos: List[float]) -> Optional[np.ndarray]:
+
+class PositionSolution:
+    """
+    Kết quả đầy đủ của bài toán vị trí cho một epoch.
+    Lưu lại ma trận thiết kế H và (H^T W H)^-1 của vòng lặp cuối để các bước sau
+    (ví dụ: giải vận tốc từ Doppler) dùng lại mà không phải phân tích ma trận lần nữa.
+
+    Thuộc tính:
+        solution (ndarray, 4): [x_r, y_r, z_r, c_dt_r]; c_dt_r là đồng hồ máy thu theo hệ thống
+                               tham chiếu (hệ thống đầu tiên có mặt theo thứ tự 'GRECJIS').
+        H (ndarray, m x k): Ma trận thiết kế của các vệ tinh được dùng
+                            (k = 4 + số độ lệch liên hệ thống được ước lượng).
+        used (ndarray bool, n): Vệ tinh nào của epoch được dùng (sau mặt nạ góc ngẩng).
+        weights (ndarray, m): Trọng số của các vệ tinh được dùng.
+        normal_inv (ndarray, k x k): (H^T W H)^-1 (cũng là ma trận cofactor để tính DOP).
+        geometry (EpochGeometry): Hình học của vòng lặp cuối.
+        iterations (int): Số vòng lặp đã thực hiện.
+        converged (bool): Đã hội tụ hay chưa.
+        isb (dict): Độ lệch liên hệ thống (ISB) {hệ thống: c * ISB (mét)} so với hệ thống tham chiếu.
+    """
+    __slots__ = ("solution", "H", "used", "weights", "normal_inv", "geometry",
+                 "iterations", "converged", "isb")
+
+    def __init__(self, solution, H, used, weights, normal_inv, geometry, iterations, converged, isb=None):
+        self.solution = solution
+        self.H = H
+        self.used = used
+        self.weights = weights
+        self.normal_inv = normal_inv
+        self.geometry = geometry
+        self.iterations = iterations
+        self.converged = converged
+        self.isb = isb if isb is not None else {}
+
+
+def solve_navigation_equations(epoch_data: EpochView, initial_pos: List[float], verbose: bool = True,
+                               iono_params: Optional[Tuple[List[float], List[float]]] = None,
+                               troposphere: bool = False,
+                               elevation_mask_deg: float = 0.0,
+                               weighting: bool = False) -> Optional[np.ndarray]:
+    """
+    Giải hệ phương trình 4 ẩn bằng Bình phương Tối thiểu Lặp (ILS)
+    để tìm vị trí máy thu (x_r, y_r, z_r) và sai lệch đồng hồ (c*dt_r).
+    Xem solve_position để biết chi tiết các tham số.
+
+    Returns:
+        Một mảng numpy 4 phần tử [x_r, y_r, z_r, c_dt_r] nếu hội tụ,
+        hoặc None nếu lỗi.
+    """
+    result = solve_position(epoch_data, initial_pos, verbose=verbose,
+                            iono_params=iono_params, troposphere=troposphere,
+                            elevation_mask_deg=elevation_mask_deg, weighting=weighting)
+    if result is None:
+        return None
+    return result.solution
+
+
+def solve_position(epoch_data: EpochView, initial_pos: List[float], verbose: bool = True,
+                   iono_params: Optional[Tuple[List[float], List[float]]] = None,
+                   troposphere: bool = False,
+                   elevation_mask_deg: float = 0.0,
+                   weighting: bool = False) -> Optional[PositionSolution]:
     """
     Giải hệ phương trình 4 ẩn bằng Bình phương Tối thiểu Lặp (ILS)
     để tìm vị trí máy thu (x_r, y_r, z_r) và sai lệch đồng hồ (c*dt_r).
 
     Args:
-        epoch_data: Một dictionary chứa dữ liệu đã chuẩn bị cho 1 epoch
-                    (từ hàm prepare_basic_solver_inputs_demo).
+        epoch_data: EpochView của 1 epoch trong EpochBatch
+                    (từ hàm prepare_basic_solver_inputs).
         initial_pos: Vị trí dự đoán ban đầu [x, y, z] (ví dụ: từ header file obs).
+        verbose: In thông báo số vòng lặp khi hội tụ.
+        iono_params: (ion_alpha, ion_beta) từ header file NAV để hiệu chỉnh tầng điện ly
+                     bằng mô hình Klobuchar. None = không hiệu chỉnh.
+        troposphere: Hiệu chỉnh tầng đối lưu bằng mô hình Saastamoinen.
+        elevation_mask_deg: Loại bỏ vệ tinh có góc ngẩng thấp hơn giá trị này (độ).
+        weighting: Dùng trọng số theo góc ngẩng (sin^2 E) thay vì trọng số bằng nhau.
+
+    Hình học của epoch (hướng nhìn, góc phương vị/góc ngẩng, tọa độ địa lý máy thu)
+    được tính một lần mỗi vòng lặp trong EpochGeometry và dùng chung cho H,
+    mặt nạ góc ngẩng, trọng số và các mô hình khí quyển.
+
+    Khi epoch có vệ tinh của nhiều hệ thống (ví dụ GPS + GLONASS), mỗi hệ thống ngoài hệ thống
+    tham chiếu có thêm một ẩn độ lệch liên hệ thống (ISB) trong H (cột bằng 1 cho vệ tinh của hệ đó).
 
     Returns:
-        Một mảng numpy 4 phần tử [x_r, y_r, z_r, c_dt_r] nếu hội tụ,
+        PositionSolution (nghiệm kèm H và (H^T W H)^-1 của vòng lặp cuối),
         hoặc None nếu lỗi.
     """
     
+    # Dữ liệu vệ tinh là các lát cắt NumPy của batch (không sao chép)
+    rho_obs = epoch_data.pseudorange              # Pseudorange đo được thực tế (đã biết)
+    sat_pos = epoch_data.sat_pos_ecef             # Vị trí vệ tinh (đã biết), n x 3
+    c_dt_s = epoch_data.sat_clock_corr_meters     # Lượng hiệu chỉnh đồng hồ vệ tinh (c * dt_s)
+    num_sats = len(rho_obs)
+
+    # Các hệ thống vệ tinh có mặt; hệ thống đầu tiên là tham chiếu của đồng hồ máy thu
+    sat_system = np.asarray(epoch_data.prn).astype('U1')
+    systems = sorted(set(sat_system.tolist()), key=SYSTEMS.find) or ['G']
+    num_states = 3 + len(systems)
+
     # --- 1. Dự đoán ban đầu ---
-    # Bắt đầu với vị trí APPROX POS và sai lệch đồng hồ bằng 0 
-    current_solution = np.array([initial_pos[0], initial_pos[1], initial_pos[2], 0.0])
+    # Bắt đầu với vị trí APPROX POS, sai lệch đồng hồ và ISB bằng 0
+    current_solution = np.zeros(num_states)
+    current_solution[:3] = initial_pos[:3]
     
     MAX_ITERATIONS = 10
     CONVERGENCE_LIMIT_METERS = 1e-4  # Hội tụ khi độ hiệu chỉnh < 0.1 mm
 
-    # print(f"\n--- Bắt đầu giải cho Epoch: {epoch_data['time_utc']} ---")
+    # Ma trận H được cấp phát một lần; cột đạo hàm theo c*dt_r luôn bằng 1,
+    # cột ISB của hệ thống j bằng 1 cho các vệ tinh thuộc hệ thống đó
+    H_all = np.zeros((num_sats, num_states))
+    H_all[:, 3] = 1.0
+    for j, system in enumerate(systems[1:]):
+        H_all[:, 4 + j] = sat_system == system
+
+    # print(f"\n--- Bắt đầu giải cho Epoch: {epoch_data.time_utc} ---")
     
     for i in range(MAX_ITERATIONS):
-        satellites = epoch_data['satellites']
-        num_sats = len(satellites)
-        
-        # Khởi tạo ma trận H và véc-tơ y (delta_rho) 
-        H = np.zeros((num_sats, 4))
-        y = np.zeros(num_sats)
+        # Đồng hồ máy thu của từng vệ tinh (c*dt_r + ISB của hệ thống vệ tinh đó)
+        c_dt_r = H_all[:, 3:] @ current_solution[3:]
         
-        x_r, y_r, z_r, c_dt_r = current_solution
-        
-        # --- 2. Xây dựng ma trận H và véc-tơ y ---
-        for j, sat in enumerate(satellites):
-            rho_raw = sat['pseudorange']        # Pseudorange đo được thực tế (đã biết)
-            xs_i, ys_i, zs_i = sat['sat_pos_ecef'] # Vị trí vệ tinh (đã biết)
-            c_dt_s = sat['sat_clock_corr_meters'] # Lượng hiệu chỉnh đồng hồ vệ tinh (c * dt_s)
-            
-            # Tính khoảng cách hình học dự đoán (Geometric Range) (r_i)
-            r_i = math.sqrt(
-                (xs_i - x_r)**2 +
-                (ys_i - y_r)**2 +
-                (zs_i - z_r)**2
-            )
-            
-            # Tính pseudorange dự đoán (Modeled Pseudorange) (rho_modeled) 
-            rho_modeled = r_i + c_dt_r - c_dt_s
-            
-            # 3. Tính Residual (chênh lệch đo đạc)
-            # Xây dựng véc-tơ y = Observed - Modeled
-            # y = rho_thực_tế - rho_dự_đoán
-            y[j] = rho_raw - rho_modeled
-            
-            # Xây dựng hàng thứ j của ma trận H
-            H[j, 0] = (x_r - xs_i) / r_i
-            H[j, 1] = (y_r - ys_i) / r_i
-            H[j, 2] = (z_r - zs_i) / r_i
-            H[j, 3] = 1.0  # Đạo hàm riêng theo c*dt_r
+        # --- 2. Hình học của epoch tại vị trí hiện tại (tính một lần, dùng chung) ---
+        geometry = EpochGeometry(current_solution[:3], sat_pos)
+
+        # Tính pseudorange dự đoán (Modeled Pseudorange) (rho_modeled) 
+        # từ khoảng cách hình học (Geometric Range) (r_i)
+        rho_modeled = geometry.ranges + c_dt_r - c_dt_s
+
+        # Hiệu chỉnh khí quyển chỉ có nghĩa khi máy thu đã ở gần bề mặt Trái Đất
+        if geometry.valid:
+            if iono_params is not None:
+                rho_modeled = rho_modeled + klobuchar_delay(
+                    iono_params[0], iono_params[1], geometry.lat, geometry.lon,
+                    geometry.azimuth, geometry.elevation, epoch_data.time_sow)
+            if troposphere:
+                rho_modeled = rho_modeled + saastamoinen_delay(
+                    geometry.lat, geometry.height, geometry.elevation)
+
+        # 3. Tính Residual (chênh lệch đo đạc)
+        # Xây dựng véc-tơ y = Observed - Modeled
+        y_all = rho_obs - rho_modeled
+
+        # Các cột đạo hàm riêng theo x_r, y_r, z_r (ngược hướng nhìn)
+        H_all[:, :3] = -geometry.los
+
+        # Mặt nạ góc ngẩng; chỉ ước lượng ISB của hệ thống còn vệ tinh được dùng
+        used = geometry.elevation_mask(elevation_mask_deg)
+        active = np.ones(num_states, dtype=bool)
+        active[4:] = H_all[used, 4:].any(axis=0)
+        num_unknowns = np.count_nonzero(active)
+        if np.count_nonzero(used) < num_unknowns:
+            print(f"Lỗi: Không đủ {num_unknowns} vệ tinh trên góc ngẩng {elevation_mask_deg} độ tại epoch {epoch_data.time_utc}.", file=sys.stderr)
+            return None
+        H = H_all[used][:, active]
+        y = y_all[used]
 
         # --- 3. Giải hệ phương trình tuyến tính ---
-        # Tìm véc-tơ hiệu chỉnh x = (H^T H)^-1 * H^T * y
+        # Tìm véc-tơ hiệu chỉnh x = (H^T W H)^-1 * H^T * W * y
         try:
-            H_T = H.T
+            if weighting:
+                W = geometry.elevation_weights()[used]
+            else:
+                W = np.ones(len(y))
+            H_T = H.T * W
             H_T_H = H_T @ H
             H_T_H_inv = np.linalg.inv(H_T_H)
             
-            # Véc-tơ hiệu chỉnh [dx, dy, dz, d(c*dt_r)]
-            x_correction = H_T_H_inv @ H_T @ y
+            # Véc-tơ hiệu chỉnh [dx, dy, dz, d(c*dt_r), d(ISB)...]
+            x_correction = np.zeros(num_states)
+            x_correction[active] = H_T_H_inv @ H_T @ y
         
         except np.linalg.LinAlgError:
             # Lỗi nếu các vệ tinh thẳng hàng (DOP vô cùng)
-            print(f"Lỗi: Ma trận H^T H không thể nghịch đảo (singular matrix) tại epoch {epoch_data['time_utc']}.", file=sys.stderr)
+            print(f"Lỗi: Ma trận H^T H không thể nghịch đảo (singular matrix) tại epoch {epoch_data.time_utc}.", file=sys.stderr)
             return None
 
         # --- 4. Cập nhật dự đoán --- 
@@ -87,8 +191,93 @@ def solve_navigation_equations(epoch_data: Dict[str, Any], initial_pos: List[flo
         correction_magnitude = np.linalg.norm(x_correction[:3])
         
         if correction_magnitude < CONVERGENCE_LIMIT_METERS:
-            print(f"Hội tụ sau {i+1} vòng lặp.")
-            return current_solution
+            if verbose:
+                print(f"Hội tụ sau {i+1} vòng lặp.")
+            return PositionSolution(current_solution[:4].copy(), H, used, W, H_T_H_inv, geometry, i + 1, True,
+                                    _isb(systems, current_solution, active))
+
+    print(f"Cảnh báo: Không hội tụ sau {MAX_ITERATIONS} vòng lặp cho epoch {epoch_data.time_utc}.")
+    return PositionSolution(current_solution[:4].copy(), H, used, W, H_T_H_inv, geometry, MAX_ITERATIONS, False,
+                            _isb(systems, current_solution, active))
+
+
+def _isb(systems, state, active):
+    """{hệ thống: c * ISB (mét)} của các hệ thống ngoài tham chiếu đã được ước lượng."""
+    return {system: float(state[4 + j]) for j, system in enumerate(systems[1:]) if active[4 + j]}
+
+
+def solve_velocity(epoch_data: EpochView, position: PositionSolution) -> Optional[np.ndarray]:
+    """
+    Giải vận tốc máy thu (vx, vy, vz) và tốc độ trôi đồng hồ (c*ddt_r) từ Doppler.
+
+    Phương trình range rate tuyến tính theo ẩn và có cùng ma trận thiết kế H với bài toán
+    vị trí (hàng [-e_i, 1]), nên dùng lại H và (H^T W H)^-1 đã hội tụ của position:
+    không cần lặp và không cần phân tích ma trận thêm. Với nhiều hệ thống vệ tinh, các cột ISB
+    đóng vai trò độ lệch tốc độ trôi liên hệ thống và chỉ 4 thành phần đầu được trả về.
+
+        range_rate_i - e_i . v_s,i + c*ddt_s,i = -e_i . v_r + c*ddt_r
 
-    print(f"Cảnh báo: Không hội tụ sau {MAX_ITERATIONS} vòng lặp cho epoch {epoch_data['time_utc']}.")
-    return current_solution
\ No newline at end of file
+    Args:
+        epoch_data: EpochView (có sat_vel_ecef, sat_clock_drift_mps, range_rate).
+        position: Kết quả của solve_position cho cùng epoch.
+
+    Returns:
+        Mảng numpy 4 phần tử [vx, vy, vz, c_ddt_r] (m/s), hoặc None nếu thiếu Doppler.
+    """
+    used = position.used
+    los = position.geometry.los[used]
+    range_rate = epoch_data.range_rate[used]
+    sat_vel = epoch_data.sat_vel_ecef[used]
+    c_ddt_s = epoch_data.sat_clock_drift_mps[used]
+
+    # Véc-tơ y_dot = Observed - Modeled (phần đã biết của mô hình)
+    y_dot = range_rate - np.einsum('ij,ij->i', los, sat_vel) + c_ddt_s
+
+    has_doppler = np.isfinite(y_dot)
+    if np.count_nonzero(has_doppler) < position.H.shape[1]:
+        return None
+
+    H = position.H
+    W = position.weights
+    if has_doppler.all():
+        # Dùng lại (H^T W H)^-1 của bài toán vị trí
+        return (position.normal_inv @ (H.T * W) @ y_dot)[:4]
+
+    # Một số vệ tinh thiếu Doppler: phải giải lại trên tập con
+    H = H[has_doppler]
+    H_T = H.T * W[has_doppler]
+    try:
+        return np.linalg.solve(H_T @ H, H_T @ y_dot[has_doppler])[:4]
+    except np.linalg.LinAlgError:
+        return None
+
+
+def solve_epoch_batch(batch: EpochBatch, initial_pos: List[float], velocity: bool = False,
+                      **solver_options):
+    """
+    Giải lần lượt mọi epoch trong EpochBatch.
+    Nghiệm của epoch trước được dùng làm dự đoán ban đầu cho epoch sau (warm start),
+    nên các epoch liên tiếp hội tụ sau ít vòng lặp hơn.
+    Các tùy chọn (iono_params, troposphere, elevation_mask_deg, weighting)
+    được chuyển nguyên cho solve_position.
+
+    Returns:
+        Mảng numpy (n_epochs x 4) [x_r, y_r, z_r, c_dt_r]; hàng chứa NaN nếu epoch giải thất bại.
+        Nếu velocity=True: tuple (positions, velocities), velocities là (n_epochs x 4)
+        [vx, vy, vz, c_ddt_r].
+    """
+    solutions = np.full((len(batch), 4), np.nan)
+    velocities = np.full((len(batch), 4), np.nan) if velocity else None
+    guess = initial_pos
+    for k, epoch in enumerate(batch):
+        result = solve_position(epoch, guess, verbose=False, **solver_options)
+        if result is not None:
+            solutions[k] = result.solution
+            guess = result.solution[:3]
+            if velocity:
+                v = solve_velocity(epoch, result)
+                if v is not None:
+                    velocities[k] = v
+    if velocity:
+        return solutions, velocities
+    return solutions
@@ -0,0 +1,71 @@
+import datetime
+import pytest
+from read_rinex_obs import iter_rinex_obs
+from incremental import process_incremental
+from conftest import NAV_FILE, START, write_synthetic_obs
+
+
+@pytest.fixture
+def obs_data(tmp_path):
+    return write_synthetic_obs(tmp_path / "full.obs", 40)
+
+
+def _cuts(data):
+    """Các điểm cắt: giữa dòng epoch, giữa các dòng vệ tinh, giữa một dòng vệ tinh và cuối file."""
+    header_end = data.index(b"END OF HEADER") + len(b"END OF HEADER\n")
+    epoch_starts = [i for i in range(header_end, len(data)) if data[i:i + 2] == b"> "]
+    return [header_end + 5, epoch_starts[3] + 10, epoch_starts[9] + 120, epoch_starts[9] + 121,
+            epoch_starts[20], epoch_starts[31] - 1, len(data)]
+
+
+def test_split_appends_match_full_run(tmp_path, obs_data):
+    full = process_incremental(NAV_FILE, str(tmp_path / "full.obs"), str(tmp_path / "full.csv"),
+                               hatch_window=20, chunk_size=8)
+    assert full["solutions"] == 40
+
+    grow_obs, grow_csv = tmp_path / "grow.obs", tmp_path / "grow.csv"
+    resumed = []
+    for cut in _cuts(obs_data):
+        with open(grow_obs, 'wb') as f:
+            f.write(obs_data[:cut])
+        result = process_incremental(NAV_FILE, str(grow_obs), str(grow_csv), hatch_window=20, chunk_size=8)
+        resumed.append(result["resumed"])
+
+    assert resumed[1:] == [True] * (len(resumed) - 1)
+    assert grow_csv.read_bytes() == (tmp_path / "full.csv").read_bytes()
+
+
+def test_partial_epoch_is_left_for_next_read(tmp_path, obs_data):
+    header_end = obs_data.index(b"END OF HEADER") + len(b"END OF HEADER\n")
+    epoch_starts = [i for i in range(header_end, len(obs_data)) if obs_data[i:i + 2] == b"> "]
+    partial = tmp_path / "partial.obs"
+
+    # Cắt giữa dòng vệ tinh thứ hai của epoch thứ 6: chỉ 5 epoch đầu được trả ra
+    with open(partial, 'wb') as f:
+        f.write(obs_data[:epoch_starts[5] + 100])
+    read = list(iter_rinex_obs(str(partial), with_offsets=True))
+    assert len(read) == 5
+    assert read[-1][1] == epoch_starts[5]
+
+    # Đọc tiếp từ offset trên file đầy đủ cho đúng các epoch còn lại
+    rest = list(iter_rinex_obs(str(tmp_path / "full.obs"), start_offset=read[-1][1], with_offsets=True))
+    assert [epoch["time"] for epoch, _ in rest] == [START + datetime.timedelta(seconds=30 * k) for k in range(5, 40)]
+    assert rest[0][0]["observations"] == list(iter_rinex_obs(str(tmp_path / "full.obs")))[5]["observations"]
+
+
+def test_replaced_obs_file_is_processed_from_start(tmp_path, obs_data):
+    obs, csv = tmp_path / "day.obs", tmp_path / "day.csv"
+    with open(obs, 'wb') as f:
+        f.write(obs_data[:len(obs_data) // 2])
+    process_incremental(NAV_FILE, str(obs), str(csv))
+
+    # File mới (lớn hơn) ghi đè lên cùng đường dẫn: checkpoint không còn khớp
+    replaced = write_synthetic_obs(tmp_path / "other.obs", 50, step=15.0)
+    with open(obs, 'wb') as f:
+        f.write(replaced)
+    result = process_incremental(NAV_FILE, str(obs), str(csv))
+
+    assert not result["resumed"]
+    assert result["solutions"] == 50
+    process_incremental(NAV_FILE, str(tmp_path / "other.obs"), str(tmp_path / "other.csv"))
+    assert csv.read_bytes() == (tmp_path / "other.csv").read_bytes()
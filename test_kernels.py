@@ -0,0 +1,56 @@
+import math
+import numpy as np
+import pytest
+import kernels
+
+# Hai backend chỉ được khác nhau ở sai số làm tròn của sin/cos/sqrt
+MAX_ULP = 2
+
+
+def _inputs():
+    rng = np.random.default_rng(7)
+    M = rng.uniform(-math.pi, math.pi, 20000)
+    e = np.concatenate((rng.uniform(0.0, 0.03, 19000), rng.uniform(0.03, 0.7, 1000)))
+    receiver = np.array([-1626584.7059, 5730519.4572, 2271864.3916])
+    sat_pos = receiver + rng.uniform(-2.6e7, 2.6e7, (500, 3))
+    return M, e, receiver, sat_pos
+
+
+def _run_loops(eccentric_loop, los_loop, M, e, receiver, sat_pos, max_iterations):
+    E = np.empty(M.size)
+    eccentric_loop(M, e, E, max_iterations)
+    ranges, los = np.empty(len(sat_pos)), np.empty((len(sat_pos), 3))
+    los_loop(receiver, sat_pos, ranges, los)
+    return E, ranges, los
+
+
+def _assert_close_ulp(actual, expected):
+    assert np.all(np.abs(actual - expected) <= MAX_ULP * np.spacing(np.abs(expected)))
+
+
+def _check_against_numpy(eccentric_loop, los_loop):
+    M, e, receiver, sat_pos = _inputs()
+    for max_iterations in (kernels.KEPLER_MAX_ITERATIONS, 10):
+        E, ranges, los = _run_loops(eccentric_loop, los_loop, M, e, receiver, sat_pos, max_iterations)
+        _assert_close_ulp(E, kernels._eccentric_anomaly_numpy(M, e, max_iterations))
+    ref_ranges, ref_los = kernels._line_of_sight_numpy(receiver, sat_pos)
+    _assert_close_ulp(ranges, ref_ranges)
+    _assert_close_ulp(los, ref_los)
+
+
+def test_loop_backend_matches_numpy():
+    # Thuật toán của backend Numba, chạy bằng Python thuần (không cần cài numba)
+    _check_against_numpy(kernels._eccentric_anomaly_loop, kernels._line_of_sight_loop)
+
+
+def test_numba_backend_matches_numpy():
+    numba = pytest.importorskip("numba")
+    eccentric_loop = getattr(kernels._eccentric_anomaly_loop, "py_func", kernels._eccentric_anomaly_loop)
+    los_loop = getattr(kernels._line_of_sight_loop, "py_func", kernels._line_of_sight_loop)
+    _check_against_numpy(numba.njit(eccentric_loop), numba.njit(los_loop))
+
+
+def test_eccentric_anomaly_solves_kepler():
+    M, e, _, _ = _inputs()
+    E = kernels.eccentric_anomaly(M, e)
+    assert np.max(np.abs(E - e * np.sin(E) - M)) < 1e-12
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from nav_merge import MergedNavigation, merge_navigation
+from network import solve_network
+from conftest import NAV_FILE, RECEIVER, write_synthetic_obs
+
+# Trạm thứ hai cách trạm đầu khoảng 1 km
+SECOND_RECEIVER = [RECEIVER[0] + 600.0, RECEIVER[1] - 300.0, RECEIVER[2] + 700.0]
+
+
+@pytest.fixture
+def obs_files(tmp_path):
+    paths = [str(tmp_path / "station-a.obs"), str(tmp_path / "station-b.obs")]
+    write_synthetic_obs(paths[0], 20)
+    write_synthetic_obs(paths[1], 20, receiver=SECOND_RECEIVER)
+    return paths
+
+
+def test_network_from_saved_store_matches_nav_file(tmp_path, obs_files):
+    store_path = str(tmp_path / "merged-nav.npz")
+    merge_navigation([NAV_FILE, NAV_FILE]).save(store_path)
+
+    from_file = solve_network(NAV_FILE, obs_files, [0.0, 0.0, 0.0])
+    from_store = solve_network(store_path, obs_files, [0.0, 0.0, 0.0])
+    from_object = solve_network(MergedNavigation.load(store_path), obs_files, [0.0, 0.0, 0.0])
+
+    for receiver, a, b, c in zip([RECEIVER, SECOND_RECEIVER], from_file, from_store, from_object):
+        assert a.shape == b.shape == (20, 4)
+        np.testing.assert_allclose(b, a, rtol=0, atol=1e-6)
+        np.testing.assert_array_equal(c, b)
+        # File OBS giả lập không mô phỏng quay Trái Đất trong thời gian bay (~30 m)
+        assert np.max(np.linalg.norm(b[:, :3] - receiver, axis=1)) < 50.0
+
+
+def test_network_missing_store_returns_none(tmp_path, obs_files):
+    assert solve_network(str(tmp_path / "missing.npz"), obs_files, [0.0, 0.0, 0.0]) is None